@@ -0,0 +1,350 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+from instrumentation import Histogram
+from coordinated_motion import AxisGroup, follower_profile
+from motion_planner import ProfileCache, np, plan_move
+from motor_engine import StepperEngine
+from motor_history import PositionHistory
+from motor_view import MotorDisplay, PositionPlot, RotorView
+from multi_axis import MultiAxisController
+
+
+# Частоты шагов для проверки потока двигателя
+STEP_RATES = (100, 1000, 5000, 10000, 20000)
+# Отсчетов в истории позиции (по 30 в секунду: от полуминуты до 9 часов)
+HISTORY_SAMPLES = (1000, 10000, 100000, 1000000)
+AXIS_COUNTS = (1, 10, 100, 1000)
+
+# Направление сравнения с базой: у всех метрик меньше - лучше
+LOWER = "lower"
+
+
+class CanvasRecorder:
+    # Заменитель холста tkinter: хранит координаты элементов и считает
+    # вызовы, поэтому отрисовку можно измерять без дисплея
+
+    def __init__(self):
+        self.items = {}
+        self.ops = 0
+        self._next_id = 1
+
+    def _create(self, coords, options):
+        item = self._next_id
+        self._next_id += 1
+        self.items[item] = (list(coords), options)
+        self.ops += 1
+        return item
+
+    def create_line(self, *coords, **options):
+        return self._create(coords, options)
+
+    create_oval = create_text = create_rectangle = create_image = create_line
+
+    def coords(self, item, *coords):
+        self.ops += 1
+        if len(coords) == 1:
+            coords = coords[0]
+        self.items[item] = (list(coords), self.items[item][1])
+
+    def itemconfig(self, item, **options):
+        self.ops += 1
+        self.items[item][1].update(options)
+
+    def delete(self, item):
+        self.ops += 1
+        self.items.pop(item, None)
+
+
+class WidgetRecorder:
+    # Заменитель метки или кнопки tkinter
+
+    def __init__(self):
+        self.options = {}
+        self.ops = 0
+
+    def config(self, **options):
+        self.ops += 1
+        self.options.update(options)
+
+
+def best_time(function, repeat, min_time=0.05):
+    # Время одного вызова: лучшее из repeat серий. Число вызовов в серии
+    # подбирается так, чтобы серия длилась не меньше min_time, как в timeit.
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 4 >= min_time else 10
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def metric(value, unit, better, slack=0.0):
+    # slack - абсолютный допуск для метрик, близких к нулю и зависящих от
+    # загрузки машины (точность частоты, опоздание шагов)
+    return {"value": value, "unit": unit, "better": better, "slack": slack}
+
+
+def bench_stepping(results, quick, repeat):
+    steps = 20000 if quick else 200000
+    duration = 0.25 if quick else 1.0
+    for rate in STEP_RATES:
+        # Пропускная способность цикла шагов в виртуальном времени
+        def run_simulation():
+            engine = StepperEngine(speed=rate)
+            engine.start()
+            engine.simulate(max_steps=steps)
+
+        elapsed = best_time(run_simulation, repeat)
+        results[f"step.simulate.{rate}hz.us_per_step"] = metric(elapsed / steps * 1e6, "us", LOWER)
+
+        # Точность потока реального времени: фактическая частота и опоздание шагов
+        engine = StepperEngine(speed=rate)
+        engine.lateness = Histogram()
+        engine.start_thread()
+        engine.submit("start")
+        time.sleep(0.05)
+        first = engine.snapshot
+        time.sleep(duration)
+        last = engine.snapshot
+        engine.shutdown()
+
+        # Частота по моментам шагов из снимков, без ошибки квантования окна
+        achieved = (last.step_counter - first.step_counter) / (last.time - first.time)
+        lateness = engine.lateness.snapshot()
+        results[f"step.realtime.{rate}hz.rate_error_pct"] = metric(
+            abs(achieved - rate) / rate * 100, "%", LOWER, slack=0.5)
+        results[f"step.realtime.{rate}hz.lateness_p99_ms"] = metric(
+            lateness["p99_ms"], "ms", LOWER, slack=0.5)
+        results[f"step.realtime.{rate}hz.skipped_steps"] = metric(
+            engine.skipped_steps, "steps", LOWER, slack=0)
+
+
+def bench_output(results, quick, repeat):
+    # Цена выхода шагов в кадры последовательного порта: эмулятор драйвера
+    # на псевдотерминале выполняет серии сразу, поток двигателя ждет места
+    # в буфере, поэтому измеряется весь путь до устройства
+    from step_output import PtyDevice, SerialBackend
+
+    steps = 20000 if quick else 200000
+    device = PtyDevice(realtime=False)
+    try:
+        for rate in (20000, 50000):
+            def run_simulation():
+                engine = StepperEngine(speed=rate)
+                engine.output = SerialBackend(device.path, blocking=True)
+                engine.start()
+                engine.simulate(max_steps=steps)
+                engine.output.close()
+
+            elapsed = best_time(run_simulation, repeat)
+            results[f"output.serial.{rate}hz.us_per_step"] = metric(elapsed / steps * 1e6, "us", LOWER)
+    finally:
+        device.close()
+
+
+def bench_planning(results, quick, repeat):
+    distance = 2000 if quick else 20000
+    for kind in ("trapezoid", "scurve"):
+        elapsed = best_time(lambda: plan_move(distance, 5000, 2000, kind=kind), repeat)
+        results[f"plan.{kind}.{distance}steps.ms"] = metric(elapsed * 1000, "ms", LOWER)
+
+        # Повторное перемещение: профиль из кэша
+        cache = ProfileCache()
+        cache.plan(distance, 5000, 2000, kind=kind)
+        elapsed = best_time(lambda: cache.plan(-distance, 5000, 2000, kind=kind), repeat)
+        results[f"plan.{kind}.{distance}steps.cached_us"] = metric(elapsed * 1e6, "us", LOWER)
+
+
+def bench_coordinated(results, quick, repeat):
+    distance = 2000 if quick else 20000
+    master = plan_move(distance, 5000, 2000)
+    # Таблица ведомой оси из таблицы ведущей (целочисленный DDA)
+    elapsed = best_time(lambda: follower_profile(master, distance * 3 // 7), repeat)
+    results[f"coord.follower.{distance}steps.ms"] = metric(elapsed * 1000, "ms", LOWER)
+
+    # Три оси по прямой и по полной окружности (винтовой линии) в
+    # виртуальном времени: цена одного шага любой оси вместе с планированием
+    def run_path(path):
+        controller = MultiAxisController(3, speed=20000)
+        path(AxisGroup(controller, range(3), acceleration=200000))
+        controller.simulate(duration=1000)
+        return controller.total_steps
+
+    for name, path in [("linear", lambda group: group.move_linear([distance, distance * 3 // 7,
+                                                                   distance // 5])),
+                       ("arc", lambda group: group.move_arc([0, 0, distance // 5],
+                                                            center=(distance // 2, 0)))]:
+        steps = run_path(path)
+        elapsed = best_time(lambda: run_path(path), repeat)
+        results[f"coord.{name}.us_per_step"] = metric(elapsed / steps * 1e6, "us", LOWER)
+
+
+def make_render_app(history_capacity):
+    # Отрисовка приложения без окна Tk и без импорта tkinter: виджеты
+    # заменены записывающими заглушками, а методы отрисовки - настоящие
+    app = MotorDisplay()
+    canvas = app.canvas = CanvasRecorder()
+    app.engine = StepperEngine(speed=1000, step_mode=0.125)
+    app.replayer = None
+    app.shown_status = None
+    app.position_history = PositionHistory(history_capacity)
+    app.position_history.clear(time.perf_counter(), 0)
+    app.plot_interval = 0.25
+    app.next_plot_time = 0.0
+    app.rotor_view = RotorView(canvas, 250, 250, 20, 80, "#4a9c82", quantum=0.125)
+    app.rotor_view.create()
+    app.angle_text = canvas.create_text(250, 430, text="")
+    app.position_label = WidgetRecorder()
+    app.status_label = WidgetRecorder()
+    app.start_btn = WidgetRecorder()
+    app.position_plot = PositionPlot(canvas, app.position_history, "#4a9c82", "#555555", "#ffffff")
+    app.position_plot.layout(500, 150)
+    return app
+
+
+def bench_rendering(results, quick, repeat):
+    frames = 300 if quick else 3000
+    app = make_render_app(4096)
+    base = app.engine.snapshot
+    # Снимки с меняющейся позицией, как при вращении на 7 шагов за кадр
+    snapshots = [base._replace(version=i + 1, position_micro=i * 56, running=True)
+                 for i in range(frames)]
+
+    def run_frames():
+        for snapshot in snapshots:
+            app.update_motor_visualization(snapshot)
+
+    ops = app.canvas.ops
+    run_frames()
+    results["render.update_motor_visualization.canvas_ops_per_frame"] = metric(
+        (app.canvas.ops - ops) / frames, "ops", LOWER)
+    elapsed = best_time(run_frames, repeat)
+    results["render.update_motor_visualization.us_per_frame"] = metric(elapsed / frames * 1e6, "us", LOWER)
+
+    elapsed = best_time(app.draw_position_plot, repeat)
+    results["render.draw_position_plot.us_per_frame"] = metric(elapsed * 1e6, "us", LOWER)
+
+
+def bench_scaling(results, quick, repeat):
+    frames = 100 if quick else 1000
+    for samples in HISTORY_SAMPLES:
+        if quick and samples > 100000:
+            continue
+        # Окно графика на всю историю: цена кадра не должна расти с ее длиной
+        history = PositionHistory()
+        for i in range(samples):
+            history.append(i / 30, (i * 7) % 5000)
+        plot = PositionPlot(CanvasRecorder(), history, "#4a9c82", "#555555", "#ffffff",
+                            span=samples / 30)
+        plot.layout(500, 150)
+        clock = [samples / 30]
+
+        def run_frames():
+            for i in range(frames):
+                clock[0] += 1 / 30
+                history.append(clock[0], i)
+                plot.draw(clock[0])
+
+        elapsed = best_time(run_frames, repeat)
+        results[f"scale.history.{samples}samples.us_per_frame"] = metric(elapsed / frames * 1e6, "us", LOWER)
+
+    duration = 0.2 if quick else 1.0
+    for count in AXIS_COUNTS:
+        # Каждая ось шагает с частотой 100 Гц; сравнивается цена одного шага
+        controller = MultiAxisController(count, speed=100)
+        controller.submit_all("start")
+        elapsed = best_time(lambda: controller.simulate(duration=duration), repeat)
+        steps = count * 100 * duration
+        results[f"scale.axes.{count}.us_per_step"] = metric(elapsed / steps * 1e6, "us", LOWER)
+
+
+def compare(results, baseline, tolerance):
+    # Список регрессий: метрика хуже базы больше чем на tolerance (доля)
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or current["value"] is None or previous["value"] is None:
+            continue
+        old, new = previous["value"], current["value"]
+        slack = current.get("slack", 0.0)
+        if new > old * (1 + tolerance) and new - old > slack:
+            regressions.append((name, old, new, current["unit"]))
+    return regressions
+
+
+SECTIONS = {
+    "stepping": bench_stepping,
+    "output": bench_output,
+    "planning": bench_planning,
+    "coordinated": bench_coordinated,
+    "rendering": bench_rendering,
+    "scaling": bench_scaling,
+}
+
+
+def run(sections=None, quick=False, repeat=5):
+    results = {}
+    for name in sections or SECTIONS:
+        SECTIONS[name](results, quick, repeat)
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": None if np is None else np.__version__,
+            "quick": quick,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности двигателя и отрисовки")
+    parser.add_argument("--section", action="append", choices=sorted(SECTIONS),
+                        help="раздел замеров (по умолчанию все)")
+    parser.add_argument("--quick", action="store_true", help="короткие прогоны")
+    parser.add_argument("--repeat", type=int, default=5, help="число повторов, берется лучший")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="JSON с базовыми результатами для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="допустимое ухудшение относительно базы (доля)")
+    args = parser.parse_args(argv)
+
+    report = run(args.section, args.quick, args.repeat)
+    for name, result in sorted(report["results"].items()):
+        value = result["value"]
+        shown = "-" if value is None else f"{value:.4g}"
+        print(f"{name:55} {shown:>12} {result['unit']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(report["results"], baseline, args.tolerance)
+        for name, old, new, unit in regressions:
+            print(f"Регрессия: {name}: {old:.4g} -> {new:.4g} {unit}")
+        if regressions:
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
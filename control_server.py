@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from motor_engine import StepperEngine
+from multi_axis import MultiAxisController
+
+
+# Команды ядра, доступные по сети (аргументы должны быть значениями JSON)
+REMOTE_COMMANDS = tuple(name for name in StepperEngine.COMMANDS if name != "queue_move")
+
+# Предельная длина строки запроса (байт); пакет из многих команд - одна строка
+LINE_LIMIT = 1 << 20
+
+
+def snapshot_to_dict(index, snapshot):
+    return {
+        "axis": index,
+        "version": snapshot.version,
+        "position": snapshot.position,
+        "target": snapshot.target,
+        "running": snapshot.running,
+        "moving": snapshot.moving,
+        "speed": snapshot.speed,
+        "direction": snapshot.direction,
+        "step_mode": snapshot.step_mode,
+        "step_counter": snapshot.step_counter,
+        "rate": snapshot.rate,
+    }
+
+
+def _jsonable(value):
+    # Результат команды в виде, пригодном для JSON (профиль - краткая сводка)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, "steps") and hasattr(value, "duration"):
+        return {"steps": value.steps, "duration": value.duration}
+    return repr(value)
+
+
+def _reply(request_id, command):
+    if command.error is not None:
+        return {"id": request_id, "ok": False, "error": str(command.error)}
+    return {"id": request_id, "ok": True, "result": _jsonable(command.result)}
+
+
+def _resolve(future, request_id, command):
+    if not future.done():
+        future.set_result(_reply(request_id, command))
+
+
+class ControlServer:
+    # Сервер управления по JSON lines на локальном TCP или Unix-сокете.
+    #
+    # Запрос - объект {"id": 1, "cmd": "move_to", "args": [400], "axis": 0}
+    # или массив таких объектов (пакет). Запросы можно отправлять, не дожидаясь
+    # ответов: ответы приходят в порядке запросов. Число команд в обработке на
+    # одно соединение ограничено max_inflight; когда предел достигнут, сервер
+    # перестает читать сокет и клиент упирается в буфер TCP.
+    #
+    # {"cmd": "subscribe", "rate": 20, "axes": [0]} включает поток обновлений
+    # состояния с частотой не выше max_rate. Если клиент не успевает читать,
+    # обновления пропускаются (приходит только последнее состояние), а не
+    # накапливаются в памяти.
+
+    def __init__(self, controller, host="127.0.0.1", port=0, path=None,
+                 max_rate=100.0, max_inflight=256, high_water=256 * 1024):
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_rate = max_rate
+        self.max_inflight = max_inflight
+        self.high_water = high_water
+
+        self.loop = None
+        self.server = None
+        self.clients = set()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = threading.Event()
+        self._stop = None
+        self._handlers = set()
+
+        # Статистика
+        self.commands = 0
+        self.updates_sent = 0
+        self.updates_skipped = 0
+
+        controller.command_listeners.append(self._on_command)
+
+    # Команды
+
+    def _on_command(self, index, command):
+        # Вызывается в потоке планировщика после применения команды
+        with self._lock:
+            entry = self._futures.pop(command, None)
+        if entry is not None:
+            future, request_id = entry
+            self.loop.call_soon_threadsafe(_resolve, future, request_id, command)
+
+    def _submit(self, request):
+        # Постановка одной команды; возвращает future с ответом
+        future = self.loop.create_future()
+        request_id = request.get("id") if isinstance(request, dict) else None
+        self.commands += 1
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Запрос должен быть объектом JSON")
+            name = request.get("cmd")
+            args = request.get("args", [])
+            if not isinstance(args, list):
+                raise ValueError("args должен быть массивом")
+
+            if name == "ping":
+                future.set_result({"id": request_id, "ok": True, "result": time.time()})
+            elif name == "status":
+                axes = request.get("axes")
+                if axes is not None and not (isinstance(axes, list) and all(map(self.valid_axis, axes))):
+                    raise ValueError("Недопустимый номер оси")
+                future.set_result({"id": request_id, "ok": True, "result": self.status(axes)})
+            elif name in REMOTE_COMMANDS:
+                axis = request.get("axis", 0)
+                if not self.valid_axis(axis):
+                    raise ValueError("Недопустимый номер оси")
+                command = self.controller.submit(axis, name, *args)
+                with self._lock:
+                    # Без потока планировщика команда уже применена внутри submit
+                    if command.applied_at is None:
+                        self._futures[command] = (future, request_id)
+                        return future
+                _resolve(future, request_id, command)
+            else:
+                raise ValueError(f"Неизвестная команда: {name}")
+        except Exception as error:
+            future.set_result({"id": request_id, "ok": False, "error": str(error)})
+        return future
+
+    def valid_axis(self, axis):
+        # Номер оси из запроса: целое число (не bool) в пределах контроллера
+        return (isinstance(axis, int) and not isinstance(axis, bool)
+                and 0 <= axis < len(self.controller))
+
+    def status(self, axes=None):
+        controller = self.controller
+        if axes is None:
+            axes = range(len(controller))
+        return [snapshot_to_dict(index, controller.axis(index).snapshot) for index in axes]
+
+    # Соединения
+
+    async def _handle(self, reader, writer):
+        client = _Client(self, writer)
+        self.clients.add(client)
+        self._handlers.add(asyncio.current_task())
+        sender = asyncio.ensure_future(client.send_replies())
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await client.replies.put(_ready({"id": None, "ok": False,
+                                                     "error": "Слишком длинная строка"}))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    await client.replies.put(_ready({"id": None, "ok": False,
+                                                     "error": "Некорректный JSON"}))
+                    continue
+                requests = message if isinstance(message, list) else [message]
+                for request in requests:
+                    # put ждет, пока в очереди ответов есть место: так
+                    # ограничивается число команд в обработке
+                    await client.replies.put(self._dispatch(client, request))
+        except ConnectionError:
+            pass
+        finally:
+            client.close()
+            # Оставшиеся ответы дописываются, если соединение еще живо
+            end = asyncio.ensure_future(client.replies.put(None))
+            await asyncio.wait((end, sender), return_when=asyncio.FIRST_COMPLETED)
+            if sender.done():
+                end.cancel()
+            try:
+                await sender
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            self.clients.discard(client)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def _dispatch(self, client, request):
+        if isinstance(request, dict):
+            name = request.get("cmd")
+            if name == "subscribe":
+                return _ready(client.subscribe(request))
+            if name == "unsubscribe":
+                client.unsubscribe()
+                return _ready({"id": request.get("id"), "ok": True})
+        return self._submit(request)
+
+    # Запуск и остановка
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.server = await asyncio.start_unix_server(self._handle, self.path, limit=LINE_LIMIT)
+        else:
+            self.server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                     limit=LINE_LIMIT)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        # Работа до вызова shutdown; затем закрываются все соединения
+        self._stop = asyncio.Event()
+        await self.start()
+        self._ready.set()
+        await self._stop.wait()
+        self.server.close()
+        for client in list(self.clients):
+            client.writer.close()
+        if self._handlers:
+            await asyncio.wait(list(self._handlers), timeout=1.0)
+        await self.server.wait_closed()
+
+    def start_thread(self):
+        # Сервер в отдельном потоке со своим циклом событий (например, рядом с GUI)
+        self._thread = threading.Thread(target=self._run_thread, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run_thread(self):
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            self._ready.set()
+
+    def shutdown(self):
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+        if self._on_command in self.controller.command_listeners:
+            self.controller.command_listeners.remove(self._on_command)
+
+    @property
+    def address(self):
+        return self.path if self.path is not None else (self.host, self.port)
+
+
+def _ready(value):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+    return future
+
+
+class _Client:
+    # Состояние одного соединения: очередь ответов и подписка на обновления
+
+    def __init__(self, server, writer):
+        self.server = server
+        self.writer = writer
+        self.replies = asyncio.Queue(server.max_inflight)
+        self.rate = None
+        self.axes = None
+        self._updates = None
+        self._subscribe_reply = None
+        self._closed = False
+
+    async def send_replies(self):
+        # Ответы отправляются строго в порядке запросов
+        writer = self.writer
+        while True:
+            future = await self.replies.get()
+            if future is None:
+                break
+            reply = await future
+            writer.write(json.dumps(reply, ensure_ascii=False).encode() + b"\n")
+            if reply is self._subscribe_reply and self._updates is None:
+                # Обновления начинаются после ответа на подписку
+                self._updates = asyncio.ensure_future(self.send_updates())
+            # drain приостанавливает отправку, пока клиент не разгрузит буфер
+            await writer.drain()
+
+    def subscribe(self, request):
+        server = self.server
+        rate = request.get("rate", 10)
+        axes = request.get("axes")
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            return {"id": request.get("id"), "ok": False, "error": "rate должен быть положительным"}
+        if axes is not None and not (isinstance(axes, list) and all(map(server.valid_axis, axes))):
+            return {"id": request.get("id"), "ok": False, "error": "Недопустимый номер оси"}
+        # Согласованная частота не выше предела сервера
+        self.rate = min(float(rate), server.max_rate)
+        self.axes = list(range(len(server.controller))) if axes is None else list(axes)
+        self._subscribe_reply = {"id": request.get("id"), "ok": True,
+                                 "result": {"rate": self.rate, "axes": self.axes}}
+        return self._subscribe_reply
+
+    def unsubscribe(self):
+        if self._updates is not None:
+            self._updates.cancel()
+            self._updates = None
+
+    async def send_updates(self):
+        server = self.server
+        controller = server.controller
+        transport = self.writer.transport
+        versions = {}
+        next_time = time.perf_counter()
+        while not self._closed:
+            # Только изменившиеся оси
+            changed = []
+            for index in self.axes:
+                snapshot = controller.axis(index).snapshot
+                if versions.get(index) != snapshot.version:
+                    changed.append((index, snapshot))
+            if changed:
+                if transport.is_closing():
+                    break
+                if transport.get_write_buffer_size() > server.high_water:
+                    # Медленный клиент: обновление пропускается, версии не
+                    # запоминаются, поэтому следующее отправит свежее состояние
+                    server.updates_skipped += 1
+                else:
+                    for index, snapshot in changed:
+                        versions[index] = snapshot.version
+                    message = {"update": [snapshot_to_dict(index, snapshot) for index, snapshot in changed],
+                               "time": time.time()}
+                    self.writer.write(json.dumps(message, ensure_ascii=False).encode() + b"\n")
+                    server.updates_sent += 1
+            next_time += 1.0 / self.rate
+            delay = next_time - time.perf_counter()
+            if delay < 0:
+                next_time = time.perf_counter()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def close(self):
+        # Прекращение обновлений; ответы на принятые запросы еще отправляются
+        self._closed = True
+        self.unsubscribe()
+
+
+def main(argv=None):
+    # Сервер без графического интерфейса
+    parser = argparse.ArgumentParser(description="Сервер управления шаговыми двигателями")
+    parser.add_argument("--axes", type=int, default=1, help="число осей (двигателей)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="путь Unix-сокета вместо TCP")
+    parser.add_argument("--max-rate", type=float, default=100.0, help="предельная частота обновлений, Гц")
+    args = parser.parse_args(argv)
+
+    controller = MultiAxisController(args.axes)
+    controller.start_thread()
+    server = ControlServer(controller, host=args.host, port=args.port, path=args.unix,
+                           max_rate=args.max_rate).start_thread()
+    print(f"Сервер управления: {server.address}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        controller.shutdown()
+
+
+if __name__ == "__main__":
+    main()
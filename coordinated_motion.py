@@ -0,0 +1,236 @@
+import math
+from array import array
+
+from motion_planner import MotionProfile, _diff, np
+from motor_engine import MICROSTEPS, to_steps
+
+
+def follower_profile(master, steps):
+    # Профиль ведомой оси: |steps| шагов за master.steps шагов ведущей.
+    # Целочисленный DDA (Брезенхэм с округлением к середине): j-й шаг ведомой
+    # оси совпадает с шагом ведущей номер ceil(N * (2j - 1) / (2D)), поэтому
+    # момент каждого шага берется из таблицы ведущей оси без вычислений с
+    # плавающей точкой. Длительность - вся длительность отрезка ведущей оси.
+    count = abs(steps)
+    total = master.steps
+    if count > total:
+        raise ValueError("Ведомая ось не может сделать больше шагов, чем ведущая")
+    direction = 1 if steps >= 0 else -1
+    if count == total:
+        return master.with_direction(direction)
+
+    master_times = master.times
+    if count == 0:
+        times = master_times[:0]
+    elif np is not None:
+        # Пакетный путь: номера шагов ведущей оси для всех шагов сразу
+        j = np.arange(1, count + 1, dtype=np.int64)
+        times = np.asarray(master_times)[(total * (2 * j - 1) + 2 * count - 1) // (2 * count) - 1]
+    else:
+        denominator = 2 * count
+        times = array("d", [master_times[(total * (2 * j - 1) + denominator - 1) // denominator - 1]
+                            for j in range(1, count + 1)])
+    ratio = count / total
+    return MotionProfile(direction, times, _diff(times), master.kind, master.peak_speed * ratio,
+                         master.start_speed * ratio, master.end_speed * ratio, master.duration)
+
+
+def plan_path_speeds(lengths, caps, acceleration):
+    # Скорости на границах хорд пути (единиц позиции в секунду): остановка в
+    # начале и в конце, на стыке - не выше предела соседних хорд. Обратный
+    # проход ограничивает торможение, прямой - разгон.
+    count = len(lengths)
+    speeds = [0.0] * (count + 1)
+    for index in range(1, count):
+        speeds[index] = min(caps[index - 1], caps[index])
+    for index in range(count - 1, -1, -1):
+        speeds[index] = min(speeds[index],
+                            math.sqrt(speeds[index + 1] ** 2 + 2 * acceleration * lengths[index]))
+    for index in range(count):
+        speeds[index + 1] = min(speeds[index + 1],
+                                math.sqrt(speeds[index] ** 2 + 2 * acceleration * lengths[index]))
+    return speeds
+
+
+class AxisGroup:
+    # Согласованное движение нескольких осей контроллера: оси приходят в
+    # цель одновременно. Путь разбивается на хорды (отрезок - одна хорда,
+    # дуга - хорды с отклонением не больше tolerance). На каждой хорде
+    # ведущей становится ось с наибольшим числом шагов; ее таблица времени
+    # планируется как обычное перемещение, а таблицы остальных осей
+    # выбираются из нее целочисленным DDA (follower_profile). Все отрезки
+    # передаются контроллеру одной командой submit_group, поэтому оси
+    # начинают одновременно и дальше шагают по общим моментам времени.
+    #
+    # Координаты - в единицах позиции осей (шагах, как snapshot.position),
+    # скорость подачи feed - единиц в секунду вдоль пути, ускорение - единиц
+    # в секунду за секунду. По умолчанию они не выше пределов самой
+    # медленной оси; кроме того, на каждой хорде скорость ограничивается
+    # так, чтобы ни одна ось не превысила свою скорость.
+
+    def __init__(self, controller, indices, feed=None, acceleration=None, tolerance=0.25):
+        indices = tuple(indices)
+        if not indices:
+            raise ValueError("В группе должна быть хотя бы одна ось")
+        if len(set(indices)) != len(indices):
+            raise ValueError("Оси группы не должны повторяться")
+        if tolerance <= 0:
+            raise ValueError("Допуск хорды должен быть положительным")
+        self.controller = controller
+        self.indices = indices
+        self.tolerance = tolerance
+
+        axes = [controller.axis(index) for index in indices]
+        snapshots = [axis.snapshot for axis in axes]
+        self.pulses = [int(snapshot.step_mode * MICROSTEPS) for snapshot in snapshots]
+        # Предельные скорости осей в единицах позиции в секунду
+        self.limits = [snapshot.speed * snapshot.step_mode for snapshot in snapshots]
+        self.feed = feed or min(self.limits)
+        self.acceleration = acceleration or min(axis.acceleration * snapshot.step_mode
+                                                for axis, snapshot in zip(axes, snapshots))
+        if self.feed <= 0 or self.acceleration <= 0:
+            raise ValueError("Скорость и ускорение должны быть положительными")
+        # Позиции осей после переданных отрезков (микрошагов); отсчет - от
+        # целей осей, как у исполнителя заданий
+        self._positions = [snapshot.target_micro for snapshot in snapshots]
+        self.last_command = None
+        self.segments_planned = 0
+
+    @property
+    def position(self):
+        return [to_steps(micro) for micro in self._positions]
+
+    @property
+    def done(self):
+        # Все переданные отрезки выполнены
+        command = self.last_command
+        if command is not None and command.applied_at is None:
+            return False
+        return not any(self.controller.axis(index).snapshot.moving for index in self.indices)
+
+    def _target(self, target):
+        # Цель по всем осям группы; None - ось остается на месте
+        if len(target) != len(self.indices):
+            raise ValueError(f"Нужно {len(self.indices)} координат, получено {len(target)}")
+        return [to_steps(micro) if value is None else value
+                for value, micro in zip(target, self._positions)]
+
+    def move_linear(self, target, feed=None):
+        # Прямолинейное перемещение всех осей группы в target
+        return self._submit([self._target(target)], feed)
+
+    def move_arc(self, target, center, clockwise=False, plane=(0, 1), feed=None, turns=0):
+        # Дуга в плоскости двух осей группы (plane - их номера в группе) с
+        # центром center; остальные оси движутся линейно (винтовая линия).
+        # Если конечная точка совпадает с начальной, описывается полная
+        # окружность; turns добавляет полные обороты.
+        first, second = plane
+        if first == second:
+            raise ValueError("Оси плоскости дуги должны различаться")
+        end = self._target(target)
+        start = self.position
+        center_x, center_y = center
+        start_x, start_y = start[first] - center_x, start[second] - center_y
+        end_x, end_y = end[first] - center_x, end[second] - center_y
+        radius = math.hypot(start_x, start_y)
+        end_radius = math.hypot(end_x, end_y)
+        if radius == 0:
+            raise ValueError("Начальная точка совпадает с центром дуги")
+        if abs(end_radius - radius) > max(1.0, radius * 1e-3):
+            raise ValueError(f"Конечная точка не лежит на окружности: радиус {radius:.3f} "
+                             f"в начале и {end_radius:.3f} в конце")
+
+        start_angle = math.atan2(start_y, start_x)
+        sweep = math.atan2(end_y, end_x) - start_angle
+        if clockwise:
+            if sweep >= 0:
+                sweep -= 2 * math.pi
+            sweep -= 2 * math.pi * turns
+        else:
+            if sweep <= 0:
+                sweep += 2 * math.pi
+            sweep += 2 * math.pi * turns
+
+        # Число хорд: отклонение хорды от дуги (стрелка) не больше tolerance
+        if self.tolerance < radius:
+            chord_angle = 2 * math.acos(1 - self.tolerance / radius)
+        else:
+            chord_angle = math.pi / 2
+        count = max(1, math.ceil(abs(sweep) / chord_angle))
+
+        points = []
+        for k in range(1, count):
+            fraction = k / count
+            angle = start_angle + sweep * fraction
+            distance = radius + (end_radius - radius) * fraction
+            point = [a + (b - a) * fraction for a, b in zip(start, end)]
+            point[first] = center_x + distance * math.cos(angle)
+            point[second] = center_y + distance * math.sin(angle)
+            points.append(point)
+        points.append(end)
+        return self._submit(points, feed)
+
+    def _check_last(self):
+        # Ошибка предыдущей команды: позиции группы берутся заново из осей
+        command = self.last_command
+        if command is not None and command.error is not None:
+            self.last_command = None
+            self._positions = [self.controller.axis(index).snapshot.target_micro
+                               for index in self.indices]
+            raise command.error
+
+    def _submit(self, points, feed):
+        self._check_last()
+        feed = self.feed if feed is None else feed
+        if feed <= 0:
+            raise ValueError("Скорость подачи должна быть положительной")
+        chords = self._chords(points, feed)
+        if not chords:
+            return None
+
+        lengths = [length for _, length, _ in chords]
+        caps = [cap for _, _, cap in chords]
+        speeds = plan_path_speeds(lengths, caps, self.acceleration)
+        cache = self.controller.profile_cache
+        positions = list(self._positions)
+        segments = []
+        for index, (steps, length, cap) in enumerate(chords):
+            # Ведущая ось хорды; ее скорости и ускорение - проекции пути
+            total = max(abs(count) for count in steps)
+            scale = total / length
+            master = cache.plan(total, cap * scale, self.acceleration * scale,
+                                start_speed=speeds[index] * scale, end_speed=speeds[index + 1] * scale)
+            segment = []
+            for column, count in enumerate(steps):
+                positions[column] += count * self.pulses[column]
+                segment.append((follower_profile(master, count), positions[column] / MICROSTEPS))
+            segments.append(segment)
+
+        command = self.controller.submit_group(self.indices, segments)
+        if command.error is not None:
+            raise command.error
+        self.last_command = command
+        self._positions = positions
+        self.segments_planned += len(segments)
+        return command
+
+    def _chords(self, points, feed):
+        # Хорды пути: шаги каждой оси (в шагах ее режима), длина в единицах
+        # позиции и предел скорости. Концы хорд округляются до сетки шагов
+        # каждой оси от начала пути, поэтому ошибка округления не копится.
+        origin = self._positions
+        pulses = self.pulses
+        previous = [0] * len(origin)
+        chords = []
+        for point in points:
+            current = [round((round(value * MICROSTEPS) - start) / pulse)
+                       for value, start, pulse in zip(point, origin, pulses)]
+            steps = [b - a for a, b in zip(previous, current)]
+            if any(steps):
+                deltas = [count * pulse / MICROSTEPS for count, pulse in zip(steps, pulses)]
+                length = math.sqrt(sum(delta * delta for delta in deltas))
+                cap = min([feed] + [limit * length / abs(delta)
+                                    for limit, delta in zip(self.limits, deltas) if delta])
+                chords.append((steps, length, cap))
+                previous = current
+        return chords
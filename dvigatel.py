@@ -1,25 +1,86 @@
+import time
+
+# Начало загрузки модуля: от него отсчитывается время холодного старта
+STARTED_AT = time.perf_counter()
+
+import argparse
+import json
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import math
-import threading
-import time
-from queue import Queue
 
-class StepperMotorApp:
-    def __init__(self, root):
+from instrumentation import Instrumentation
+from motor_history import PositionHistory
+from motor_view import MotorDisplay, PositionPlot, RotorView
+from multi_axis import MultiAxisController
+
+class StepperMotorApp(MotorDisplay):
+    # Название режима шага по коэффициенту
+    STEP_MODE_NAMES = {1: "Полный шаг", 0.5: "Полушаг", 0.25: "Четверть шага", 0.125: "Восьмая шага"}
+
+    def __init__(self, root, render_fps=30, history_capacity=4096, axis_count=1, started_at=None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
         self.root = root
         self.root.title("Управление шаговым двигателем")
         self.root.geometry("1000x700")
         self.root.resizable(True, True)
         
-        # Переменные управления
-        self.motor_running = False
-        self.current_position = 0
-        self.target_position = 0
-        self.motor_speed = 10  # шагов в секунду
-        self.motor_direction = 1  # 1 - вперед, -1 - назад
-        self.step_mode = 1  # Режим шага (1, 1/2, 1/4, 1/8)
-        self.motor_queue = Queue()
+        # Оси двигателей обслуживаются одним потоком планировщика;
+        # элементы управления относятся к выбранной оси
+        self.controller = MultiAxisController(axis_count, speed=10, direction=1, step_mode=1)
+        self.controller.command_listeners.append(self.on_engine_command)
+        self.selected_axis = 0
+        self.engine = self.controller.axis(0)
+        self.shown_status = "stopped"
+        # Значения ползунков, выставленные программно (см. sync_scale)
+        self.synced_scales = {}
+        
+        # Окно с сеткой роторов всех осей
+        self.grid_window = None
+        self.grid_views = []
+        
+        # Растеризация кадров ротора частями в простое (after_idle)
+        self.sprite_job = None
+        
+        # Такт отрисовки: кадр рисуется с фиксированной частотой,
+        # сколько бы шагов ни произошло между кадрами
+        self.render_fps = render_fps
+        self.rendered_snapshot = None
+        self.next_frame_time = None
+        
+        # История позиций для графика: пирамида min/max на часы движения;
+        # без изменений позиции график перерисовывается не чаще plot_interval
+        self.position_history = PositionHistory(history_capacity)
+        self.position_history.clear(time.perf_counter(), 0)
+        self.plot_interval = 0.25
+        self.next_plot_time = 0.0
+        
+        # Запись журнала шагов и воспроизведение записанного журнала
+        self.recorder = None
+        self.replayer = None
+        
+        # Потоковое задание из файла и последний показанный текст его состояния
+        self.job = None
+        self.shown_job_text = None
+        
+        # Физическая модель ротора выбранной оси (включается флажком)
+        self.physics = None
+        self.shown_physics_text = None
+        
+        # Измерения (включаются флажком; панель обновляется дважды в секунду)
+        self.instruments = Instrumentation(self.controller.command_latency)
+        self.overlay_interval = 0.5
+        self.next_overlay_time = None
+        self.overlay_steps = 0
+        
+        # Время холодного старта (мс от started_at): первый кадр и готовность
+        # всех панелей; слушатели вызываются, когда панели построены
+        self.startup = None
+        self.startup_listeners = []
+        
+        # Второстепенные панели строятся после первого кадра
+        self.position_plot = None
+        self.metrics_frame = None
         
         # Цветовая схема
         self.bg_color = "#2b2b2b"
@@ -32,15 +93,13 @@ class StepperMotorApp:
         
         self.root.configure(bg=self.bg_color)
         
-        # Создание интерфейса
+        # Создание интерфейса: сначала только то, что видно в первом кадре
         self.create_widgets()
+        self.canvas.bind("<Expose>", self.on_first_expose)
         
-        # Запуск потока для анимации двигателя
-        self.animation_thread = threading.Thread(target=self.motor_animation_loop, daemon=True)
-        self.animation_thread.start()
-        
-        # Запуск обработки команд двигателя
-        self.process_motor_commands()
+        # Запуск такта отрисовки; поток планировщика запускается после
+        # первого кадра, до этого команды применяются сразу в submit
+        self.render_tick()
 
     def create_widgets(self):
         # Основной контейнер
@@ -48,7 +107,7 @@ class StepperMotorApp:
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # Левая панель управления
-        control_frame = tk.Frame(main_frame, bg=self.frame_bg, relief=tk.RAISED, bd=2)
+        control_frame = self.control_frame = tk.Frame(main_frame, bg=self.frame_bg, relief=tk.RAISED, bd=2)
         control_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
         
         # Заголовок управления
@@ -56,6 +115,21 @@ class StepperMotorApp:
                                  font=("Arial", 16, "bold"), bg=self.frame_bg, fg=self.text_color)
         control_label.pack(pady=10)
         
+        # Выбор оси (при нескольких двигателях)
+        if len(self.controller) > 1:
+            axis_frame = tk.LabelFrame(control_frame, text="Ось", 
+                                       font=("Arial", 12), bg=self.frame_bg, fg=self.text_color)
+            axis_frame.pack(fill=tk.X, padx=10, pady=5)
+            
+            self.axis_spinbox = tk.Spinbox(axis_frame, from_=1, to=len(self.controller), width=6,
+                                           font=("Arial", 11), command=self.on_axis_spin)
+            self.axis_spinbox.pack(side=tk.LEFT, padx=10, pady=5)
+            
+            grid_btn = tk.Button(axis_frame, text="Все оси", font=("Arial", 10),
+                                 bg=self.btn_color, fg=self.text_color, activebackground=self.btn_active,
+                                 command=self.open_axes_grid)
+            grid_btn.pack(side=tk.LEFT, padx=10, pady=5)
+        
         # Управление направлением
         direction_frame = tk.LabelFrame(control_frame, text="Направление вращения", 
                                         font=("Arial", 12), bg=self.frame_bg, fg=self.text_color)
@@ -82,11 +156,11 @@ class StepperMotorApp:
                                font=("Arial", 10), bg=self.frame_bg, fg=self.text_color)
         speed_label.pack(anchor=tk.W, padx=10, pady=5)
         
-        self.speed_scale = tk.Scale(speed_frame, from_=1, to=100, orient=tk.HORIZONTAL, 
+        self.speed_scale = tk.Scale(speed_frame, from_=1, to=5000, orient=tk.HORIZONTAL, 
                                     length=200, bg=self.frame_bg, fg=self.text_color,
                                     troughcolor=self.btn_color, highlightbackground=self.frame_bg,
                                     command=self.update_speed)
-        self.speed_scale.set(self.motor_speed)
+        self.sync_scale(self.speed_scale, self.engine.snapshot.speed)
         self.speed_scale.pack(padx=10, pady=5)
         
         # Режим шага
@@ -121,11 +195,47 @@ class StepperMotorApp:
         self.position_entry.pack(fill=tk.X, padx=10, pady=5)
         self.position_entry.insert(0, "0")
         
+        # Профиль перемещения
+        self.profile_var = tk.StringVar(value="trapezoid")
+        
+        profile_row = tk.Frame(position_frame, bg=self.frame_bg)
+        profile_row.pack(fill=tk.X, padx=10)
+        
+        for text, kind in [("Трапеция", "trapezoid"), ("S-кривая", "scurve")]:
+            profile_btn = tk.Radiobutton(profile_row, text=text, variable=self.profile_var,
+                                         value=kind, font=("Arial", 10), bg=self.frame_bg, fg=self.text_color,
+                                         selectcolor=self.btn_color, command=self.update_profile_kind)
+            profile_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.accel_label = tk.Label(position_frame, text=f"Ускорение: {self.engine.acceleration:g} шаг/с²",
+                                    font=("Arial", 10), bg=self.frame_bg, fg=self.text_color)
+        self.accel_label.pack(anchor=tk.W, padx=10, pady=(5, 0))
+        
+        self.accel_scale = tk.Scale(position_frame, from_=10, to=5000, resolution=10, orient=tk.HORIZONTAL, 
+                                    length=200, bg=self.frame_bg, fg=self.text_color,
+                                    troughcolor=self.btn_color, highlightbackground=self.frame_bg,
+                                    command=self.update_acceleration)
+        self.sync_scale(self.accel_scale, self.engine.acceleration)
+        self.accel_scale.pack(padx=10)
+        
         move_btn = tk.Button(position_frame, text="Переместить в позицию", font=("Arial", 11),
                              bg=self.btn_color, fg=self.text_color, activebackground=self.btn_active,
                              command=self.move_to_position)
         move_btn.pack(pady=10)
         
+        job_row = tk.Frame(position_frame, bg=self.frame_bg)
+        job_row.pack(pady=(0, 10))
+        
+        job_btn = tk.Button(job_row, text="Задание из файла", font=("Arial", 10),
+                            bg=self.btn_color, fg=self.text_color, activebackground=self.btn_active,
+                            command=self.start_job)
+        job_btn.pack(side=tk.LEFT, padx=5)
+        
+        cancel_job_btn = tk.Button(job_row, text="Отменить", font=("Arial", 10),
+                                   bg=self.btn_color, fg=self.text_color, activebackground=self.btn_active,
+                                   command=self.cancel_job)
+        cancel_job_btn.pack(side=tk.LEFT, padx=5)
+        
         # Кнопки управления
         button_frame = tk.Frame(control_frame, bg=self.frame_bg)
         button_frame.pack(fill=tk.X, padx=10, pady=20)
@@ -146,8 +256,8 @@ class StepperMotorApp:
         reset_btn.pack(side=tk.LEFT, padx=5)
         
         # Информационная панель
-        info_frame = tk.LabelFrame(control_frame, text="Информация о двигателе", 
-                                   font=("Arial", 12), bg=self.frame_bg, fg=self.text_color)
+        info_frame = self.info_frame = tk.LabelFrame(control_frame, text="Информация о двигателе", 
+                                                     font=("Arial", 12), bg=self.frame_bg, fg=self.text_color)
         info_frame.pack(fill=tk.X, padx=10, pady=10)
         
         self.position_label = tk.Label(info_frame, text="Текущая позиция: 0 шагов", 
@@ -166,8 +276,33 @@ class StepperMotorApp:
                                      font=("Arial", 10), bg=self.frame_bg, fg="#c74e4e")
         self.status_label.pack(anchor=tk.W, padx=10, pady=5)
         
+        self.job_label = tk.Label(info_frame, text="Задание: нет", 
+                                  font=("Arial", 10), bg=self.frame_bg, fg=self.text_color)
+        self.job_label.pack(anchor=tk.W, padx=10, pady=5)
+        
+        self.sprite_var = tk.BooleanVar(value=False)
+        sprite_check = tk.Checkbutton(info_frame, text="Ротор из готовых кадров", variable=self.sprite_var,
+                                      font=("Arial", 10), bg=self.frame_bg, fg=self.text_color,
+                                      selectcolor=self.btn_color, command=self.update_sprite_mode)
+        sprite_check.pack(anchor=tk.W, padx=10, pady=5)
+        
+        self.instruments_var = tk.BooleanVar(value=False)
+        instruments_check = tk.Checkbutton(info_frame, text="Измерения", variable=self.instruments_var,
+                                           font=("Arial", 10), bg=self.frame_bg, fg=self.text_color,
+                                           selectcolor=self.btn_color, command=self.toggle_instrumentation)
+        instruments_check.pack(anchor=tk.W, padx=10, pady=5)
+        
+        self.physics_var = tk.BooleanVar(value=False)
+        self.physics_check = tk.Checkbutton(info_frame, text="Физическая модель", variable=self.physics_var,
+                                            font=("Arial", 10), bg=self.frame_bg, fg=self.text_color,
+                                            selectcolor=self.btn_color, command=self.toggle_physics)
+        self.physics_check.pack(anchor=tk.W, padx=10, pady=5)
+        
+        self.physics_label = tk.Label(info_frame, text="", font=("Arial", 10),
+                                      bg=self.frame_bg, fg=self.text_color)
+        
         # Правая панель с анимацией
-        animation_frame = tk.Frame(main_frame, bg=self.bg_color)
+        animation_frame = self.animation_frame = tk.Frame(main_frame, bg=self.bg_color)
         animation_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         
         # Заголовок анимации
@@ -182,9 +317,50 @@ class StepperMotorApp:
         
         # Создание элементов анимации
         self.create_motor_animation()
+
+    def on_first_expose(self, event):
+        # Холст показан; кадр дорисуется в idle-обработчиках tk, после них
+        # время запуска считается до первого кадра
+        self.canvas.unbind("<Expose>")
+        self.root.after_idle(self.on_first_frame)
+
+    def on_first_frame(self):
+        first_frame = time.perf_counter()
+        self.controller.start_thread()
+        self.create_secondary_panels()
+        self.root.update_idletasks()
+        self.startup = {
+            "first_frame_ms": (first_frame - self.started_at) * 1000,
+            "panels_ms": (time.perf_counter() - self.started_at) * 1000,
+        }
+        self.instruments.startup = self.startup
+        for listener in self.startup_listeners:
+            listener(self.startup)
+
+    def create_secondary_panels(self):
+        # Журнал шагов
+        log_frame = tk.LabelFrame(self.control_frame, text="Журнал", 
+                                  font=("Arial", 12), bg=self.frame_bg, fg=self.text_color)
+        log_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.record_btn = tk.Button(log_frame, text="Записать", font=("Arial", 10),
+                                    bg=self.btn_color, fg=self.text_color, activebackground=self.btn_active,
+                                    command=self.toggle_recording)
+        self.record_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        self.replay_btn = tk.Button(log_frame, text="Воспроизвести", font=("Arial", 10),
+                                    bg=self.btn_color, fg=self.text_color, activebackground=self.btn_active,
+                                    command=self.toggle_replay)
+        self.replay_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        self.replay_speed_var = tk.StringVar(value="1x")
+        replay_speed_menu = tk.OptionMenu(log_frame, self.replay_speed_var, "1x", "10x", "100x")
+        replay_speed_menu.config(font=("Arial", 10), bg=self.btn_color, fg=self.text_color,
+                                 activebackground=self.btn_active, highlightthickness=0)
+        replay_speed_menu.pack(side=tk.LEFT, padx=5, pady=5)
         
         # График позиции
-        plot_frame = tk.LabelFrame(animation_frame, text="График позиции", 
+        plot_frame = tk.LabelFrame(self.animation_frame, text="График позиции", 
                                    font=("Arial", 12), bg=self.bg_color, fg=self.text_color)
         plot_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
@@ -192,10 +368,40 @@ class StepperMotorApp:
                                      highlightthickness=0, relief=tk.FLAT)
         self.plot_canvas.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # Данные для графика
-        self.position_history = [0] * 50
+        # График перестраивается целиком только при изменении размера холста
+        self.position_plot = PositionPlot(self.plot_canvas, self.position_history,
+                                          self.motor_color, self.axis_color, self.text_color)
+        self.plot_canvas.bind("<Configure>", self.position_plot.on_configure)
+        self.position_plot.bind(self.plot_canvas)
         self.draw_position_plot()
 
+    def create_metrics_panel(self):
+        # Панель измерений (показывается рядом с информацией о двигателе)
+        self.metrics_frame = tk.LabelFrame(self.control_frame, text="Измерения (p50 / p99 / макс, мс)", 
+                                           font=("Arial", 12), bg=self.frame_bg, fg=self.text_color)
+        
+        self.metric_labels = {}
+        for name, title in [("step_lateness", "Опоздание шага"),
+                            ("frame_time", "Время кадра"),
+                            ("after_lag", "Опоздание такта"),
+                            ("command_latency", "Задержка команд"),
+                            ("step_rate", "Шагов в секунду"),
+                            ("profile_cache", "Кэш профилей"),
+                            ("startup", "Запуск")]:
+            label = tk.Label(self.metrics_frame, text=f"{title}: -", font=("Arial", 9),
+                             bg=self.frame_bg, fg=self.text_color)
+            label.pack(anchor=tk.W, padx=10, pady=1)
+            self.metric_labels[name] = (label, title)
+        
+        metrics_buttons = tk.Frame(self.metrics_frame, bg=self.frame_bg)
+        metrics_buttons.pack(fill=tk.X, padx=5, pady=5)
+        
+        for text, command in [("Сбросить", self.instruments.reset), ("Экспорт", self.export_metrics)]:
+            metrics_btn = tk.Button(metrics_buttons, text=text, font=("Arial", 9),
+                                    bg=self.btn_color, fg=self.text_color, activebackground=self.btn_active,
+                                    command=command)
+            metrics_btn.pack(side=tk.LEFT, padx=5)
+
     def create_motor_animation(self):
         # Очистка холста
         self.canvas.delete("all")
@@ -268,24 +474,12 @@ class StepperMotorApp:
             )
         
         # Создание ротора (подвижная часть)
-        self.rotor_lines = []
-        rotor_line_count = 8
-        rotor_angle_offset = 0
-        
-        for i in range(rotor_line_count):
-            angle = rotor_angle_offset + i * (2 * math.pi / rotor_line_count)
-            x1 = self.center_x + math.cos(angle) * 20
-            y1 = self.center_y + math.sin(angle) * 20
-            x2 = self.center_x + math.cos(angle) * (self.radius - 40)
-            y2 = self.center_y + math.sin(angle) * (self.radius - 40)
-            
-            line = self.canvas.create_line(
-                x1, y1, x2, y2,
-                fill=self.motor_color,
-                width=6,
-                capstyle=tk.ROUND
-            )
-            self.rotor_lines.append(line)
+        self.rotor_view = RotorView(self.canvas, self.center_x, self.center_y, 20, self.radius - 40,
+                                    self.motor_color, line_count=8, line_width=6,
+                                    quantum=self.engine.snapshot.step_mode,
+                                    image_factory=lambda width, height: tk.PhotoImage(width=width, height=height))
+        self.rotor_view.create()
+        self.rotor_lines = self.rotor_view.lines
         
         # Текстовая информация на анимации
         self.canvas.create_text(
@@ -320,197 +514,503 @@ class StepperMotorApp:
             font=("Arial", 8)
         )
 
-    def draw_position_plot(self):
-        # Очистка холста графика
-        self.plot_canvas.delete("all")
-        
-        width = self.plot_canvas.winfo_width()
-        height = self.plot_canvas.winfo_height()
-        
-        if width <= 1 or height <= 1:
+    def submit(self, name, *args):
+        # Команда для выбранной оси
+        return self.controller.submit(self.selected_axis, name, *args)
+
+    def on_axis_spin(self):
+        self.select_axis(int(self.axis_spinbox.get()) - 1)
+
+    def select_axis(self, index):
+        # Переключение элементов управления на другую ось
+        self.selected_axis = index
+        engine = self.engine = self.controller.axis(index)
+        snapshot = engine.snapshot
+        
+        self.direction_var.set("Вперед" if snapshot.direction == 1 else "Назад")
+        # Ползунки только показывают значения оси (за пределами шкалы - у
+        # края), подписи - точные значения; команды оси не отправляются
+        self.sync_scale(self.speed_scale, snapshot.speed)
+        self.speed_label.config(text=f"Текущая скорость: {snapshot.speed} шаг/сек")
+        mode = self.STEP_MODE_NAMES[snapshot.step_mode]
+        self.step_var.set(mode)
+        self.mode_label.config(text=f"Режим шага: {mode}")
+        self.rotor_view.set_quantum(snapshot.step_mode)
+        self.profile_var.set(engine.profile_kind)
+        self.sync_scale(self.accel_scale, engine.acceleration)
+        self.accel_label.config(text=f"Ускорение: {engine.acceleration:g} шаг/с²")
+        
+        # История и индикаторы относятся к выбранной оси
+        self.position_history.clear(time.perf_counter(), snapshot.position)
+        self.rendered_snapshot = None
+        self.shown_status = None
+        if self.grid_views:
+            self.highlight_grid_axis()
+        if self.physics is not None:
+            self.attach_physics()
+
+    def open_axes_grid(self):
+        # Сетка маленьких роторов всех осей, обновляется тем же тактом отрисовки
+        if self.grid_window is not None:
             return
         
-        # Рисование осей
-        self.plot_canvas.create_line(30, height-30, width-30, height-30, fill=self.axis_color, width=2)  # X-axis
-        self.plot_canvas.create_line(30, 30, 30, height-30, fill=self.axis_color, width=2)  # Y-axis
-        
-        # Подписи осей
-        self.plot_canvas.create_text(15, height//2, text="Позиция", fill=self.text_color, font=("Arial", 10), angle=90)
-        self.plot_canvas.create_text(width//2, height-15, text="Время (шаги)", fill=self.text_color, font=("Arial", 10))
-        
-        # Масштабирование данных для графика
-        max_val = max(self.position_history) if max(self.position_history) > 0 else 1
-        min_val = min(self.position_history)
-        range_val = max_val - min_val if max_val != min_val else 1
-        
-        plot_height = height - 60
-        plot_width = width - 60
-        
-        # Рисование графика
-        points = []
-        for i, value in enumerate(self.position_history):
-            x = 30 + (i / (len(self.position_history) - 1)) * plot_width if len(self.position_history) > 1 else 30
-            y = height - 30 - ((value - min_val) / range_val) * plot_height
-            points.append((x, y))
-        
-        # Соединение точек
-        if len(points) > 1:
-            for i in range(len(points) - 1):
-                self.plot_canvas.create_line(points[i][0], points[i][1], 
-                                            points[i+1][0], points[i+1][1], 
-                                            fill=self.motor_color, width=2)
-        
-        # Рисование точек
-        for x, y in points:
-            self.plot_canvas.create_oval(x-3, y-3, x+3, y+3, fill=self.motor_color, outline=self.motor_color)
-        
-        # Текущее значение
-        if self.position_history:
-            current_value = self.position_history[-1]
-            self.plot_canvas.create_text(width-50, 20, 
-                                         text=f"Текущ.: {current_value}", 
-                                         fill=self.text_color, font=("Arial", 10))
+        count = len(self.controller)
+        columns = math.ceil(math.sqrt(count * 1.5))
+        rows = math.ceil(count / columns)
+        cell = max(24, min(64, 960 // columns))
+        self.grid_columns = columns
+        self.grid_cell = cell
+        
+        self.grid_window = tk.Toplevel(self.root)
+        self.grid_window.title("Все оси")
+        self.grid_window.configure(bg=self.bg_color)
+        self.grid_window.protocol("WM_DELETE_WINDOW", self.close_axes_grid)
+        
+        self.grid_canvas = tk.Canvas(self.grid_window, width=columns * cell, height=rows * cell,
+                                     bg=self.bg_color, highlightthickness=0)
+        self.grid_canvas.pack(padx=5, pady=5)
+        self.grid_canvas.bind("<Button-1>", self.on_grid_click)
+        
+        self.grid_views = []
+        for index, axis in enumerate(self.controller.axes):
+            row, column = divmod(index, columns)
+            center_x = column * cell + cell / 2
+            center_y = row * cell + cell / 2
+            radius = cell / 2 - 4
+            self.grid_canvas.create_oval(center_x - radius, center_y - radius,
+                                         center_x + radius, center_y + radius,
+                                         outline=self.axis_color)
+            view = RotorView(self.grid_canvas, center_x, center_y, radius * 0.2, radius * 0.85,
+                             self.motor_color, line_count=4, line_width=2,
+                             quantum=axis.snapshot.step_mode)
+            view.create()
+            self.grid_views.append(view)
+            if cell >= 40:
+                self.grid_canvas.create_text(column * cell + 8, row * cell + 8, text=str(index + 1),
+                                             fill=self.text_color, font=("Arial", 7))
+        
+        self.grid_selection = self.grid_canvas.create_rectangle(0, 0, 0, 0, outline="#c7a44e", width=2)
+        self.highlight_grid_axis()
+        self.update_axes_grid()
+
+    def close_axes_grid(self):
+        self.grid_window.destroy()
+        self.grid_window = None
+        self.grid_views = []
+
+    def highlight_grid_axis(self):
+        row, column = divmod(self.selected_axis, self.grid_columns)
+        cell = self.grid_cell
+        self.grid_canvas.coords(self.grid_selection, column * cell + 1, row * cell + 1,
+                                (column + 1) * cell - 1, (row + 1) * cell - 1)
+
+    def on_grid_click(self, event):
+        index = int(event.y // self.grid_cell) * self.grid_columns + int(event.x // self.grid_cell)
+        if 0 <= index < len(self.controller):
+            self.axis_spinbox.delete(0, tk.END)
+            self.axis_spinbox.insert(0, str(index + 1))
+            self.select_axis(index)
+
+    def update_axes_grid(self):
+        # Роторы, угол которых не изменился, не перерисовываются
+        for view, axis in zip(self.grid_views, self.controller.axes):
+            snapshot = axis.snapshot
+            view.set_quantum(snapshot.step_mode)
+            view.update(snapshot.position % 360)
 
     def update_direction(self):
         direction = self.direction_var.get()
         if direction == "Вперед":
-            self.motor_direction = 1
+            self.submit("set_direction", 1)
             self.canvas.itemconfig(self.direction_indicator, fill="#4a9c82")  # Зеленый
         else:
-            self.motor_direction = -1
+            self.submit("set_direction", -1)
             self.canvas.itemconfig(self.direction_indicator, fill="#4a6b9c")  # Синий
 
+    def sync_scale(self, scale, value):
+        # Scale.set вызывает command ползунка (в Tk - отложенно, при
+        # перерисовке), поэтому флаг вокруг set не помогает: запоминается
+        # показанное значение, и его вызов command пропускается
+        scale.set(value)
+        self.synced_scales[scale] = scale.get()
+
+    def scale_synced(self, scale, value):
+        # True, если command вызван sync_scale, а не пользователем
+        synced = self.synced_scales.pop(scale, None)
+        return synced is not None and float(value) == float(synced)
+
     def update_speed(self, value):
-        self.motor_speed = int(value)
-        self.speed_label.config(text=f"Текущая скорость: {self.motor_speed} шаг/сек")
+        if self.scale_synced(self.speed_scale, value):
+            return
+        speed = int(value)
+        self.submit("set_speed", speed)
+        self.speed_label.config(text=f"Текущая скорость: {speed} шаг/сек")
 
     def update_step_mode(self):
         mode = self.step_var.get()
         if mode == "Полный шаг":
-            self.step_mode = 1
+            step_mode = 1
         elif mode == "Полушаг":
-            self.step_mode = 0.5
+            step_mode = 0.5
         elif mode == "Четверть шага":
-            self.step_mode = 0.25
+            step_mode = 0.25
         else:  # Восьмая шага
-            self.step_mode = 0.125
+            step_mode = 0.125
+        self.submit("set_step_mode", step_mode)
         
         self.mode_label.config(text=f"Режим шага: {mode}")
+        
+        # Таблица углов ротора строится с разрешением текущего микрошага
+        self.rotor_view.set_quantum(step_mode)
+
+    def update_sprite_mode(self):
+        self.rotor_view.set_sprite_mode(self.sprite_var.get())
+        self.update_motor_visualization()
+    
+    def prerender_sprites(self):
+        # Кадры ротора растеризуются частями между событиями интерфейса,
+        # а не в такте отрисовки; пока кадра нет, ротор рисуется линиями
+        self.sprite_job = None
+        if not self.rotor_view.sprites_pending:
+            return
+        done = self.rotor_view.prerender()
+        # Готовый кадр текущего угла показывается следующим тактом
+        self.rendered_snapshot = None
+        if not done:
+            self.sprite_job = self.root.after(1, self.prerender_sprites)
+
+    def update_profile_kind(self):
+        self.submit("set_profile_kind", self.profile_var.get())
+
+    def update_acceleration(self, value):
+        if self.scale_synced(self.accel_scale, value):
+            return
+        self.submit("set_acceleration", float(value))
+        self.accel_label.config(text=f"Ускорение: {float(value):g} шаг/с²")
 
     def move_to_position(self):
         try:
-            self.target_position = int(self.position_entry.get())
-            self.motor_queue.put(("move_to", self.target_position))
+            target_position = int(self.position_entry.get())
+            self.submit("move_to", target_position)
         except ValueError:
             messagebox.showerror("Ошибка", "Введите корректное число для позиции")
 
     def start_motor(self):
-        if not self.motor_running:
-            self.motor_running = True
-            self.motor_queue.put(("start",))
-            self.status_label.config(text="Статус: Запущен", fg="#4a9c82")
-            self.start_btn.config(state=tk.DISABLED)
+        snapshot = self.engine.snapshot
+        if not snapshot.running or snapshot.moving:
+            self.submit("start")
 
     def stop_motor(self):
-        if self.motor_running:
-            self.motor_running = False
-            self.motor_queue.put(("stop",))
-            self.status_label.config(text="Статус: Остановлен", fg="#c74e4e")
-            self.start_btn.config(state=tk.NORMAL)
+        if self.engine.snapshot.running:
+            self.submit("stop")
             self.canvas.itemconfig(self.direction_indicator, fill="#c74e4e")  # Красный
 
+    def start_job(self):
+        if self.job is not None and not self.job.progress()["done"]:
+            messagebox.showerror("Ошибка", "Задание уже выполняется")
+            return
+        snapshot = self.engine.snapshot
+        if snapshot.running and not snapshot.moving:
+            messagebox.showerror("Ошибка", "Остановите непрерывное вращение перед запуском задания")
+            return
+        path = filedialog.askopenfilename(title="Задание", filetypes=[
+            ("G-code", "*.gcode *.nc *.gc"), ("JSON lines", "*.jsonl *.ndjson"), ("Все файлы", "*")])
+        if not path:
+            return
+        from job_runner import JobRunner
+        index = self.selected_axis
+        # Отрезки передаются через канал команд выбранной оси
+        self.job = JobRunner.from_file(self.engine, path,
+                                       submit=lambda name, *args: self.controller.submit(index, name, *args))
+        self.job.start()
+    
+    def cancel_job(self):
+        if self.job is not None:
+            self.job.cancel()
+    
+    def update_job_status(self):
+        # Прогресс, оценка оставшегося времени и глубина буфера отрезков
+        progress = self.job.progress()
+        if progress["error"] is not None:
+            text = f"Задание: ошибка - {progress['error']}"
+        elif progress["cancelled"]:
+            text = "Задание: отменено"
+        elif progress["done"]:
+            text = f"Задание: выполнено за {progress['elapsed']:.1f} с"
+        else:
+            fraction = progress["fraction"]
+            done = "-" if fraction is None else f"{fraction * 100:.0f}%"
+            eta = "-" if progress["eta"] is None else f"{progress['eta']:.0f} с"
+            text = (f"Задание: {done}, осталось {eta}, "
+                    f"буфер {progress['buffer']}/{progress['lookahead']}")
+        
+        if text != self.shown_job_text:
+            self.shown_job_text = text
+            self.job_label.config(text=text)
+        if progress["done"]:
+            self.job = None
+    
     def reset_motor(self):
-        self.current_position = 0
-        self.target_position = 0
+        # Сброс применяется в потоке двигателя; новое положение покажет такт отрисовки
+        self.submit("reset")
         self.position_entry.delete(0, tk.END)
         self.position_entry.insert(0, "0")
         self.position_label.config(text="Текущая позиция: 0 шагов")
-        self.position_history = [0] * 50
+        self.position_history.clear(time.perf_counter(), 0)
         self.draw_position_plot()
-        self.update_motor_visualization()
 
-    def update_motor_visualization(self):
-        # Обновление угла поворота ротора
-        angle_deg = self.current_position % 360
+    def set_render_fps(self, fps):
+        if fps <= 0:
+            raise ValueError("Частота кадров должна быть положительной")
+        self.render_fps = fps
+        self.next_frame_time = None
+
+    def render_tick(self):
+        # Один кадр: снимок состояния ядра и отрисовка только при изменениях
+        now = time.perf_counter()
+        frame_interval = 1.0 / self.render_fps
+        
+        instruments = self.instruments
+        if instruments.enabled and self.next_frame_time is not None:
+            # after округляет задержку до миллисекунд вниз, ранний вызов - не опоздание
+            instruments.after_lag.record(max(0.0, now - self.next_frame_time))
+        
+        if self.next_frame_time is None or now - self.next_frame_time > frame_interval:
+            # Первый кадр или отставание больше кадра: пропущенные кадры не догоняем
+            self.next_frame_time = now
+        self.next_frame_time += frame_interval
+        
+        if self.replayer is not None:
+            # Снимок из журнала по текущему времени воспроизведения
+            snapshot = self.replayer.snapshot_at(now)
+            rendered = self.rendered_snapshot
+            if rendered is None or snapshot.version != rendered.version:
+                self.rendered_snapshot = snapshot
+                self.rotor_view.set_quantum(snapshot.step_mode)
+                self.update_motor_visualization(snapshot)
+            if self.replayer.finished(now):
+                self.stop_replay()
+        else:
+            # Снимок публикуется потоком двигателя заменой ссылки: чтение без блокировок
+            snapshot = self.engine.snapshot
+            if snapshot is not self.rendered_snapshot:
+                self.rendered_snapshot = snapshot
+                self.update_motor_visualization(snapshot)
         
-        # Поворот линий ротора
-        rotor_angle_offset = math.radians(angle_deg)
-        rotor_line_count = len(self.rotor_lines)
+        if now >= self.next_plot_time:
+            # Окно графика сдвигается и без новых отсчетов
+            self.draw_position_plot()
         
-        for i, line in enumerate(self.rotor_lines):
-            angle = rotor_angle_offset + i * (2 * math.pi / rotor_line_count)
-            x1 = self.center_x + math.cos(angle) * 20
-            y1 = self.center_y + math.sin(angle) * 20
-            x2 = self.center_x + math.cos(angle) * (self.radius - 40)
-            y2 = self.center_y + math.sin(angle) * (self.radius - 40)
-            
-            self.canvas.coords(line, x1, y1, x2, y2)
+        if self.grid_views:
+            self.update_axes_grid()
         
-        # Обновление текста угла
-        self.canvas.itemconfig(self.angle_text, text=f"Угол: {angle_deg:.1f}°")
+        if self.rotor_view.sprites_pending and self.sprite_job is None:
+            self.sprite_job = self.root.after_idle(self.prerender_sprites)
         
-        # Обновление позиции на графике
-        self.position_history.pop(0)
-        self.position_history.append(self.current_position)
+        if self.job is not None:
+            self.update_job_status()
         
-        # Обновление информационных меток
-        self.position_label.config(text=f"Текущая позиция: {self.current_position} шагов")
+        if self.physics is not None:
+            self.update_physics_status(now)
         
-        # Перерисовка графика
-        self.draw_position_plot()
-
-    def motor_animation_loop(self):
-        step_counter = 0
-        last_update_time = time.time()
+        if instruments.enabled:
+            instruments.frame_time.record(time.perf_counter() - now)
+            if now >= self.next_overlay_time:
+                self.update_metrics_panel(now)
         
-        while True:
-            current_time = time.time()
-            elapsed = current_time - last_update_time
-            
-            if self.motor_running and elapsed >= (1.0 / self.motor_speed):
-                # Выполнение шага
-                step_value = self.step_mode * self.motor_direction
-                self.current_position += step_value
-                
-                # Обновление визуализации
-                self.root.after(0, self.update_motor_visualization)
-                
-                last_update_time = current_time
-                step_counter += 1
-            
-            # Небольшая задержка для снижения нагрузки на ЦП
-            time.sleep(0.01)
+        delay_ms = max(1, int((self.next_frame_time - time.perf_counter()) * 1000))
+        self.root.after(delay_ms, self.render_tick)
 
-    def process_motor_commands(self):
-        # Обработка команд из очереди
+    def toggle_instrumentation(self):
+        enabled = self.instruments_var.get()
+        self.instruments.enabled = enabled
+        self.controller.set_lateness_histogram(self.instruments.step_lateness if enabled else None)
+        if enabled:
+            if self.metrics_frame is None:
+                self.create_metrics_panel()
+            self.metrics_frame.pack(after=self.info_frame, fill=tk.X, padx=10, pady=5)
+            self.next_overlay_time = time.perf_counter() + self.overlay_interval
+            self.overlay_steps = self.controller.total_steps
+        else:
+            self.metrics_frame.pack_forget()
+    
+    def update_metrics_panel(self, now):
+        snapshot = self.instruments.snapshot()
+        for name in ("step_lateness", "frame_time", "after_lag", "command_latency"):
+            label, title = self.metric_labels[name]
+            stats = snapshot[name]
+            if not stats["count"]:
+                label.config(text=f"{title}: -")
+                continue
+            label.config(text=f"{title}: {stats['p50_ms']:.2f} / {stats['p99_ms']:.2f} / {stats['max_ms']:.2f}")
+        
+        # Шаги всех осей за интервал обновления панели
+        elapsed = now - self.next_overlay_time + self.overlay_interval
+        total_steps = self.controller.total_steps
+        label, title = self.metric_labels["step_rate"]
+        label.config(text=f"{title}: {(total_steps - self.overlay_steps) / elapsed:.0f}")
+        
+        cache = self.controller.profile_cache.stats()
+        label, title = self.metric_labels["profile_cache"]
+        label.config(text=f"{title}: {cache['hits']} попаданий, {cache['misses']} промахов, "
+                          f"{cache['evictions']} вытеснено")
+        if self.startup is not None:
+            label, title = self.metric_labels["startup"]
+            label.config(text=f"{title}: кадр {self.startup['first_frame_ms']:.0f} мс, "
+                              f"панели {self.startup['panels_ms']:.0f} мс")
+        self.overlay_steps = total_steps
+        self.next_overlay_time = now + self.overlay_interval
+    
+    def export_metrics(self):
+        path = filedialog.asksaveasfilename(title="Экспорт измерений", defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            self.instruments.export(path)
+        except OSError as error:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить измерения: {error}")
+    
+    def toggle_physics(self):
+        if self.physics_var.get():
+            self.physics_label.pack(after=self.physics_check, anchor=tk.W, padx=10, pady=5)
+            self.attach_physics()
+        else:
+            self.physics.detach()
+            self.physics = None
+            self.physics_label.pack_forget()
+    
+    def attach_physics(self):
+        # Модель следит за шагами выбранной оси
+        if self.physics is not None:
+            self.physics.detach()
+        from motor_physics import PhysicsMonitor
+        self.physics = PhysicsMonitor()
+        self.physics.attach(self.engine, time.perf_counter())
+        self.shown_physics_text = None
+    
+    def update_physics_status(self, now):
+        # Интегрирование модели до текущего момента в такте отрисовки
+        model = self.physics.poll(now)
+        missed = model.missed_steps
+        text = f"Ротор: отставание {model.lag:+.2f}, пропущено {missed} полн. шагов"
+        if text != self.shown_physics_text:
+            self.shown_physics_text = text
+            self.physics_label.config(text=text, fg="#c74e4e" if missed else self.text_color)
+    
+    def toggle_recording(self):
+        if self.recorder is not None:
+            self.stop_recording()
+            return
+        path = filedialog.asksaveasfilename(title="Запись журнала", defaultextension=".dvtl",
+                                            filetypes=[("Журнал двигателя", "*.dvtl")])
+        if not path:
+            return
+        from telemetry_log import StepRecorder
+        try:
+            self.recorder = StepRecorder(path)
+        except OSError as error:
+            messagebox.showerror("Ошибка", f"Не удалось создать журнал: {error}")
+            return
+        # Записываются шаги оси, выбранной в момент начала записи
+        self.recorder.attach(self.engine, time.perf_counter())
+        self.record_btn.config(text="Остановить запись", bg="#c74e4e")
+    
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+            self.record_btn.config(text="Записать", bg=self.btn_color)
+    
+    def toggle_replay(self):
+        if self.replayer is not None:
+            self.stop_replay()
+            return
+        path = filedialog.askopenfilename(title="Воспроизведение журнала",
+                                          filetypes=[("Журнал двигателя", "*.dvtl"), ("Все файлы", "*")])
+        if not path:
+            return
+        from telemetry_log import LogReplayer, StepLog
+        speed = float(self.replay_speed_var.get().rstrip("x"))
         try:
-            while not self.motor_queue.empty():
-                command = self.motor_queue.get_nowait()
-                
-                if command[0] == "start":
-                    self.motor_running = True
-                    self.status_label.config(text="Статус: Запущен", fg="#4a9c82")
-                    self.start_btn.config(state=tk.DISABLED)
-                    
-                elif command[0] == "stop":
-                    self.motor_running = False
-                    self.status_label.config(text="Статус: Остановлен", fg="#c74e4e")
-                    self.start_btn.config(state=tk.NORMAL)
-                    
-                elif command[0] == "move_to":
-                    self.target_position = command[1]
-                    # Просто обновляем целевую позицию, двигатель продолжит движение
-                    
-        except:
-            pass
-        
-        # Планируем следующую проверку очереди
-        self.root.after(100, self.process_motor_commands)
-
-def main():
+            log = StepLog(path)
+        except (OSError, ValueError) as error:
+            messagebox.showerror("Ошибка", f"Не удалось открыть журнал: {error}")
+            return
+        try:
+            self.replayer = LogReplayer(log, speed=speed)
+        except ValueError as error:
+            log.close()
+            messagebox.showerror("Ошибка", str(error))
+            return
+        
+        # Ротор и график показывают журнал вместо выбранной оси
+        now = time.perf_counter()
+        self.replayer.start(now)
+        self.position_history.clear(now, self.replayer.snapshot_at(now).position)
+        self.rendered_snapshot = None
+        self.shown_status = None
+        self.replay_btn.config(text="Остановить", bg="#c7a44e")
+    
+    def stop_replay(self):
+        self.replayer.log.close()
+        self.replayer = None
+        self.replay_btn.config(text="Воспроизвести", bg=self.btn_color)
+        
+        # Возврат к отображению выбранной оси
+        snapshot = self.engine.snapshot
+        self.rotor_view.set_quantum(snapshot.step_mode)
+        self.position_history.clear(time.perf_counter(), snapshot.position)
+        self.rendered_snapshot = None
+        self.shown_status = None
+    
+    def on_engine_command(self, index, command):
+        # Вызывается в потоке планировщика после применения команды
+        if command.error is not None:
+            self.root.after(0, messagebox.showerror, "Ошибка", str(command.error))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Управление шаговым двигателем")
+    parser.add_argument("--axes", type=int, default=1, help="число осей (двигателей)")
+    parser.add_argument("--port", type=int, help="TCP-порт сервера управления (JSON lines)")
+    parser.add_argument("--unix", help="путь Unix-сокета сервера управления")
+    parser.add_argument("--device", action="append", default=[],
+                        help="последовательный порт драйвера; повторяется для следующих осей")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="напечатать время запуска (JSON) после первого кадра")
+    parser.add_argument("--exit-after-startup", action="store_true",
+                        help="завершиться сразу после запуска (для замеров)")
+    args = parser.parse_args(argv)
+    
     root = tk.Tk()
-    app = StepperMotorApp(root)
+    app = StepperMotorApp(root, axis_count=args.axes, started_at=STARTED_AT)
+    if args.startup_report:
+        app.startup_listeners.append(lambda startup: print(json.dumps(startup), flush=True))
+    if args.exit_after_startup:
+        app.startup_listeners.append(lambda startup: root.after(0, root.quit))
+    
+    # Выход шагов на драйверы: порт на ось, по порядку
+    outputs = []
+    if args.device:
+        from step_output import SerialBackend
+        for index, path in enumerate(args.device[:len(app.controller)]):
+            backend = SerialBackend(path, axis=index)
+            app.controller.axis(index).output = backend
+            outputs.append(backend)
+    
+    # Сервер управления работает в своем потоке рядом с интерфейсом
+    server = None
+    if args.port is not None or args.unix is not None:
+        from control_server import ControlServer
+        server = ControlServer(app.controller, port=args.port or 0, path=args.unix).start_thread()
+    
     root.mainloop()
+    app.stop_recording()
+    if server is not None:
+        server.shutdown()
+    app.controller.shutdown()
+    for backend in outputs:
+        backend.close()
 
 if __name__ == "__main__":
     main()
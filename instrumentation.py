@@ -0,0 +1,173 @@
+import csv
+import json
+import math
+import os
+import time
+from bisect import bisect_left
+
+from motor_history import RingBuffer
+
+
+class LatencyTracker:
+    # Скользящее окно последних задержек (в секундах) с расчетом перцентилей
+
+    def __init__(self, capacity=4096):
+        self.samples = RingBuffer(capacity)
+        self.count = 0
+        self.max_value = 0.0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        if seconds > self.max_value:
+            self.max_value = seconds
+
+    def reset(self):
+        self.samples.clear()
+        self.count = 0
+        self.max_value = 0.0
+
+    def percentiles(self, points=(50, 90, 99)):
+        values = sorted(self.samples.values())
+        if not values:
+            return {p: None for p in points}
+        result = {}
+        for p in points:
+            # Метод ближайшего ранга
+            rank = max(1, math.ceil(p / 100 * len(values)))
+            result[p] = values[rank - 1]
+        return result
+
+    def snapshot(self, points=(50, 90, 99)):
+        # Сводка для экспорта: значения в миллисекундах
+        stats = {"count": self.count, "window": len(self.samples),
+                 "max_ms": self.max_value * 1000}
+        for p, value in self.percentiles(points).items():
+            stats[f"p{p}_ms"] = None if value is None else value * 1000
+        return stats
+
+
+class Histogram:
+    # Гистограмма длительностей (в секундах) с логарифмическими корзинами.
+    # Запись - один bisect и инкремент счетчика, выборка не хранится, поэтому
+    # гистограмму можно вести в горячих путях потока двигателя и отрисовки.
+
+    def __init__(self, low=1e-6, high=10.0, per_decade=8):
+        if not 0 < low < high:
+            raise ValueError("Границы гистограммы должны удовлетворять 0 < low < high")
+        size = int(round(math.log10(high / low) * per_decade))
+        # Верхние границы корзин; последняя корзина - все, что больше high
+        self.edges = [low * 10 ** (i / per_decade) for i in range(size + 1)]
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max_value = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(self.edges, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max_value:
+            self.max_value = seconds
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0.0
+        self.max_value = 0.0
+
+    def percentiles(self, points=(50, 90, 99)):
+        # Оценка сверху: верхняя граница корзины, в которую попал ранг
+        if not self.count:
+            return {p: None for p in points}
+        edges = self.edges
+        result = {}
+        for p in points:
+            rank = max(1, math.ceil(p / 100 * self.count))
+            seen = 0
+            for index, bucket in enumerate(self.counts):
+                seen += bucket
+                if seen >= rank:
+                    break
+            upper = edges[index] if index < len(edges) else self.max_value
+            result[p] = min(upper, self.max_value)
+        return result
+
+    def buckets(self):
+        # Непустые корзины: (верхняя граница в мс, число значений)
+        edges = self.edges
+        return [(edges[index] * 1000 if index < len(edges) else None, bucket)
+                for index, bucket in enumerate(self.counts) if bucket]
+
+    def snapshot(self, points=(50, 90, 99)):
+        # Сводка в том же виде, что LatencyTracker.snapshot
+        stats = {"count": self.count, "max_ms": self.max_value * 1000,
+                 "mean_ms": self.total / self.count * 1000 if self.count else None}
+        for p, value in self.percentiles(points).items():
+            stats[f"p{p}_ms"] = None if value is None else value * 1000
+        return stats
+
+
+class Instrumentation:
+    # Метрики приложения: опоздание шагов относительно дедлайна, время кадра,
+    # опоздание такта after и задержка команд. Пока набор выключен, горячие
+    # пути проверяют только флаг enabled (или ссылку на гистограмму в ядре).
+
+    HISTOGRAMS = ("step_lateness", "frame_time", "after_lag")
+    CSV_FIELDS = ("metric", "count", "mean_ms", "max_ms", "p50_ms", "p90_ms", "p99_ms")
+
+    def __init__(self, command_latency=None):
+        self.enabled = False
+        self.step_lateness = Histogram()
+        self.frame_time = Histogram()
+        self.after_lag = Histogram()
+        # LatencyTracker канала команд (ведется ядром всегда)
+        self.command_latency = command_latency
+        # Время холодного старта интерфейса (мс), если известно
+        self.startup = None
+
+    def reset(self):
+        for name in self.HISTOGRAMS:
+            getattr(self, name).reset()
+        if self.command_latency is not None:
+            self.command_latency.reset()
+
+    def snapshot(self, buckets=False):
+        result = {"timestamp": time.time(), "enabled": self.enabled}
+        for name in self.HISTOGRAMS:
+            histogram = getattr(self, name)
+            stats = histogram.snapshot()
+            if buckets:
+                stats["buckets"] = histogram.buckets()
+            result[name] = stats
+        if self.command_latency is not None:
+            result["command_latency"] = self.command_latency.snapshot()
+        if self.startup is not None:
+            result["startup"] = dict(self.startup)
+        return result
+
+    def export(self, path):
+        # Формат выбирается по расширению: .csv или JSON
+        if path.lower().endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(buckets=True), file, ensure_ascii=False, indent=2)
+
+    def export_csv(self, path):
+        # Одна строка на метрику; повторный экспорт в тот же файл дописывает строки
+        snapshot = self.snapshot()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "a", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(("timestamp",) + self.CSV_FIELDS)
+            for name in self.HISTOGRAMS + ("command_latency",):
+                stats = snapshot.get(name)
+                if stats is None:
+                    continue
+                writer.writerow([snapshot["timestamp"], name] +
+                                [stats.get(field) for field in self.CSV_FIELDS[1:]])
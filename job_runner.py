@@ -0,0 +1,355 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+from motor_engine import MICROSTEPS
+
+
+# Команда задания: строка и смещение ее конца в файле (для прогресса),
+# значение координаты (None - без движения), признак относительной
+# координаты, скорость (шаг/с, None - максимальная) и пауза (сек)
+JobStep = namedtuple("JobStep", ("line", "offset", "value", "relative", "speed", "dwell"))
+
+
+def iter_lines(path):
+    # Ленивое построчное чтение: (номер строки, смещение конца строки, текст)
+    with open(path, "rb") as file:
+        offset = 0
+        for number, raw in enumerate(file, 1):
+            offset += len(raw)
+            yield number, offset, raw.decode("utf-8")
+
+
+def parse_gcode(lines):
+    # Подмножество G-code для одной оси: G0/G1 X.. F.. (F - шагов в минуту),
+    # G4 P.. (мс) или S.. (сек), G90/G91 - абсолютные/относительные координаты.
+    # Комментарии после ';' и в круглых скобках пропускаются.
+    relative = False
+    feed = None
+    for number, offset, text in lines:
+        text = text.split(";", 1)[0]
+        while "(" in text:
+            start = text.index("(")
+            end = text.find(")", start)
+            text = text[:start] + (text[end + 1:] if end >= 0 else "")
+        words = text.upper().split()
+        if not words:
+            continue
+
+        codes = {}
+        try:
+            for word in words:
+                codes[word[0]] = float(word[1:])
+        except (ValueError, IndexError):
+            raise ValueError(f"Строка {number}: не удалось разобрать '{text.strip()}'") from None
+
+        code = codes.get("G")
+        if code == 90 or code == 91:
+            relative = code == 91
+            continue
+        if code == 4:
+            dwell = codes.get("P", 0.0) / 1000 if "P" in codes else codes.get("S", 0.0)
+            yield JobStep(number, offset, None, relative, None, dwell)
+        elif code == 0 or code == 1:
+            if "F" in codes:
+                feed = codes["F"] / 60
+            # G0 - ускоренное перемещение с максимальной скоростью задания
+            speed = None if code == 0 else feed
+            yield JobStep(number, offset, codes.get("X"), relative, speed, 0.0)
+        elif "M" in codes:
+            continue
+        else:
+            raise ValueError(f"Строка {number}: неподдерживаемая команда '{text.strip()}'")
+
+
+def parse_jsonl(lines):
+    # Список перемещений в формате JSON lines: {"x": 100, "speed": 500},
+    # {"dx": -20}, {"dwell": 0.5}. Скорость сохраняется до следующего "speed".
+    speed = None
+    for number, offset, text in lines:
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            raise ValueError(f"Строка {number}: некорректный JSON") from None
+        if "x" in record:
+            value, relative = record["x"], False
+        elif "dx" in record:
+            value, relative = record["dx"], True
+        else:
+            value, relative = None, False
+        speed = record.get("speed", speed)
+        yield JobStep(number, offset, value, relative, speed, record.get("dwell", 0.0))
+
+
+def read_job(path):
+    # Генератор команд задания; формат выбирается по расширению файла
+    if path.lower().endswith((".jsonl", ".json", ".ndjson")):
+        return parse_jsonl(iter_lines(path))
+    return parse_gcode(iter_lines(path))
+
+
+class Segment:
+    # Отрезок задания в окне предпросмотра (в шагах текущего режима)
+
+    __slots__ = ("distance", "speed", "dwell", "target", "offset", "entry", "exit")
+
+    def __init__(self, distance, speed, dwell, target, offset):
+        self.distance = distance
+        self.speed = speed
+        self.dwell = dwell
+        self.target = target
+        self.offset = offset
+        self.entry = 0.0
+        self.exit = 0.0
+
+
+class JobRunner:
+    # Потоковое выполнение задания. Команды читаются из генератора по мере
+    # надобности; окно предпросмотра из lookahead отрезков позволяет проходить
+    # стыки отрезков одного направления без остановки. Первый отрезок окна
+    # планируется так, чтобы остаток окна мог затормозить до нуля, и
+    # передается ядру заранее: в очереди ядра держится не меньше
+    # buffer_segments отрезков и lead_time секунд движения.
+
+    def __init__(self, engine, steps, submit=None, lookahead=16, buffer_segments=4,
+                 lead_time=0.5, total_bytes=None, max_speed=None, acceleration=None):
+        if lookahead < 1 or buffer_segments < 1:
+            raise ValueError("Окно предпросмотра и буфер должны быть не меньше 1")
+        self.engine = engine
+        self.steps = steps
+        # submit(name, *args) - канал команд оси (по умолчанию engine.submit)
+        self.submit = submit or engine.submit
+        self.lookahead = lookahead
+        self.buffer_segments = buffer_segments
+        self.lead_time = lead_time
+        self.total_bytes = total_bytes
+
+        snapshot = engine.snapshot
+        self.pulse = int(snapshot.step_mode * MICROSTEPS)
+        self.max_speed = max_speed or snapshot.speed
+        self.acceleration = acceleration or engine.acceleration
+        self._position = snapshot.position_micro  # микрошагов, после запланированных отрезков
+        self._dwell = 0.0
+        self._dwell_offset = 0
+
+        self.window = deque()
+        self.exhausted = False
+        self.lines_read = 0
+        self.segments_planned = 0
+        # Переданные ядру отрезки: (номер по счету ядра, длительность, смещение в файле)
+        self._committed = deque()
+        self._base_completed = engine.completed_segments
+        self._base_starved = engine.starved_segments
+        self._base_dropped = engine.dropped_segments
+        self._last_command = None
+        self.bytes_done = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_file(cls, engine, path, **options):
+        return cls(engine, read_job(path), total_bytes=os.path.getsize(path), **options)
+
+    # Чтение и планирование
+
+    def _read(self):
+        # Дочитать генератор до заполнения окна
+        window = self.window
+        while not self.exhausted and len(window) < self.lookahead:
+            try:
+                step = next(self.steps)
+            except StopIteration:
+                self.exhausted = True
+                if self._dwell:
+                    # Пауза в конце задания - отрезок без перемещения
+                    window.append(Segment(0, self.max_speed, self._dwell,
+                                          self._position / MICROSTEPS, self._dwell_offset))
+                    self._dwell = 0.0
+                break
+            self.lines_read = step.line
+            if step.dwell:
+                self._dwell += step.dwell
+                self._dwell_offset = step.offset
+            if step.value is None:
+                continue
+
+            target_micro = round(step.value * MICROSTEPS)
+            if step.relative:
+                target_micro += self._position
+            distance = round((target_micro - self._position) / self.pulse)
+            if distance == 0 and not self._dwell:
+                continue
+            self._position += distance * self.pulse
+            speed = self.max_speed if step.speed is None else min(step.speed, self.max_speed)
+            if speed <= 0:
+                raise ValueError(f"Строка {step.line}: скорость должна быть положительной")
+            window.append(Segment(distance, speed, self._dwell,
+                                  self._position / MICROSTEPS, step.offset))
+            self._dwell = 0.0
+
+    def _plan_window(self, entry):
+        # Скорости на стыках: обратный проход от нулевой скорости в конце окна,
+        # затем прямой проход от фиксированной скорости входа
+        accel = self.acceleration
+        segments = self.window
+        exit_speed = 0.0
+        for index in range(len(segments) - 1, -1, -1):
+            segment = segments[index]
+            segment.exit = exit_speed
+            reachable = math.sqrt(exit_speed * exit_speed + 2 * accel * abs(segment.distance))
+            if index == 0:
+                break
+            previous = segments[index - 1]
+            if segment.dwell or previous.distance * segment.distance <= 0:
+                junction = 0.0  # разворот или пауза - остановка на стыке
+            else:
+                junction = min(previous.speed, segment.speed)
+            exit_speed = min(junction, reachable)
+
+        speed = entry
+        for segment in segments:
+            segment.entry = speed
+            reachable = math.sqrt(speed * speed + 2 * accel * abs(segment.distance))
+            segment.exit = min(segment.exit, reachable)
+            speed = segment.exit
+
+    def _commit(self, entry):
+        # Передача ядру первого отрезка окна; возвращает скорость на его выходе
+        self._plan_window(entry)
+        segment = self.window.popleft()
+        # Повтор того же задания дает те же скорости на стыках: профили из кэша ядра
+        profile = self.engine.profile_cache.plan(segment.distance, segment.speed, self.acceleration,
+                                                 start_speed=segment.entry, end_speed=segment.exit)
+        self._last_command = self.submit("queue_move", profile, segment.target, segment.dwell)
+        self.segments_planned += 1
+        self._committed.append((self.segments_planned, profile.duration + segment.dwell,
+                                segment.offset))
+        return profile.end_speed
+
+    # Состояние выполнения
+
+    def _retire(self):
+        # Отрезки, завершенные ядром, удаляются из учета буфера
+        engine = self.engine
+        if engine.dropped_segments != self._base_dropped and not self._cancel.is_set():
+            raise RuntimeError("Задание прервано командой двигателя")
+        completed = engine.completed_segments - self._base_completed
+        committed = self._committed
+        while committed and committed[0][0] <= completed:
+            self.bytes_done = committed.popleft()[2]
+
+    @property
+    def buffer_depth(self):
+        return len(self._committed)
+
+    def buffered_time(self):
+        return sum(duration for _, duration, _ in self._committed)
+
+    @property
+    def done(self):
+        return self.exhausted and not self.window and not self._committed
+
+    def progress(self):
+        # Доля выполненного задания по байтам файла и оценка оставшегося времени
+        now = time.perf_counter()
+        elapsed = 0.0 if self.started_at is None else (self.finished_at or now) - self.started_at
+        fraction = None
+        if self.total_bytes:
+            fraction = min(1.0, self.bytes_done / self.total_bytes)
+        if self.done and self.error is None:
+            fraction = 1.0
+        eta = None
+        if fraction:
+            eta = elapsed * (1 - fraction) / fraction
+        return {
+            "fraction": fraction,
+            "eta": eta,
+            "elapsed": elapsed,
+            "lines": self.lines_read,
+            "segments": self.segments_planned,
+            "buffer": self.buffer_depth,
+            "lookahead": len(self.window),
+            "starved": self.engine.starved_segments - self._base_starved,
+            "cancelled": self._cancel.is_set(),
+            "done": self.done or self.error is not None or self._cancel.is_set(),
+            "error": self.error,
+        }
+
+    # Выполнение
+
+    def pump(self, entry):
+        # Один проход подачи: дочитать окно и передать ядру столько отрезков,
+        # сколько нужно для заполнения буфера. Возвращает скорость входа
+        # следующего отрезка.
+        command = self._last_command
+        if command is not None and command.error is not None:
+            # Ядро отклонило отрезок (например, двигатель вращается непрерывно)
+            raise command.error
+        self._retire()
+        while True:
+            self._read()
+            if not self.window:
+                break
+            if (self.buffer_depth >= self.buffer_segments
+                    and self.buffered_time() >= self.lead_time):
+                break
+            entry = self._commit(entry)
+        return entry
+
+    def run(self):
+        entry = 0.0
+        self.started_at = time.perf_counter()
+        try:
+            while not self._cancel.is_set():
+                entry = self.pump(entry)
+                if self.done:
+                    break
+                # Ожидание не дольше четверти запаса буфера
+                self._cancel.wait(min(0.05, max(0.001, self.buffered_time() / 4)))
+        except Exception as error:
+            self.error = error
+            self.submit("clear_queue")
+            self._committed.clear()
+        self.finished_at = time.perf_counter()
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Задание уже запущено")
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        # Чтение прекращается, еще не начатые отрезки отменяются
+        self._cancel.set()
+        self.submit("clear_queue")
+        if self._thread is not None:
+            self._thread.join()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def simulate(self, chunk=0.1, advance=None):
+        # Выполнение задания в виртуальном времени ядра без потоков.
+        # advance(duration=...) продвигает виртуальные часы (по умолчанию
+        # engine.simulate; для оси контроллера - controller.simulate, чтобы
+        # команды и шаги оси шли по одним часам)
+        advance = advance or self.engine.simulate
+        entry = 0.0
+        self.started_at = time.perf_counter()
+        while True:
+            entry = self.pump(entry)
+            if self.done:
+                break
+            advance(duration=chunk)
+        self.finished_at = time.perf_counter()
+        return self.progress()
@@ -0,0 +1,336 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: есть реализация на чистом Python
+    np = None
+
+
+PROFILE_KINDS = ("trapezoid", "scurve")
+
+# Число узлов сетки для обращения s(t) на участке разгона S-кривой
+SCURVE_GRID = 4096
+
+
+class MotionProfile:
+    # Заранее рассчитанная таблица времени шагов одного перемещения.
+    # times[k] - момент (k+1)-го шага от начала движения, intervals[k] - интервал
+    # перед ним. Цикл двигателя только проходит по этим массивам.
+    # duration по умолчанию - момент последнего шага; ведомая ось группы
+    # получает длительность всего согласованного отрезка (см. coordinated_motion).
+
+    def __init__(self, direction, times, intervals, kind, peak_speed,
+                 start_speed=0.0, end_speed=0.0, duration=None):
+        self.direction = direction
+        self.times = times
+        self.intervals = intervals
+        self.kind = kind
+        self.peak_speed = peak_speed
+        # Фактические скорости на границах (после ограничения по дистанции)
+        self.start_speed = start_speed
+        self.end_speed = end_speed
+        self.steps = len(times)
+        if duration is None:
+            duration = times[-1] if self.steps else 0.0
+        self.duration = float(duration)
+
+    def __repr__(self):
+        return (f"MotionProfile(kind={self.kind!r}, steps={self.steps}, "
+                f"direction={self.direction}, duration={self.duration:.6f})")
+
+    @property
+    def nbytes(self):
+        # Память таблиц времени и интервалов
+        return 2 * len(self.times) * self.times.itemsize
+
+    def with_direction(self, direction):
+        # Тот же профиль в другом направлении; таблицы общие, не копируются
+        if direction == self.direction:
+            return self
+        return MotionProfile(direction, self.times, self.intervals, self.kind, self.peak_speed,
+                             self.start_speed, self.end_speed, self.duration)
+
+
+class ProfileCache:
+    # LRU-кэш рассчитанных профилей для повторяющихся перемещений. Ключ -
+    # нормализованные параметры: число шагов без знака, скорости, ускорение,
+    # тип профиля и рывок. Позиция начала и направление в ключ не входят,
+    # поэтому одно и то же относительное перемещение из любой точки и в обе
+    # стороны использует одну таблицу. Объем ограничен max_bytes памяти
+    # таблиц и max_entries записей; вытесняются давно не использованные.
+
+    def __init__(self, max_bytes=32 << 20, max_entries=256):
+        if max_bytes <= 0 or max_entries < 1:
+            raise ValueError("Размер кэша должен быть положительным")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def plan(self, distance, max_speed, acceleration, kind="trapezoid", jerk=None,
+             start_speed=0.0, end_speed=0.0):
+        # То же, что plan_move, но повторное перемещение - поиск в словаре
+        direction = 1 if distance >= 0 else -1
+        steps = int(abs(distance))
+        if kind == "scurve":
+            # S-кривая всегда начинается и заканчивается остановкой
+            jerk = acceleration * 10 if jerk is None else jerk
+            start_speed = end_speed = 0.0
+        else:
+            jerk = None
+        key = (steps, float(max_speed), float(acceleration), kind,
+               None if jerk is None else float(jerk), float(start_speed), float(end_speed))
+
+        entries = self._entries
+        with self._lock:
+            profile = entries.get(key)
+            if profile is not None:
+                entries.move_to_end(key)
+                self.hits += 1
+                return profile.with_direction(direction)
+            self.misses += 1
+
+        # Расчет вне блокировки: другие потоки тем временем пользуются кэшем
+        profile = plan_move(steps, max_speed, acceleration, kind=kind, jerk=jerk,
+                            start_speed=start_speed, end_speed=end_speed)
+        size = profile.nbytes
+        if size <= self.max_bytes:
+            with self._lock:
+                if key not in entries:
+                    entries[key] = profile
+                    self.bytes += size
+                    while self.bytes > self.max_bytes or len(entries) > self.max_entries:
+                        _, evicted = entries.popitem(last=False)
+                        self.bytes -= evicted.nbytes
+                        self.evictions += 1
+        return profile.with_direction(direction)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+def plan_move(distance, max_speed, acceleration, kind="trapezoid", jerk=None,
+              start_speed=0.0, end_speed=0.0):
+    # Планирование перемещения на distance шагов (со знаком).
+    # Скорости - шагов/с, ускорение - шагов/с², рывок - шагов/с³.
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f"Неизвестный тип профиля: {kind}")
+    if max_speed <= 0 or acceleration <= 0:
+        raise ValueError("Скорость и ускорение должны быть положительными")
+
+    direction = 1 if distance >= 0 else -1
+    steps = int(abs(distance))
+    if steps == 0:
+        return MotionProfile(direction, _empty(), _empty(), kind, 0.0)
+
+    if kind == "trapezoid":
+        times, peak_speed, start_speed, end_speed = _trapezoid_times(
+            steps, max_speed, acceleration, start_speed, end_speed)
+    else:
+        if jerk is None:
+            jerk = acceleration * 10
+        if jerk <= 0:
+            raise ValueError("Рывок должен быть положительным")
+        times, peak_speed = _scurve_times(steps, max_speed, acceleration, jerk)
+        start_speed = end_speed = 0.0
+
+    return MotionProfile(direction, times, _diff(times), kind, peak_speed,
+                         start_speed, end_speed)
+
+
+def _empty():
+    if np is not None:
+        return np.empty(0)
+    return array("d")
+
+
+def _diff(times):
+    if np is not None:
+        return np.diff(times, prepend=0.0)
+    intervals = array("d", times)
+    for k in range(len(intervals) - 1, 0, -1):
+        intervals[k] -= intervals[k - 1]
+    return intervals
+
+
+def _trapezoid_times(steps, max_speed, accel, v0, v1):
+    # Разгон v0 -> vp, движение с постоянной скоростью, торможение vp -> v1.
+    # Время шага находится обращением s(t) на каждом участке.
+    v0 = min(max(v0, 0.0), max_speed)
+    v1 = min(max(v1, 0.0), max_speed)
+    # Граничные скорости, недостижимые на этой дистанции, ограничиваются
+    v1 = min(v1, math.sqrt(v0 * v0 + 2 * accel * steps))
+    v0 = min(v0, math.sqrt(v1 * v1 + 2 * accel * steps))
+
+    vp = min(max_speed, math.sqrt((2 * accel * steps + v0 * v0 + v1 * v1) / 2))
+    s_acc = (vp * vp - v0 * v0) / (2 * accel)
+    s_dec = (vp * vp - v1 * v1) / (2 * accel)
+    t_acc = (vp - v0) / accel
+    t_cruise = max(steps - s_acc - s_dec, 0.0) / vp
+    total = t_acc + t_cruise + (vp - v1) / accel
+    s_cruise_end = steps - s_dec
+
+    if np is not None:
+        s = np.arange(1, steps + 1, dtype=np.float64)
+        remaining = np.maximum(steps - s, 0.0)
+        times = np.where(
+            s <= s_acc,
+            (np.sqrt(v0 * v0 + 2 * accel * s) - v0) / accel,
+            np.where(
+                s <= s_cruise_end,
+                t_acc + (s - s_acc) / vp,
+                total - (np.sqrt(v1 * v1 + 2 * accel * remaining) - v1) / accel,
+            ),
+        )
+        return times, vp, v0, v1
+
+    sqrt = math.sqrt
+    times = array("d", bytes(8 * steps))
+    for k in range(steps):
+        s = k + 1
+        if s <= s_acc:
+            times[k] = (sqrt(v0 * v0 + 2 * accel * s) - v0) / accel
+        elif s <= s_cruise_end:
+            times[k] = t_acc + (s - s_acc) / vp
+        else:
+            times[k] = total - (sqrt(v1 * v1 + 2 * accel * (steps - s)) - v1) / accel
+    return times, vp, v0, v1
+
+
+def _scurve_phases(speed, accel, jerk):
+    # Длительности участков разгона 0 -> speed с ограничением рывка:
+    # нарастание ускорения, постоянное ускорение, спад ускорения
+    if speed * jerk >= accel * accel:
+        t_jerk = accel / jerk
+        t_const = speed / accel - t_jerk
+    else:
+        t_jerk = math.sqrt(speed / jerk)
+        t_const = 0.0
+    t_acc = 2 * t_jerk + t_const
+    # Профиль скорости симметричен относительно середины разгона
+    return t_jerk, t_const, t_acc, speed * t_acc / 2
+
+
+def _scurve_position(t, t_jerk, t_const, jerk):
+    # Путь, пройденный за время t от начала разгона
+    a_peak = jerk * t_jerk
+    if t < t_jerk:
+        return jerk * t ** 3 / 6
+    v1 = jerk * t_jerk ** 2 / 2
+    s1 = jerk * t_jerk ** 3 / 6
+    if t < t_jerk + t_const:
+        tau = t - t_jerk
+        return s1 + v1 * tau + a_peak * tau * tau / 2
+    v2 = v1 + a_peak * t_const
+    s2 = s1 + v1 * t_const + a_peak * t_const ** 2 / 2
+    tau = min(t - t_jerk - t_const, t_jerk)
+    return s2 + v2 * tau + a_peak * tau * tau / 2 - jerk * tau ** 3 / 6
+
+
+def _scurve_positions(t, t_jerk, t_const, jerk):
+    # То же, что _scurve_position, для массива моментов времени (NumPy)
+    a_peak = jerk * t_jerk
+    v1 = jerk * t_jerk ** 2 / 2
+    s1 = jerk * t_jerk ** 3 / 6
+    v2 = v1 + a_peak * t_const
+    s2 = s1 + v1 * t_const + a_peak * t_const ** 2 / 2
+    tau = t - t_jerk
+    tail = np.minimum(tau - t_const, t_jerk)
+    return np.where(
+        t < t_jerk,
+        jerk * t ** 3 / 6,
+        np.where(
+            t < t_jerk + t_const,
+            s1 + v1 * tau + a_peak * tau * tau / 2,
+            s2 + v2 * tail + a_peak * tail * tail / 2 - jerk * tail ** 3 / 6,
+        ),
+    )
+
+
+def _scurve_times(steps, max_speed, accel, jerk):
+    # Профиль из семи участков. Если разгон и торможение не помещаются в
+    # дистанцию, пиковая скорость подбирается бисекцией.
+    speed = max_speed
+    t_jerk, t_const, t_acc, s_acc = _scurve_phases(speed, accel, jerk)
+    if 2 * s_acc > steps:
+        low, high = 0.0, max_speed
+        for _ in range(60):
+            speed = (low + high) / 2
+            if 2 * _scurve_phases(speed, accel, jerk)[3] > steps:
+                high = speed
+            else:
+                low = speed
+        speed = low
+        t_jerk, t_const, t_acc, s_acc = _scurve_phases(speed, accel, jerk)
+
+    t_cruise = max(steps - 2 * s_acc, 0.0) / speed
+    total = 2 * t_acc + t_cruise
+
+    # Сетка s(t) для обращения участка разгона (торможение - зеркально)
+    grid_size = min(SCURVE_GRID, 8 * int(s_acc) + 64)
+
+    if np is not None:
+        grid_t = np.linspace(0.0, t_acc, grid_size)
+        grid_s = _scurve_positions(grid_t, t_jerk, t_const, jerk)
+        grid_s[-1] = s_acc
+        s = np.arange(1, steps + 1, dtype=np.float64)
+        times = np.where(
+            s <= s_acc,
+            np.interp(s, grid_s, grid_t),
+            np.where(
+                s <= steps - s_acc,
+                t_acc + (s - s_acc) / speed,
+                total - np.interp(np.maximum(steps - s, 0.0), grid_s, grid_t),
+            ),
+        )
+        return times, speed
+
+    grid_t = [t_acc * i / (grid_size - 1) for i in range(grid_size)]
+    grid_s = [_scurve_position(t, t_jerk, t_const, jerk) for t in grid_t]
+    grid_s[-1] = s_acc
+
+    def invert(distance):
+        i = bisect_left(grid_s, distance)
+        if i <= 0:
+            return 0.0
+        if i >= grid_size:
+            return t_acc
+        s_lo, s_hi = grid_s[i - 1], grid_s[i]
+        t_lo, t_hi = grid_t[i - 1], grid_t[i]
+        return t_lo + (distance - s_lo) * (t_hi - t_lo) / (s_hi - s_lo)
+
+    times = array("d", bytes(8 * steps))
+    for k in range(steps):
+        s = k + 1
+        if s <= s_acc:
+            times[k] = invert(s)
+        elif s <= steps - s_acc:
+            times[k] = t_acc + (s - s_acc) / speed
+        else:
+            times[k] = total - invert(steps - s)
+    return times, speed
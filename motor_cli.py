@@ -0,0 +1,205 @@
+# Командная строка без графического интерфейса: модули загружаются только
+# для выбранной команды, tkinter не импортируется (кроме команды gui)
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def add_motion_arguments(parser):
+    parser.add_argument("--axes", type=int, default=1, help="число осей (двигателей)")
+    parser.add_argument("--axis", type=int, default=1, help="ось задания (с 1)")
+    parser.add_argument("--speed", type=float, default=1000, help="максимальная скорость, шаг/с")
+    parser.add_argument("--acceleration", type=float, help="ускорение, шаг/с²")
+    parser.add_argument("--step-mode", type=float, default=1, choices=(1, 0.5, 0.25, 0.125),
+                        help="режим шага")
+    parser.add_argument("--device", action="append", default=[],
+                        help="последовательный порт драйвера; повторяется для следующих осей")
+
+
+def format_progress(progress, position):
+    fraction = progress["fraction"]
+    done = "-" if fraction is None else f"{fraction * 100:5.1f}%"
+    eta = "-" if progress["eta"] is None else f"{progress['eta']:.1f} с"
+    return (f"{done} строк {progress['lines']}, отрезков {progress['segments']}, "
+            f"позиция {position:g}, буфер {progress['buffer']}, осталось {eta}")
+
+
+def run_job(args):
+    from job_runner import JobRunner
+    from multi_axis import MultiAxisController
+
+    index = args.axis - 1
+    if not 0 <= index < args.axes:
+        raise SystemExit(f"Нет оси с номером {args.axis}")
+    controller = MultiAxisController(args.axes, speed=args.speed, step_mode=args.step_mode)
+    engine = controller.axis(index)
+    # В виртуальном времени кадры не отбрасываются: двигатель ждет места в буфере
+    outputs = attach_outputs(controller, args.device, blocking=args.simulate)
+    runner = JobRunner.from_file(engine, args.path, acceleration=args.acceleration,
+                                 submit=lambda name, *command_args: controller.submit(index, name, *command_args))
+    try:
+        if args.simulate:
+            # Виртуальное время: задание проходится без ожидания; часы
+            # продвигает контроллер, через который идут команды оси
+            progress = runner.simulate(advance=controller.simulate)
+        else:
+            controller.start_thread()
+            runner.start()
+            try:
+                while True:
+                    runner.join(args.interval)
+                    progress = runner.progress()
+                    if progress["done"]:
+                        break
+                    print(format_progress(progress, engine.snapshot.position), flush=True)
+            except KeyboardInterrupt:
+                runner.cancel()
+                progress = runner.progress()
+    finally:
+        controller.shutdown()
+        for backend in outputs:
+            backend.close()
+
+    if progress["error"] is not None:
+        print(f"Ошибка: {progress['error']}", file=sys.stderr)
+        return 1
+    state = "отменено" if progress["cancelled"] else "выполнено"
+    print(f"Задание {state}: {progress['lines']} строк, {progress['segments']} отрезков, "
+          f"позиция {engine.snapshot.position:g}, {progress['elapsed']:.2f} с")
+    if progress["starved"]:
+        print(f"Буфер отрезков опустошался {progress['starved']} раз")
+    return 0
+
+
+def attach_outputs(controller, devices, blocking=False):
+    # Выход шагов на драйверы: порт на ось, по порядку
+    outputs = []
+    if devices:
+        from step_output import SerialBackend
+        for index, path in enumerate(devices[:len(controller)]):
+            backend = SerialBackend(path, axis=index, blocking=blocking)
+            controller.axis(index).output = backend
+            outputs.append(backend)
+    return outputs
+
+
+def run_replay(args):
+    from telemetry_log import LogReplayer, StepLog
+
+    with StepLog(args.path) as log:
+        replayer = LogReplayer(log, speed=args.speed)
+        first, last = log[0], log[len(log) - 1]
+        print(f"Записей: {len(log)}, длительность {replayer.duration:.3f} с, "
+              f"позиция {first[1]:g} -> {last[1]:g}")
+        if args.summary:
+            return 0
+
+        # Состояние печатается с частотой rate; строка - только при изменении
+        interval = 1.0 / args.rate
+        replayer.start(time.perf_counter())
+        shown = None
+        try:
+            while True:
+                now = time.perf_counter()
+                snapshot = replayer.snapshot_at(now)
+                if snapshot.version != shown:
+                    shown = snapshot.version
+                    print(f"{snapshot.time - replayer.first_time:10.3f} с  позиция {snapshot.position:10g}  "
+                          f"скорость {snapshot.rate:+8g}", flush=True)
+                if replayer.finished(now):
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def run_startup(args):
+    # Холодный старт интерфейса в отдельных процессах: от запуска
+    # интерпретатора до первого отрисованного кадра
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dvigatel.py")
+    command = [sys.executable, script, "--startup-report", "--exit-after-startup",
+               "--axes", str(args.axes)]
+    runs = []
+    for run in range(args.runs):
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        line = process.stdout.readline()
+        total = time.perf_counter() - start
+        _, errors = process.communicate()
+        if process.returncode or not line:
+            message = errors.strip().splitlines()[-1] if errors.strip() else process.returncode
+            print(f"Интерфейс не запустился: {message}", file=sys.stderr)
+            return 1
+        report = json.loads(line)
+        report["process_ms"] = total * 1000
+        runs.append(report)
+        print(f"Запуск {run + 1}: процесс до кадра {report['process_ms']:.0f} мс, "
+              f"модуль до кадра {report['first_frame_ms']:.0f} мс, "
+              f"панели {report['panels_ms']:.0f} мс")
+
+    summary = {name: {"min": min(run[name] for run in runs),
+                      "median": statistics.median(run[name] for run in runs)}
+               for name in ("process_ms", "first_frame_ms", "panels_ms")}
+    print(f"Медиана: процесс до кадра {summary['process_ms']['median']:.0f} мс, "
+          f"минимум {summary['process_ms']['min']:.0f} мс")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"runs": runs, "summary": summary}, file, indent=2)
+    return 0
+
+
+# Команды, у которых есть свой разбор аргументов: модуль и функция main
+DELEGATED = {
+    "server": ("control_server", "сервер управления (JSON lines)"),
+    "bench": ("benchmark", "замеры производительности"),
+    "sweep": ("motor_physics", "перебор параметров на физической модели"),
+    "device": ("step_output", "эмулятор драйвера на псевдотерминале"),
+    "gui": ("dvigatel", "графический интерфейс"),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in DELEGATED:
+        # Остальные аргументы разбирает сам модуль
+        module = __import__(DELEGATED[argv[0]][0])
+        return module.main(argv[1:])
+
+    parser = argparse.ArgumentParser(description="Управление шаговыми двигателями без графического интерфейса")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    job = commands.add_parser("job", help="выполнить задание (G-code или JSON lines)")
+    job.add_argument("path")
+    add_motion_arguments(job)
+    job.add_argument("--simulate", action="store_true", help="в виртуальном времени, без ожидания")
+    job.add_argument("--interval", type=float, default=1.0, help="период вывода прогресса, сек")
+    job.set_defaults(handler=run_job)
+
+    replay = commands.add_parser("replay", help="воспроизвести журнал шагов")
+    replay.add_argument("path")
+    replay.add_argument("--speed", type=float, default=1.0, help="ускорение воспроизведения")
+    replay.add_argument("--rate", type=float, default=10.0, help="строк состояния в секунду")
+    replay.add_argument("--summary", action="store_true", help="только сводка журнала")
+    replay.set_defaults(handler=run_replay)
+
+    startup = commands.add_parser("startup", help="время холодного старта интерфейса")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--axes", type=int, default=1)
+    startup.add_argument("--output", help="файл результатов в JSON")
+    startup.set_defaults(handler=run_startup)
+
+    for name, (_, title) in DELEGATED.items():
+        # Только для справки: аргументы этих команд разбираются их модулями
+        commands.add_parser(name, help=title, add_help=False)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,664 @@
+import threading
+import time
+from bisect import bisect_right
+from collections import deque, namedtuple
+
+from instrumentation import LatencyTracker
+from motion_planner import PROFILE_KINDS, MotionProfile, ProfileCache
+
+
+# Микрошагов в полном шаге: позиция хранится целым числом микрошагов,
+# поэтому режимы 1/2, 1/4 и 1/8 не накапливают ошибку округления
+MICROSTEPS = 8
+
+STEP_MODES = (1, 0.5, 0.25, 0.125)
+
+
+def to_steps(microsteps):
+    # Перевод микрошагов в шаги (целое, если шаг полный)
+    if microsteps % MICROSTEPS == 0:
+        return microsteps // MICROSTEPS
+    return microsteps / MICROSTEPS
+
+
+class MotionState:
+    # Компактная запись состояния движения. Изменяется только в потоке
+    # двигателя; другие потоки читают опубликованные снимки MotionSnapshot.
+
+    __slots__ = ("running", "position", "target", "speed", "direction",
+                 "step_mode", "pulse", "step_counter", "rate", "time")
+
+    def __init__(self, speed, direction, step_mode):
+        self.running = False
+        self.position = 0  # микрошагов
+        self.target = 0  # микрошагов
+        self.speed = speed  # шагов в секунду
+        self.direction = direction  # 1 - вперед, -1 - назад
+        self.step_mode = step_mode  # Режим шага (1, 1/2, 1/4, 1/8)
+        self.pulse = int(step_mode * MICROSTEPS)  # микрошагов за один шаг
+        self.step_counter = 0
+        self.rate = 0.0  # фактическая частота шагов со знаком направления
+        self.time = 0.0  # момент последнего обслуживания (часы планировщика)
+
+
+class MotionSnapshot(namedtuple("MotionSnapshot", (
+        "version", "position_micro", "target_micro", "running", "moving",
+        "speed", "direction", "step_mode", "step_counter", "rate", "time"))):
+    # Неизменяемый снимок состояния. Публикуется заменой одной ссылки,
+    # поэтому читается из потока интерфейса без блокировок.
+
+    __slots__ = ()
+
+    @property
+    def position(self):
+        return to_steps(self.position_micro)
+
+    @property
+    def target(self):
+        return to_steps(self.target_micro)
+
+
+class MotorCommand:
+    # Команда для ядра двигателя с отметками времени постановки и применения
+
+    __slots__ = ("name", "args", "enqueued_at", "applied_at", "result", "error", "_done")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.enqueued_at = time.perf_counter()
+        self.applied_at = None
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def latency(self):
+        # Задержка от постановки команды до ее применения (сек)
+        if self.applied_at is None:
+            return None
+        return self.applied_at - self.enqueued_at
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def __repr__(self):
+        return f"MotorCommand({self.name!r}, {self.args!r})"
+
+
+class StepperEngine:
+    # Ядро шагового двигателя без зависимости от Tkinter: хранит состояние
+    # движения и генерирует шаги. Интерфейс подписывается через add_listener
+    # и управляет двигателем командами через submit.
+
+    # Команды, принимаемые через submit, и соответствующие методы
+    COMMANDS = {
+        "start": "start",
+        "stop": "stop",
+        "reset": "reset",
+        "move_to": "move_to",
+        "set_speed": "set_speed",
+        "set_direction": "set_direction",
+        "set_step_mode": "set_step_mode",
+        "set_acceleration": "set_acceleration",
+        "set_profile_kind": "set_profile_kind",
+        "queue_move": "queue_move",
+        "clear_queue": "clear_queue",
+    }
+
+    # Максимум шагов, выдаваемых одной догоняющей пачкой
+    max_batch = 256
+    # Если отставание больше этого значения (сек), сетка дедлайнов сдвигается
+    max_lag = 0.25
+
+    def __init__(self, speed=10, direction=1, step_mode=1, profile_cache=None):
+        # Состояние движения и последний опубликованный снимок
+        self.state = MotionState(speed, direction, step_mode)
+        self._version = 0
+        self.snapshot = None
+
+        # Виртуальные часы пакетной симуляции продолжаются между вызовами simulate;
+        # после simulate дедлайны отсчитываются по ним, пока не запущен поток
+        self.virtual_clock = 0.0
+        self._virtual = False
+
+        # Параметры планировщика перемещений
+        self.acceleration = 200.0  # шагов/с²
+        self.jerk = None  # шагов/с³, None - 10 * ускорение
+        self.profile_kind = "trapezoid"
+        # Рассчитанные профили повторяющихся перемещений (оси контроллера - общий кэш)
+        self.profile_cache = ProfileCache() if profile_cache is None else profile_cache
+
+        # Текущее перемещение: профиль, индекс следующего шага, время начала
+        # и пауза перед первым шагом
+        self._profile = None
+        self._move_index = 0
+        self._move_start = None
+        self._pending_dwell = 0.0
+
+        # Очередь заранее спланированных отрезков (профиль, цель, пауза перед ним):
+        # следующий отрезок начинается точно в момент последнего шага предыдущего
+        self._segments = deque()
+        self.completed_segments = 0
+        self.dropped_segments = 0
+        # Отрезки, завершившиеся с ненулевой скоростью при пустой очереди
+        self.starved_segments = 0
+
+        # Планировщик: дедлайн k-го шага = _anchor_time + k * интервал,
+        # поэтому ошибка не накапливается от шага к шагу
+        self._anchor_time = None
+        self._anchor_steps = 0
+        self._next_deadline = None
+
+        # Статистика планировщика
+        self.catchup_batches = 0
+        self.skipped_steps = 0
+        # Гистограмма опоздания шагов относительно дедлайна (None - не измеряется)
+        self.lateness = None
+        # Выход шагов на драйвер (OutputBackend из step_output, None - без выхода)
+        self.output = None
+
+        # Подписчики на события шага
+        self.listeners = []
+
+        # Канал команд: поток двигателя будится при каждой новой команде
+        self._commands = deque()
+        self.command_listeners = []
+        self.command_latency = LatencyTracker()
+
+        # Поток реального времени
+        self._cond = threading.Condition()
+        self._thread = None
+        self._alive = False
+
+        self._publish()
+
+    # Свойства только для чтения; изменение состояния - через submit
+
+    @property
+    def motor_running(self):
+        return self.state.running
+
+    @property
+    def current_position(self):
+        return to_steps(self.state.position)
+
+    @property
+    def target_position(self):
+        return to_steps(self.state.target)
+
+    @property
+    def motor_speed(self):
+        return self.state.speed
+
+    @property
+    def motor_direction(self):
+        return self.state.direction
+
+    @property
+    def step_mode(self):
+        return self.state.step_mode
+
+    @property
+    def step_counter(self):
+        return self.state.step_counter
+
+    def _publish(self):
+        # Публикация нового неизменяемого снимка (атомарная замена ссылки)
+        state = self.state
+        self._version += 1
+        self.snapshot = MotionSnapshot(self._version, state.position, state.target, state.running,
+                                       self._profile is not None, state.speed, state.direction,
+                                       state.step_mode, state.step_counter,
+                                       state.rate if state.running else 0.0, state.time)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def submit(self, name, *args):
+        # Передача команды ядру. Если поток реального времени работает, команда
+        # будит его (в том числе посреди ожидания дедлайна шага), иначе
+        # применяется сразу в вызывающем потоке.
+        if name not in self.COMMANDS:
+            raise ValueError(f"Неизвестная команда: {name}")
+        command = MotorCommand(name, args)
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                self._commands.append(command)
+                self._cond.notify()
+                return command
+            self._apply_command(command)
+        self._notify_command_listeners(command)
+        return command
+
+    def _apply_command(self, command):
+        # Вызывается под self._cond в потоке двигателя
+        try:
+            command.result = getattr(self, self.COMMANDS[command.name])(*command.args)
+        except Exception as error:
+            command.error = error
+        self._publish()
+        command.applied_at = time.perf_counter()
+        self.command_latency.record(command.applied_at - command.enqueued_at)
+        command._done.set()
+
+    def _drain_commands(self):
+        applied = []
+        commands = self._commands
+        while commands:
+            command = commands.popleft()
+            self._apply_command(command)
+            applied.append(command)
+        return applied
+
+    def _notify_command_listeners(self, command):
+        for callback in self.command_listeners:
+            callback(command)
+
+    def start(self):
+        # Непрерывное вращение с постоянной скоростью; отменяет перемещение
+        with self._cond:
+            if not self.state.running or self._profile is not None:
+                self.state.running = True
+                self._drop_segments()
+                self._profile = None
+                self._anchor_time = None
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self.state.running = False
+            self._drop_segments()
+            self._profile = None
+            self._anchor_time = None
+            self._next_deadline = None
+            self._cond.notify()
+
+    def set_speed(self, speed):
+        if speed <= 0:
+            raise ValueError("Скорость должна быть положительной")
+        with self._cond:
+            if speed != self.state.speed:
+                self.state.speed = speed
+                self._rebase()
+            self._cond.notify()
+
+    def set_direction(self, direction):
+        if direction not in (1, -1):
+            raise ValueError("Направление должно быть 1 или -1")
+        with self._cond:
+            self.state.direction = direction
+
+    def set_step_mode(self, step_mode):
+        if step_mode not in STEP_MODES:
+            raise ValueError("Недопустимый режим шага")
+        with self._cond:
+            self.state.step_mode = step_mode
+            self.state.pulse = int(step_mode * MICROSTEPS)
+
+    def set_acceleration(self, acceleration):
+        if acceleration <= 0:
+            raise ValueError("Ускорение должно быть положительным")
+        with self._cond:
+            self.acceleration = acceleration
+
+    def set_profile_kind(self, kind):
+        if kind not in PROFILE_KINDS:
+            raise ValueError(f"Неизвестный тип профиля: {kind}")
+        with self._cond:
+            self.profile_kind = kind
+
+    def move_to(self, target):
+        # Перемещение в позицию target по профилю разгон/движение/торможение.
+        # Таблица времени шагов рассчитывается целиком до начала движения.
+        state = self.state
+        target_micro = round(target * MICROSTEPS)
+        with self._cond:
+            distance = round((target_micro - state.position) / state.pulse)
+            profile = self.profile_cache.plan(distance, state.speed, self.acceleration,
+                                              kind=self.profile_kind, jerk=self.jerk)
+            # Цель - на сетке шагов текущего режима, там, где движение закончится
+            state.target = state.position + distance * state.pulse
+            self._drop_segments()
+            self._start_profile(profile)
+            return profile
+
+    def queue_move(self, profile, target, dwell=0.0):
+        # Добавление спланированного отрезка в очередь. profile рассчитан в
+        # шагах текущего режима; target - позиция (в шагах) в конце отрезка,
+        # dwell - пауза (сек) перед началом отрезка.
+        if dwell < 0:
+            raise ValueError("Пауза не может быть отрицательной")
+        state = self.state
+        with self._cond:
+            if state.running and self._profile is None:
+                raise ValueError("Двигатель вращается непрерывно: сначала остановите его")
+            target_micro = round(target * MICROSTEPS)
+            if not profile.steps and dwell:
+                # Пауза без перемещения - отрезок без шагов длительностью
+                # паузы, иначе она терялась бы в конце очереди
+                profile = MotionProfile(profile.direction, profile.times, profile.intervals,
+                                        profile.kind, 0.0, duration=profile.duration + dwell)
+                dwell = 0.0
+            if self._profile is not None:
+                self._segments.append((profile, target_micro, dwell))
+            elif profile.steps or profile.duration:
+                state.target = target_micro
+                self._start_profile(profile)
+                self._pending_dwell = dwell
+            else:
+                # Пустой отрезок при простое завершается сразу
+                state.target = target_micro
+                self.completed_segments += 1
+            return len(self._segments)
+
+    def clear_queue(self):
+        # Отмена еще не начатых отрезков; текущий доводится до конца
+        with self._cond:
+            return self._drop_segments(keep_current=True)
+
+    def _drop_segments(self, keep_current=False):
+        # Учет отмененных отрезков (очереди и, если не keep_current, текущего),
+        # чтобы исполнитель задания видел прерывание
+        dropped = len(self._segments)
+        if not keep_current and self._profile is not None:
+            dropped += 1
+        self._segments.clear()
+        self.dropped_segments += dropped
+        return dropped
+
+    @property
+    def queued_segments(self):
+        return len(self._segments)
+
+    def queue_end_time(self, now):
+        # Момент окончания текущего отрезка и всей очереди (часы планировщика);
+        # при простое - now. Вызывается под self._cond.
+        if self._profile is None:
+            return now
+        start = self._move_start
+        if start is None:
+            start = now + self._pending_dwell
+        end = start + self._profile.duration
+        for profile, _, dwell in self._segments:
+            # Тот же порядок сложений, что в _next_segment
+            end += dwell
+            end += profile.duration
+        return end
+
+    def _start_profile(self, profile):
+        self._anchor_time = None
+        if profile.steps == 0 and not profile.duration:
+            self.state.running = False
+            self._profile = None
+            self._next_deadline = None
+            return
+        self._profile = profile
+        self._move_index = 0
+        self._move_start = None
+        self._pending_dwell = 0.0
+        self.state.running = True
+        self._cond.notify()
+
+    def reset(self):
+        with self._cond:
+            self.state.running = False
+            self._drop_segments()
+            self._profile = None
+            self._anchor_time = None
+            self._next_deadline = None
+            self.state.position = 0
+            self.state.target = 0
+
+    def _rebase(self):
+        # Новая скорость отсчитывается от момента последнего шага
+        if self._anchor_time is None:
+            return
+        last_step_time = self._next_deadline - 1.0 / self._anchor_speed
+        self._anchor_time = last_step_time
+        self._anchor_steps = 0
+        self._anchor_speed = self.state.speed
+        self._next_deadline = last_step_time + 1.0 / self.state.speed
+
+    def service(self, now):
+        # Выполнение всех шагов, срок которых наступил к моменту now.
+        # Возвращает число выполненных шагов. Вызывается под self._cond.
+        state = self.state
+        if not state.running:
+            return 0
+        if self._profile is not None:
+            return self._service_profile(now)
+
+        speed = state.speed
+        if self._anchor_time is None:
+            self._anchor_time = now
+            self._anchor_steps = 0
+            self._anchor_speed = speed
+            self._next_deadline = now + 1.0 / speed
+            return 0
+
+        if now < self._next_deadline:
+            return 0
+        if self.lateness is not None:
+            self.lateness.record(now - self._next_deadline)
+
+        due = int((now - self._next_deadline) * speed) + 1
+        if due > 1:
+            self.catchup_batches += 1
+            if now - self._next_deadline > self.max_lag:
+                # Слишком большое отставание: пропускаем шаги и сдвигаем сетку
+                self.skipped_steps += due - 1
+                self._anchor_time = now - 1.0 / speed
+                self._anchor_steps = 0
+                self._anchor_speed = speed
+                due = 1
+        due = min(due, self.max_batch)
+
+        state.position += state.pulse * state.direction * due
+        state.step_counter += due
+        state.rate = speed * state.direction
+        state.time = now
+        self._anchor_steps += due
+        if self.output is not None:
+            self.output.steps(state.direction, due, self._anchor_time + self._anchor_steps / speed,
+                              1.0 / speed)
+        self._next_deadline = self._anchor_time + (self._anchor_steps + 1) / speed
+        self._publish()
+        return due
+
+    def _service_profile(self, now):
+        # Проход по заранее рассчитанной таблице времени шагов
+        profile = self._profile
+        times = profile.times
+        index = self._move_index
+        if self._move_start is None:
+            self._move_start = now + self._pending_dwell
+            self._next_deadline = self._move_start + (times[0] if profile.steps else profile.duration)
+            return 0
+
+        if now < self._next_deadline:
+            return 0
+        if not profile.steps:
+            # Отрезок без шагов (ось группы стоит, пока движутся другие):
+            # только выдержка времени до конца отрезка
+            self.state.rate = 0.0
+            self.state.time = now
+            self._finish_segment(profile)
+            self._publish()
+            return 0
+        # Сравнение с дедлайном, а не с elapsed: при сдвинутом начале отрезка
+        # разность now - _move_start может оказаться на ulp меньше times[index]
+        elapsed = max(now - self._move_start, times[index])
+        if self.lateness is not None:
+            self.lateness.record(elapsed - times[index])
+        if elapsed - times[index] > self.max_lag:
+            # Перемещение нельзя укоротить: сдвигаем начало, а не пропускаем шаги
+            self._move_start = now - times[index]
+            elapsed = times[index]
+            self.catchup_batches += 1
+
+        end = bisect_right(times, elapsed, index, min(index + self.max_batch, profile.steps))
+        due = end - index
+        if due > 1:
+            self.catchup_batches += 1
+
+        state = self.state
+        state.position += state.pulse * profile.direction * due
+        state.step_counter += due
+        state.rate = profile.direction / float(profile.intervals[end - 1])
+        state.time = now
+        self._move_index = end
+        if self.output is not None:
+            self.output.steps(profile.direction, due, self._move_start + float(times[end - 1]),
+                              float(profile.intervals[end - 1]))
+
+        if end >= profile.steps:
+            self._finish_segment(profile)
+        else:
+            self._next_deadline = self._move_start + times[end]
+        self._publish()
+        return due
+
+    def _finish_segment(self, profile):
+        self.completed_segments += 1
+        if self._segments:
+            self._next_segment(self._move_start + profile.duration)
+        else:
+            # Перемещение завершено: двигатель остановлен в целевой позиции
+            if profile.end_speed > 0:
+                self.starved_segments += 1
+            self._profile = None
+            self.state.running = False
+            self._next_deadline = None
+
+    def _next_segment(self, end_time):
+        # Переход к следующему отрезку очереди без остановки: отсчет времени
+        # шагов продолжается от момента последнего шага предыдущего отрезка
+        segments = self._segments
+        while segments:
+            profile, target, dwell = segments.popleft()
+            self.state.target = target
+            end_time += dwell
+            if profile.steps or profile.duration:
+                self._profile = profile
+                self._move_index = 0
+                self._move_start = end_time
+                self._next_deadline = end_time + (profile.times[0] if profile.steps else profile.duration)
+                return
+            self.completed_segments += 1
+        self._profile = None
+        self.state.running = False
+        self._next_deadline = None
+
+    def _shift(self, offset):
+        # Сдвиг всех дедлайнов на offset (перенос на другие часы без потери фазы)
+        if self._move_start is not None:
+            self._move_start += offset
+        if self._next_deadline is not None:
+            self._next_deadline += offset
+        if self._anchor_time is not None:
+            self._anchor_time += offset
+        if self.output is not None:
+            self.output.shift(offset)
+
+    def next_deadline(self):
+        # Момент следующего шага или None, если двигатель остановлен
+        if not self.state.running:
+            return None
+        return self._next_deadline
+
+    def _notify_listeners(self):
+        for callback in self.listeners:
+            callback(self)
+
+    def run(self):
+        # Цикл реального времени (выполняется в отдельном потоке): спит точно
+        # до дедлайна следующего шага, при остановке ждет команду без опроса
+        cond = self._cond
+        while self._alive:
+            applied = None
+            with cond:
+                if self._commands:
+                    applied = self._drain_commands()
+                steps = self.service(time.perf_counter())
+                if not steps and applied is None:
+                    deadline = self.next_deadline()
+                    if deadline is None:
+                        cond.wait()
+                    else:
+                        timeout = deadline - time.perf_counter()
+                        if timeout > 0:
+                            cond.wait(timeout)
+                    continue
+            if applied:
+                for command in applied:
+                    self._notify_command_listeners(command)
+            if steps:
+                self._notify_listeners()
+
+    def start_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._virtual:
+                self._shift(time.perf_counter() - self.virtual_clock)
+                self._virtual = False
+        self._alive = True
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        with self._cond:
+            self._alive = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def simulate(self, duration=None, max_steps=None):
+        # Пакетная симуляция в виртуальном времени: без sleep, с максимальной
+        # скоростью. Останавливается по истечении duration виртуальных секунд,
+        # после max_steps шагов или когда двигатель остановлен.
+        if duration is None and max_steps is None:
+            raise ValueError("Нужно задать duration или max_steps")
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("Симуляция недоступна при работающем потоке реального времени")
+
+        wall_start = time.perf_counter()
+        start_time = virtual_time = self.virtual_clock
+        end_time = None if duration is None else start_time + duration
+
+        # Потока реального времени нет, поэтому блокировка берется один раз
+        with self._cond:
+            # Перенос дедлайнов на виртуальные часы - только при смене часов;
+            # между вызовами они продолжаются, поэтому симуляция частями
+            # совпадает с симуляцией одним вызовом
+            if not self._virtual:
+                self._shift(virtual_time - time.perf_counter())
+                self._virtual = True
+            steps = self.service(virtual_time)
+
+            while True:
+                if max_steps is not None and steps >= max_steps:
+                    break
+                deadline = self.next_deadline()
+                if deadline is None:
+                    break
+                if end_time is not None and deadline > end_time:
+                    virtual_time = end_time
+                    break
+                virtual_time = float(deadline)
+                steps += self.service(virtual_time)
+                self._notify_listeners()
+            self.virtual_clock = virtual_time
+
+        return {
+            "steps": steps,
+            "virtual_time": virtual_time - start_time,
+            "position": self.current_position,
+            "wall_time": time.perf_counter() - wall_start,
+        }
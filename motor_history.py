@@ -0,0 +1,230 @@
+from array import array
+from bisect import bisect_left
+
+
+class RingBuffer:
+    # Кольцевой буфер фиксированной емкости на основе array('d'):
+    # добавление O(1) без сдвига элементов, как было у list.pop(0)
+
+    def __init__(self, capacity):
+        if capacity < 2:
+            raise ValueError("Емкость буфера должна быть не меньше 2")
+        self.capacity = capacity
+        self._data = array("d", bytes(8 * capacity))
+        self._head = 0  # индекс следующей записи
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        self._data[self._head] = value
+        self._head += 1
+        if self._head == self.capacity:
+            self._head = 0
+        if self._size < self.capacity:
+            self._size += 1
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def values(self):
+        # Значения в порядке поступления (от старых к новым)
+        if self._size < self.capacity:
+            return self._data[:self._size]
+        return self._data[self._head:] + self._data[:self._head]
+
+
+class _HistoryLevel:
+    # Один уровень пирамиды: завершенные корзины (время начала, минимум,
+    # максимум) и открытая корзина, в которую добавляются новые отсчеты
+
+    def __init__(self, samples_per_bucket):
+        self.samples_per_bucket = samples_per_bucket
+        self.times = array("d")
+        self.lows = array("d")
+        self.highs = array("d")
+        self.open_time = None
+        self.open_low = 0.0
+        self.open_high = 0.0
+        self.open_count = 0
+
+    def __len__(self):
+        return len(self.times) + (1 if self.open_count else 0)
+
+    def oldest(self):
+        if self.times:
+            return self.times[0]
+        return self.open_time if self.open_count else None
+
+    def add(self, time, value):
+        if not self.open_count:
+            self.open_time = time
+            self.open_low = self.open_high = value
+        elif value < self.open_low:
+            self.open_low = value
+        elif value > self.open_high:
+            self.open_high = value
+        self.open_count += 1
+        if self.open_count == self.samples_per_bucket:
+            self.times.append(self.open_time)
+            self.lows.append(self.open_low)
+            self.highs.append(self.open_high)
+            self.open_count = 0
+
+    def trim(self, count):
+        # Удаление count самых старых корзин
+        del self.times[:count]
+        del self.lows[:count]
+        del self.highs[:count]
+
+    def clear(self):
+        self.trim(len(self.times))
+        self.open_count = 0
+
+
+class PositionHistory:
+    # Длинная история позиции в виде пирамиды min/max. Уровень 0 хранит
+    # отсчеты, корзина уровня k - fanout**k отсчетов. Каждый отсчет обновляет
+    # открытые корзины всех уровней, поэтому пирамида строится по мере
+    # поступления данных. Любой масштаб рисуется с уровня, где на видимый
+    # интервал приходится не больше двух корзин на столбец пикселей.
+    #
+    # Хранение: на каждом уровне не больше capacity корзин (мелкие уровни
+    # хранят недавнее прошлое подробно, крупные - часы и дни грубо), а при
+    # заданном max_age (сек) более старые корзины удаляются.
+
+    def __init__(self, capacity=4096, fanout=8, levels=6, max_age=None):
+        if capacity < 2 or fanout < 2 or levels < 1:
+            raise ValueError("Емкость и коэффициент уровней должны быть не меньше 2, уровней - не меньше 1")
+        if max_age is not None and max_age <= 0:
+            raise ValueError("Срок хранения должен быть положительным")
+        self.capacity = capacity
+        self.fanout = fanout
+        self.max_age = max_age
+        self.levels = [_HistoryLevel(fanout ** k) for k in range(levels)]
+        # Удаление пачками по четверти емкости: del по срезу реже сдвигает массив
+        self._slack = max(1, capacity // 4)
+        self.count = 0
+        self.last_time = None
+        self.last_value = None
+
+    def __len__(self):
+        return self.count
+
+    def append(self, time, value):
+        if self.last_time is not None and time < self.last_time:
+            time = self.last_time
+        self.last_time = time
+        self.last_value = value
+        self.count += 1
+        limit = self.capacity + self._slack
+        for level in self.levels:
+            level.add(time, value)
+            if len(level.times) > limit:
+                level.trim(len(level.times) - self.capacity)
+        if self.max_age is not None and self.count % 64 == 0:
+            self._expire(time - self.max_age)
+
+    def _expire(self, oldest):
+        # Проверка раз в 64 отсчета: старые корзины удаляются пачкой
+        for level in self.levels:
+            times = level.times
+            if times and times[0] < oldest:
+                level.trim(bisect_left(times, oldest))
+
+    def clear(self, time=None, fill=None):
+        for level in self.levels:
+            level.clear()
+        self.count = 0
+        self.last_time = None
+        self.last_value = None
+        if time is not None and fill is not None:
+            self.append(time, fill)
+
+    def last(self):
+        if self.last_value is None:
+            raise IndexError("История пуста")
+        return self.last_value
+
+    def first_time(self):
+        # Время самого старого хранимого отсчета (по всем уровням)
+        oldest = [level.oldest() for level in self.levels]
+        oldest = [time for time in oldest if time is not None]
+        if not oldest:
+            return None
+        if self.max_age is not None:
+            # Открытая корзина крупного уровня может начинаться раньше срока хранения
+            return max(min(oldest), self.last_time - self.max_age)
+        return min(oldest)
+
+    def memory(self):
+        # Байт в массивах всех уровней
+        return sum(3 * len(level.times) * level.times.itemsize for level in self.levels)
+
+    def _choose_level(self, start, end, limit):
+        # Самый подробный уровень, который хранит начало интервала и дает
+        # не больше limit корзин на интервале
+        first = self.first_time()
+        if first is None:
+            return None
+        start = max(start, first)
+        for level in self.levels:
+            oldest = level.oldest()
+            if oldest is None or oldest > start:
+                continue
+            times = level.times
+            count = bisect_left(times, end) - bisect_left(times, start)
+            if count <= limit:
+                return level
+        return self.levels[-1]
+
+    def columns(self, start, end, width):
+        # Минимум и максимум по столбцам пикселей интервала [start, end):
+        # список (столбец, минимум, максимум) по возрастанию столбца.
+        # Обрабатывается не больше 2 * width корзин, сколько бы ни было отсчетов.
+        if end <= start or width < 1:
+            return []
+        level = self._choose_level(start, end, 2 * width)
+        if level is None:
+            return []
+
+        times = level.times
+        lows = level.lows
+        highs = level.highs
+        # Корзина, начавшаяся до start, тоже попадает в первый столбец
+        first = max(0, bisect_left(times, start) - 1)
+        last = bisect_left(times, end)
+        scale = width / (end - start)
+        top = width - 1
+
+        columns = []
+        column = -1
+        low = high = 0.0
+        for index in range(first, last):
+            x = int((times[index] - start) * scale)
+            x = 0 if x < 0 else top if x > top else x
+            if x != column:
+                if column >= 0:
+                    columns.append((column, low, high))
+                column, low, high = x, lows[index], highs[index]
+            else:
+                if lows[index] < low:
+                    low = lows[index]
+                if highs[index] > high:
+                    high = highs[index]
+
+        # Открытая корзина уровня - самые свежие отсчеты
+        if level.open_count and level.open_time < end:
+            x = max(0, min(top, int((level.open_time - start) * scale)))
+            if x == column:
+                low = min(low, level.open_low)
+                high = max(high, level.open_high)
+            else:
+                if column >= 0:
+                    columns.append((column, low, high))
+                column, low, high = x, level.open_low, level.open_high
+        if column >= 0:
+            columns.append((column, low, high))
+        return columns
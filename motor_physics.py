@@ -0,0 +1,437 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from motion_planner import np, plan_move
+from motor_engine import MICROSTEPS
+
+
+# Полных шагов на электрический период двухфазного гибридного двигателя:
+# момент фазы ~ sin(pi/2 * отставание в полных шагах)
+STEPS_PER_CYCLE = 4
+HALF_PI = math.pi / 2
+# Отставание (полных шагов), за которым ротор проскальзывает на период
+SLIP_LAG = STEPS_PER_CYCLE / 2
+
+# Интервал без команд, после которого ротор считается успокоившимся (сек)
+SETTLE_LIMIT = 1.0
+
+# Узлов сетки времени в одном блоке векторного расчета
+GRID_CHUNK = 1024
+
+# Точка перебора: параметры движения и результат модели. missed_steps и
+# max_lag - в полных шагах, slip_time - момент первого проскальзывания (сек)
+SweepPoint = namedtuple("SweepPoint", ("speed", "acceleration", "step_mode", "load",
+                                       "missed_steps", "max_lag", "slip_time"))
+
+
+class MotorParameters:
+    # Параметры двигателя и нагрузки в единицах СИ. Кривая момента от скорости:
+    # до corner_speed (полных шагов/с) доступен удерживающий момент, выше он
+    # падает обратно пропорционально скорости (ток не успевает нарасти).
+    # load_torque - момент сухого трения нагрузки, damping - вязкое трение
+    # и электрическое демпфирование (Н·м·с/рад).
+
+    def __init__(self, holding_torque=0.45, rotor_inertia=6.8e-6, load_inertia=0.0,
+                 load_torque=0.0, damping=5e-3, corner_speed=1000.0, full_steps=200):
+        if holding_torque <= 0 or corner_speed <= 0:
+            raise ValueError("Момент и угловая скорость излома должны быть положительными")
+        if rotor_inertia <= 0 or load_inertia < 0 or load_torque < 0 or damping < 0:
+            raise ValueError("Инерция должна быть положительной, нагрузка и трение - неотрицательными")
+        self.holding_torque = holding_torque
+        self.rotor_inertia = rotor_inertia
+        self.load_inertia = load_inertia
+        self.load_torque = load_torque
+        self.damping = damping
+        self.corner_speed = corner_speed
+        self.full_steps = full_steps
+        self.step_angle = 2 * math.pi / full_steps  # рад на полный шаг
+
+    def __repr__(self):
+        return (f"MotorParameters(holding_torque={self.holding_torque}, "
+                f"inertia={self.inertia}, load_torque={self.load_torque})")
+
+    @property
+    def inertia(self):
+        return self.rotor_inertia + self.load_inertia
+
+    def torque(self, speed):
+        # Доступный момент при скорости speed (полных шагов/с)
+        speed = abs(speed)
+        if speed <= self.corner_speed:
+            return self.holding_torque
+        return self.holding_torque * self.corner_speed / speed
+
+    def time_step(self):
+        # Шаг интегрирования - 1/40 периода собственных колебаний ротора
+        stiffness = self.holding_torque * HALF_PI / self.step_angle  # Н·м/рад
+        period = 2 * math.pi * math.sqrt(self.inertia / stiffness)
+        return min(period / 40, 1e-4)
+
+
+class RotorModel:
+    # Угол и скорость ротора в полных шагах против заданного угла (команды).
+    # Интегрирование полунеявным методом Эйлера с постоянным шагом dt.
+
+    def __init__(self, params, load_torque=None, angle=0.0, start_time=0.0):
+        self.params = params
+        self.load = params.load_torque if load_torque is None else load_torque
+        self.dt = params.time_step()
+        self.angle = angle
+        self.velocity = 0.0
+        self.command = angle
+        self.time = start_time
+        self.max_lag = 0.0
+        self.slip_time = None
+
+        # Постоянные уравнения движения в полных шагах
+        self._scale = 1.0 / (params.inertia * params.step_angle)
+        self._damping = params.damping * params.step_angle
+
+    @property
+    def lag(self):
+        return self.command - self.angle
+
+    @property
+    def missed_steps(self):
+        # Ротор успокаивается в положении равновесия, кратном периоду
+        return STEPS_PER_CYCLE * round(self.lag / STEPS_PER_CYCLE)
+
+    def set_command(self, angle):
+        self.command = angle
+
+    def advance(self, until):
+        # Интегрирование до момента until при неизменной команде
+        span = until - self.time
+        if span <= 0:
+            return
+        if span > SETTLE_LIMIT:
+            # Долгий интервал без команд: ротор успокаивается задолго до конца
+            self.time = until - SETTLE_LIMIT
+            span = SETTLE_LIMIT
+
+        params = self.params
+        holding = params.holding_torque
+        corner = params.corner_speed
+        load = self.load
+        scale = self._scale
+        damping = self._damping
+        command = self.command
+        angle = self.angle
+        velocity = self.velocity
+        max_lag = self.max_lag
+        dt = self.dt
+        t = self.time
+        sin = math.sin
+
+        while t < until:
+            h = min(dt, until - t)
+            lag = command - angle
+            speed = abs(velocity)
+            available = holding if speed <= corner else holding * corner / speed
+            drive = available * sin(HALF_PI * lag)
+            if velocity == 0.0 and abs(drive) <= load:
+                pass  # трение покоя удерживает ротор
+            else:
+                friction = load if (velocity if velocity else drive) > 0 else -load
+                accel = (drive - friction - damping * velocity) * scale
+                new_velocity = velocity + accel * h
+                if new_velocity * velocity < 0:
+                    new_velocity = 0.0  # остановка при смене направления
+                velocity = new_velocity
+                angle += velocity * h
+            t += h
+
+            if lag < 0:
+                lag = -lag
+            if lag > max_lag:
+                max_lag = lag
+                if lag > SLIP_LAG and self.slip_time is None:
+                    self.slip_time = t
+
+        self.angle = angle
+        self.velocity = velocity
+        self.max_lag = max_lag
+        self.time = t
+
+
+def simulate_profile(params, profile, step_mode=1, load_torque=None, settle=0.1):
+    # Прогон профиля перемещения через модель; возвращает RotorModel после
+    # успокоения ротора в течение settle секунд
+    model = RotorModel(params, load_torque)
+    full = step_mode * profile.direction
+    for count, step_time in enumerate(profile.times, 1):
+        model.advance(float(step_time))
+        model.set_command(count * full)
+    model.advance(profile.duration + settle)
+    return model
+
+
+class PhysicsMonitor:
+    # Динамическая модель, следящая за шагами двигателя. В потоке двигателя
+    # снимки только складываются в очередь; интегрирует вызывающий poll
+    # (например, такт отрисовки), поэтому модель не задерживает шаги.
+
+    def __init__(self, params=None, max_pending=100000):
+        self.params = params or MotorParameters()
+        self._pending = deque(maxlen=max_pending)
+        self.engine = None
+        self.model = None
+        self._last_counter = 0
+        self._last_position = 0
+
+    def attach(self, engine, now=None):
+        # now - момент начала по часам планировщика (см. StepRecorder.attach)
+        snapshot = engine.snapshot
+        start = snapshot.time if now is None else now
+        self.model = RotorModel(self.params, angle=snapshot.position_micro / MICROSTEPS,
+                                start_time=start)
+        self._last_counter = snapshot.step_counter
+        self._last_position = snapshot.position_micro
+        self.engine = engine
+        engine.add_listener(self.on_step)
+
+    def detach(self):
+        if self.engine is not None:
+            self.engine.remove_listener(self.on_step)
+            self.engine = None
+
+    def on_step(self, engine):
+        # Вызывается в потоке двигателя после каждой пачки шагов
+        self._pending.append(engine.snapshot)
+
+    def poll(self, now=None):
+        # Интегрирование накопленных шагов (и до момента now, если задан)
+        model = self.model
+        pending = self._pending
+        while pending:
+            snapshot = pending.popleft()
+            model.advance(snapshot.time)
+            # Команда смещается только на пройденные шаги: сброс позиции
+            # меняет отсчет, но не двигает ротор
+            steps = snapshot.step_counter - self._last_counter
+            moved = snapshot.position_micro - self._last_position
+            self._last_counter = snapshot.step_counter
+            self._last_position = snapshot.position_micro
+            if steps and abs(moved) <= steps * MICROSTEPS:
+                model.set_command(model.command + moved / MICROSTEPS)
+        if now is not None:
+            model.advance(now)
+        return model
+
+
+# Перебор параметров
+
+def _estimate_duration(combo, distance):
+    _, _, acceleration, speed = combo
+    return distance / speed + speed / acceleration
+
+
+def _plan(combo, distance):
+    _, _, acceleration, speed = combo
+    return plan_move(distance, speed, acceleration)
+
+
+def _simulate_scalar(params, combos, distance, settle):
+    points = []
+    for combo in combos:
+        step_mode, load, acceleration, speed = combo
+        model = simulate_profile(params, _plan(combo, distance), step_mode, load, settle)
+        points.append(SweepPoint(speed, acceleration, step_mode, load,
+                                 model.missed_steps, model.max_lag, model.slip_time))
+    return points
+
+
+def _simulate_vector(params, combos, distance, settle):
+    # Все сочетания пакета интегрируются одновременно, по элементу массива на
+    # сочетание. Заданный угол на сетке времени - число шагов профиля к
+    # моменту узла (searchsorted по таблице времени шагов).
+    profiles = [_plan(combo, distance) for combo in combos]
+    full = np.array([combo[0] for combo in combos])
+    load = np.array([float(combo[1]) for combo in combos])
+    dt = params.time_step()
+    total = max(profile.duration for profile in profiles) + settle
+    nodes = int(math.ceil(total / dt))
+
+    holding = params.holding_torque
+    corner = params.corner_speed
+    scale = 1.0 / (params.inertia * params.step_angle)
+    damping = params.damping * params.step_angle
+
+    size = len(combos)
+    angle = np.zeros(size)
+    velocity = np.zeros(size)
+    max_lag = np.zeros(size)
+    slip_time = np.full(size, np.nan)
+    counts = np.empty((size, GRID_CHUNK), dtype=np.int64)
+
+    for first in range(0, nodes, GRID_CHUNK):
+        grid = np.arange(first, min(first + GRID_CHUNK, nodes)) * dt
+        width = len(grid)
+        for row, profile in enumerate(profiles):
+            counts[row, :width] = np.searchsorted(profile.times, grid, side="right")
+        commands = counts[:, :width] * full[:, None]
+
+        for column in range(width):
+            lag = commands[:, column] - angle
+            speed = np.abs(velocity)
+            available = holding * np.minimum(1.0, corner / np.maximum(speed, 1e-9))
+            drive = available * np.sin(HALF_PI * lag)
+            moving = velocity != 0.0
+            held = ~moving & (np.abs(drive) <= load)
+            friction = load * np.sign(np.where(moving, velocity, drive))
+            accel = (drive - friction - damping * velocity) * scale
+            new_velocity = np.where(held, 0.0, velocity + accel * dt)
+            new_velocity[new_velocity * velocity < 0] = 0.0
+            velocity = new_velocity
+            angle += velocity * dt
+
+            np.abs(lag, out=lag)
+            np.maximum(max_lag, lag, out=max_lag)
+            slipped = (lag > SLIP_LAG) & np.isnan(slip_time)
+            if slipped.any():
+                slip_time[slipped] = grid[column] + dt
+
+    final = np.array([profile.steps for profile in profiles]) * full
+    missed = STEPS_PER_CYCLE * np.round((final - angle) / STEPS_PER_CYCLE)
+    points = []
+    for index, (step_mode, load_torque, acceleration, speed) in enumerate(combos):
+        slip = slip_time[index]
+        points.append(SweepPoint(speed, acceleration, step_mode, load_torque,
+                                 int(missed[index]), float(max_lag[index]),
+                                 None if math.isnan(slip) else float(slip)))
+    return points
+
+
+def simulate_batch(params, combos, distance, settle=0.1):
+    # combos - кортежи (step_mode, load, acceleration, speed). Вызывается в
+    # процессах пула, поэтому функция модульного уровня.
+    if np is not None:
+        return _simulate_vector(params, combos, distance, settle)
+    return _simulate_scalar(params, combos, distance, settle)
+
+
+def sweep(speeds, accelerations, step_modes=(1,), loads=(0.0,), params=None,
+          distance=1000, settle=0.1, workers=None, batch_size=64):
+    # Перебор всех сочетаний параметров в пуле процессов. distance, speeds и
+    # accelerations - в шагах текущего режима, как move_to, motor_speed и
+    # acceleration ядра. Возвращает SweepPoint в порядке
+    # itertools.product(speeds, accelerations, step_modes, loads).
+    params = params or MotorParameters()
+    distance = int(distance)
+    if distance <= 0 or batch_size < 1:
+        raise ValueError("Длина перемещения и размер пакета должны быть положительными")
+    for value in itertools.chain(speeds, accelerations, step_modes):
+        if value <= 0:
+            raise ValueError("Скорости, ускорения и режимы шага должны быть положительными")
+
+    combos = [(step_mode, load, acceleration, speed)
+              for speed, acceleration, step_mode, load
+              in itertools.product(speeds, accelerations, step_modes, loads)]
+    # Пакет считается до конца самого длинного перемещения, поэтому
+    # сочетания группируются по ожидаемой длительности
+    order = sorted(range(len(combos)), key=lambda i: _estimate_duration(combos[i], distance))
+    batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+    jobs = [[combos[i] for i in batch] for batch in batches]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(jobs) <= 1:
+        results = [simulate_batch(params, job, distance, settle) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(simulate_batch, itertools.repeat(params), jobs,
+                                    itertools.repeat(distance), itertools.repeat(settle)))
+
+    points = [None] * len(combos)
+    for batch, batch_points in zip(batches, results):
+        for index, point in zip(batch, batch_points):
+            points[index] = point
+    return points
+
+
+def safe_envelope(points, lag_limit=0.5):
+    # Допустимая область: для каждого (режим шага, нагрузка, ускорение) -
+    # наибольшая скорость, до которой включительно все точки проходят без
+    # пропуска шагов и с запасом: отставание сверх одного шага режима (скачок
+    # команды) не больше lag_limit полных шагов
+    groups = {}
+    for point in sorted(points, key=lambda p: p.speed):
+        key = (point.step_mode, point.load, point.acceleration)
+        entry = groups.setdefault(key, {"step_mode": point.step_mode, "load": point.load,
+                                        "acceleration": point.acceleration,
+                                        "max_safe_speed": None, "first_failure": None})
+        if entry["first_failure"] is not None:
+            continue
+        if point.missed_steps == 0 and point.max_lag - point.step_mode <= lag_limit:
+            entry["max_safe_speed"] = point.speed
+        else:
+            entry["first_failure"] = point.speed
+    return [groups[key] for key in sorted(groups)]
+
+
+def parse_values(text):
+    # "100,200,400" - список, "100:2000:20" - 20 значений от 100 до 2000
+    if ":" in text:
+        start, stop, count = text.split(":")
+        start, stop, count = float(start), float(stop), int(count)
+        if count < 2:
+            return [start]
+        return [start + (stop - start) * i / (count - 1) for i in range(count)]
+    return [float(value) for value in text.split(",")]
+
+
+def write_points(path, points, envelope):
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(SweepPoint._fields)
+            writer.writerows(points)
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"points": [point._asdict() for point in points],
+                       "envelope": envelope}, file, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перебор параметров движения на физической модели двигателя")
+    parser.add_argument("--speeds", type=parse_values, default=parse_values("100:3000:30"),
+                        help="скорости, шаг/с: список через запятую или начало:конец:число")
+    parser.add_argument("--accelerations", type=parse_values, default=parse_values("500,2000,8000"),
+                        help="ускорения, шаг/с²")
+    parser.add_argument("--step-modes", type=parse_values, default=[1.0, 0.5, 0.25, 0.125],
+                        help="режимы шага (1, 0.5, 0.25, 0.125)")
+    parser.add_argument("--loads", type=parse_values, default=[0.0, 0.1, 0.2],
+                        help="момент нагрузки, Н·м")
+    parser.add_argument("--distance", type=int, default=1000, help="длина перемещения, шагов")
+    parser.add_argument("--holding-torque", type=float, default=0.45, help="удерживающий момент, Н·м")
+    parser.add_argument("--inertia", type=float, default=0.0, help="момент инерции нагрузки, кг·м²")
+    parser.add_argument("--workers", type=int, help="число процессов (по умолчанию по числу ядер)")
+    parser.add_argument("--lag-limit", type=float, default=0.5,
+                        help="допустимое отставание сверх шага режима, полных шагов")
+    parser.add_argument("--output", help="файл результатов (.json или .csv)")
+    args = parser.parse_args(argv)
+
+    params = MotorParameters(holding_torque=args.holding_torque, load_inertia=args.inertia)
+    points = sweep(args.speeds, args.accelerations, args.step_modes, args.loads, params,
+                   distance=args.distance, workers=args.workers)
+    envelope = safe_envelope(points, args.lag_limit)
+
+    print(f"{'режим':>7} {'нагрузка':>9} {'ускорение':>10} {'макс. скорость':>15} {'срыв с':>9}")
+    for entry in envelope:
+        safe = "-" if entry["max_safe_speed"] is None else f"{entry['max_safe_speed']:.0f}"
+        failure = "-" if entry["first_failure"] is None else f"{entry['first_failure']:.0f}"
+        print(f"{entry['step_mode']:>7g} {entry['load']:>9g} {entry['acceleration']:>10g} "
+              f"{safe:>15} {failure:>9}")
+
+    if args.output:
+        write_points(args.output, points, envelope)
+
+
+if __name__ == "__main__":
+    main()
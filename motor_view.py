@@ -0,0 +1,507 @@
+# Отрисовка на холсте без импорта tkinter: классы работают с любым объектом,
+# у которого есть методы холста (create_line, coords, itemconfig, delete).
+
+import math
+import time
+
+
+class RotorGeometry:
+    # Таблица координат концов линий ротора по квантованному углу.
+    # Квант равен шагу в градусах для текущего режима шага; ротор из N линий
+    # симметричен с периодом 360/N градусов, поэтому таблица хранит только
+    # один период. Тригонометрия вычисляется только при построении таблицы.
+
+    def __init__(self, center_x, center_y, inner_radius, outer_radius, line_count, quantum):
+        self.center_x = center_x
+        self.center_y = center_y
+        self.inner_radius = inner_radius
+        self.outer_radius = outer_radius
+        self.line_count = line_count
+        self.quantum = quantum
+
+        period = 360.0 / line_count
+        self.size = max(1, round(period / quantum))
+        self.table = [self._compute(index * period / self.size) for index in range(self.size)]
+
+    def _compute(self, angle_deg):
+        # Координаты (x1, y1, x2, y2) всех линий ротора для угла angle_deg
+        offset = math.radians(angle_deg)
+        lines = []
+        for i in range(self.line_count):
+            angle = offset + i * (2 * math.pi / self.line_count)
+            cos_a = math.cos(angle)
+            sin_a = math.sin(angle)
+            lines.append((self.center_x + cos_a * self.inner_radius,
+                          self.center_y + sin_a * self.inner_radius,
+                          self.center_x + cos_a * self.outer_radius,
+                          self.center_y + sin_a * self.outer_radius))
+        return tuple(lines)
+
+    def key(self, angle_deg):
+        return round(angle_deg / self.quantum) % self.size
+
+    def matches(self, center_x, center_y, inner_radius, outer_radius, line_count, quantum):
+        return (self.center_x, self.center_y, self.inner_radius, self.outer_radius,
+                self.line_count, self.quantum) == (center_x, center_y, inner_radius,
+                                                   outer_radius, line_count, quantum)
+
+
+class RotorView:
+    # Ротор двигателя на холсте. Кадр - это выбор строки из RotorGeometry
+    # и coords() для линий, либо (в режиме спрайтов) смена одного изображения.
+    # Спрайты растеризуются заранее, частями (prerender); пока кадр не готов,
+    # ротор рисуется линиями, поэтому такт отрисовки не растеризует.
+
+    def __init__(self, canvas, center_x, center_y, inner_radius, outer_radius,
+                 color, line_count=8, line_width=6, quantum=1, image_factory=None):
+        self.canvas = canvas
+        self.center_x = center_x
+        self.center_y = center_y
+        self.inner_radius = inner_radius
+        self.outer_radius = outer_radius
+        self.color = color
+        self.line_count = line_count
+        self.line_width = line_width
+        self.quantum = quantum
+
+        # image_factory(width, height) создает изображение с методом
+        # put(color, to=(x1, y1, x2, y2)), например tk.PhotoImage
+        self.image_factory = image_factory
+        self.sprite_mode = False
+        self.sprites = {}
+        self.sprite_item = None
+        self.sprite_shown = False
+
+        self.geometry = None
+        self.lines = []
+        self.shown_key = None
+
+    def create(self):
+        # Создание линий ротора (вызывается один раз при построении сцены)
+        self._rebuild_geometry()
+        canvas = self.canvas
+        self.lines = [canvas.create_line(*coords, fill=self.color, width=self.line_width,
+                                         capstyle="round")
+                      for coords in self.geometry.table[0]]
+        self.shown_key = 0
+        if self.image_factory is not None:
+            self.sprite_item = canvas.create_image(self.center_x, self.center_y,
+                                                   anchor="center", state="hidden")
+
+    def configure(self, **options):
+        # Изменение радиусов, числа линий или кванта угла сбрасывает кэш
+        for name, value in options.items():
+            if not hasattr(self, name):
+                raise AttributeError(name)
+            setattr(self, name, value)
+        if "line_count" in options and self.lines:
+            # Старые спрайты недействительны: до новых ротор рисуется линиями
+            self._show_sprite(False)
+            canvas = self.canvas
+            for line in self.lines:
+                canvas.delete(line)
+            self.lines = [canvas.create_line(0, 0, 0, 0, fill=self.color, width=self.line_width,
+                                             capstyle="round")
+                          for _ in range(self.line_count)]
+        self._rebuild_geometry()
+
+    def set_quantum(self, quantum):
+        if quantum != self.quantum:
+            self.configure(quantum=quantum)
+
+    def _rebuild_geometry(self):
+        params = (self.center_x, self.center_y, self.inner_radius, self.outer_radius,
+                  self.line_count, self.quantum)
+        if self.geometry is not None and self.geometry.matches(*params):
+            return
+        self.geometry = RotorGeometry(*params)
+        self.sprites = {}
+        self.shown_key = None
+
+    def set_sprite_mode(self, enabled):
+        if enabled and self.image_factory is None:
+            raise ValueError("Режим спрайтов требует image_factory")
+        if enabled == self.sprite_mode:
+            return
+        self.sprite_mode = enabled
+        self.shown_key = None
+        if not enabled:
+            self._show_sprite(False)
+
+    @property
+    def sprites_pending(self):
+        # В режиме спрайтов есть еще не растеризованные кадры
+        return self.sprite_mode and len(self.sprites) < self.geometry.size
+
+    def prerender(self, budget=0.004):
+        # Растеризация недостающих кадров не дольше budget секунд.
+        # Возвращает True, когда готовы все кадры.
+        deadline = time.perf_counter() + budget
+        sprites = self.sprites
+        for key in range(self.geometry.size):
+            if key in sprites:
+                continue
+            sprites[key] = self._render_sprite(key)
+            if key == self.shown_key:
+                # Показанный линиями кадр заменится спрайтом
+                self.shown_key = None
+            if time.perf_counter() >= deadline:
+                break
+        return len(sprites) >= self.geometry.size
+
+    def _show_sprite(self, shown):
+        if shown == self.sprite_shown:
+            return
+        self.sprite_shown = shown
+        canvas = self.canvas
+        line_state = "hidden" if shown else "normal"
+        for line in self.lines:
+            canvas.itemconfig(line, state=line_state)
+        if self.sprite_item is not None:
+            canvas.itemconfig(self.sprite_item, state="normal" if shown else "hidden")
+
+    def update(self, angle_deg):
+        # Поворот ротора: поиск в таблице, без тригонометрии
+        key = self.geometry.key(angle_deg)
+        if key == self.shown_key:
+            return
+        self.shown_key = key
+
+        canvas = self.canvas
+        sprite = self.sprites.get(key) if self.sprite_mode else None
+        self._show_sprite(sprite is not None)
+        if sprite is not None:
+            canvas.itemconfig(self.sprite_item, image=sprite)
+            return
+
+        for line, coords in zip(self.lines, self.geometry.table[key]):
+            canvas.coords(line, *coords)
+
+    def _render_sprite(self, key):
+        # Растеризация кадра ротора: каждая линия с круглыми концами -
+        # набор дисков вдоль отрезка, который выводится горизонтальными полосами
+        half = int(self.outer_radius + self.line_width) + 1
+        image = self.image_factory(2 * half, 2 * half)
+        radius = self.line_width / 2
+        shift_x = half - self.center_x
+        shift_y = half - self.center_y
+
+        for x1, y1, x2, y2 in self.geometry.table[key]:
+            x1 += shift_x
+            y1 += shift_y
+            x2 += shift_x
+            y2 += shift_y
+            spans = {}
+            samples = max(1, int(math.hypot(x2 - x1, y2 - y1)))
+            for i in range(samples + 1):
+                px = x1 + (x2 - x1) * i / samples
+                py = y1 + (y2 - y1) * i / samples
+                for row in range(int(py - radius), int(py + radius) + 1):
+                    dy = row + 0.5 - py
+                    if dy * dy > radius * radius:
+                        continue
+                    dx = math.sqrt(radius * radius - dy * dy)
+                    low, high = px - dx, px + dx
+                    span = spans.get(row)
+                    if span is None:
+                        spans[row] = [low, high]
+                    else:
+                        if low < span[0]:
+                            span[0] = low
+                        if high > span[1]:
+                            span[1] = high
+            for row, (low, high) in spans.items():
+                left = max(0, int(round(low)))
+                right = min(2 * half, int(round(high)))
+                if 0 <= row < 2 * half and right > left:
+                    image.put(self.color, to=(left, row, right, row + 1))
+        return image
+
+
+class PositionPlot:
+    # График позиции из постоянных элементов холста. Оси и подписи создаются
+    # один раз (и заново только при изменении размера), а каждый кадр
+    # обновляет одну ломаную через coords(). Данные берутся из пирамиды
+    # PositionHistory по столбцам пикселей, поэтому цена кадра зависит от
+    # ширины холста, а не от длины истории.
+    #
+    # Окно просмотра: span секунд, заканчивающихся view_end (None - текущий
+    # момент, окно следует за новыми данными). Колесо мыши меняет масштаб
+    # вокруг курсора, перетаскивание сдвигает окно, двойной щелчок
+    # возвращает к текущему моменту.
+
+    margin = 30
+    min_span = 0.5
+
+    def __init__(self, canvas, history, line_color, axis_color, text_color, span=60.0):
+        self.canvas = canvas
+        self.history = history
+        self.line_color = line_color
+        self.axis_color = axis_color
+        self.text_color = text_color
+        self.span = span
+        self.view_end = None
+
+        self.width = 0
+        self.height = 0
+        self.items = []
+        self.line = None
+        self.marker = None
+        self.value_text = None
+        self.time_text = None
+        self.shown_time_text = None
+        self.last_end = None
+        self._drag_x = None
+
+    def on_configure(self, event):
+        self.layout(event.width, event.height)
+        self.draw()
+
+    def layout(self, width, height):
+        # Полная перестройка элементов графика под новый размер холста
+        canvas = self.canvas
+        for item in self.items:
+            canvas.delete(item)
+        self.items = []
+        self.line = None
+        self.width = width
+        self.height = height
+        self.shown_time_text = None
+
+        if width <= 1 or height <= 1:
+            return
+
+        margin = self.margin
+        add = self.items.append
+
+        # Рисование осей
+        add(canvas.create_line(margin, height - margin, width - margin, height - margin,
+                               fill=self.axis_color, width=2))  # X-axis
+        add(canvas.create_line(margin, margin, margin, height - margin,
+                               fill=self.axis_color, width=2))  # Y-axis
+
+        # Подписи осей
+        add(canvas.create_text(15, height // 2, text="Позиция", fill=self.text_color,
+                               font=("Arial", 10), angle=90))
+        self.time_text = canvas.create_text(width // 2, height - 15, text="",
+                                            fill=self.text_color, font=("Arial", 10))
+
+        # Ломаная графика, маркер последней точки и текущее значение
+        self.line = canvas.create_line(margin, height - margin, width - margin, height - margin,
+                                       fill=self.line_color, width=2)
+        self.marker = canvas.create_oval(0, 0, 0, 0, fill=self.line_color, outline=self.line_color)
+        self.value_text = canvas.create_text(width - 50, 20, text="", fill=self.text_color,
+                                             font=("Arial", 10))
+        self.items.extend((self.time_text, self.line, self.marker, self.value_text))
+
+    @property
+    def plot_width(self):
+        return max(1, int(self.width - 2 * self.margin))
+
+    def draw(self, now=None):
+        # Обновление графика: одна операция coords() для всей ломаной.
+        # now - текущий момент по часам истории (правый край живого окна).
+        history = self.history
+        if self.line is None or history.last_time is None:
+            return
+
+        live = self.view_end is None
+        if live:
+            end = history.last_time if now is None else max(now, history.last_time)
+        else:
+            end = self.view_end
+        start = end - self.span
+        self.last_end = end
+
+        width = self.plot_width
+        columns = history.columns(start, end, width)
+        if live:
+            # Позиция не менялась с последнего отсчета: линия до правого края
+            value = history.last_value
+            if not columns or columns[-1][0] < width - 1:
+                columns.append((width - 1, value, value))
+        if not columns:
+            return
+
+        # Масштабирование данных для графика
+        min_val = min(low for _, low, _ in columns)
+        max_val = max(high for _, _, high in columns)
+        range_val = max_val - min_val if max_val != min_val else 1
+
+        margin = self.margin
+        base = self.height - margin
+        scale = (self.height - 2 * margin) / range_val
+        x_scale = width / max(1, width - 1)
+
+        # Столбец - вертикальный отрезок от минимума до максимума; соседние
+        # столбцы соединяются, поэтому вся история - одна ломаная
+        coords = []
+        extend = coords.extend
+        for column, low, high in columns:
+            x = margin + column * x_scale
+            y_low = base - (low - min_val) * scale
+            y_high = base - (high - min_val) * scale
+            if low == high:
+                extend((x, y_low))
+            else:
+                extend((x, y_low, x, y_high))
+        if len(coords) == 2:
+            coords.extend(coords)
+
+        canvas = self.canvas
+        canvas.coords(self.line, coords)
+
+        x, y = coords[-2], coords[-1]
+        canvas.coords(self.marker, x - 3, y - 3, x + 3, y + 3)
+
+        current_value = history.last_value if live else columns[-1][2]
+        if current_value == int(current_value):
+            current_value = int(current_value)
+        canvas.itemconfig(self.value_text, text=f"{'Текущ.' if live else 'Конец'}: {current_value}")
+
+        text = f"Время: окно {format_span(self.span)}"
+        if not live:
+            text += f", {format_span(history.last_time - end)} назад"
+        if text != self.shown_time_text:
+            self.shown_time_text = text
+            canvas.itemconfig(self.time_text, text=text)
+
+    # Масштаб и сдвиг окна
+
+    def zoom(self, factor, x=None):
+        # Изменение ширины окна в factor раз; момент под курсором x остается на месте
+        history = self.history
+        if history.last_time is None or self.last_end is None:
+            return
+        end = self.last_end
+        first = history.first_time()
+        longest = max(self.min_span, history.last_time - first) * 1.05
+        span = min(max(self.span * factor, self.min_span), longest)
+        if x is not None:
+            fraction = min(1.0, max(0.0, (x - self.margin) / self.plot_width))
+            anchor = end - self.span * (1 - fraction)
+            end = anchor + span * (1 - fraction)
+        self.span = span
+        self._set_end(end)
+
+    def pan(self, dx):
+        # Сдвиг окна на dx пикселей (вправо - к более ранним данным)
+        if self.last_end is None:
+            return
+        self._set_end(self.last_end - dx * self.span / self.plot_width)
+
+    def follow(self):
+        self.view_end = None
+
+    def _set_end(self, end):
+        history = self.history
+        if end >= history.last_time:
+            self.view_end = None
+            return
+        first = history.first_time()
+        self.view_end = max(end, first + self.span) if first is not None else end
+
+    def bind(self, widget):
+        # Обработчики мыши для холста tkinter
+        widget.bind("<MouseWheel>", self.on_wheel)
+        widget.bind("<Button-4>", self.on_wheel)
+        widget.bind("<Button-5>", self.on_wheel)
+        widget.bind("<ButtonPress-1>", self.on_press)
+        widget.bind("<B1-Motion>", self.on_drag)
+        widget.bind("<Double-Button-1>", self.on_double)
+
+    def on_wheel(self, event):
+        up = getattr(event, "delta", 0) > 0 or getattr(event, "num", None) == 4
+        self.zoom(1 / 1.5 if up else 1.5, event.x)
+        self.draw()
+
+    def on_press(self, event):
+        self._drag_x = event.x
+
+    def on_drag(self, event):
+        if self._drag_x is None:
+            return
+        self.pan(event.x - self._drag_x)
+        self._drag_x = event.x
+        self.draw()
+
+    def on_double(self, event):
+        self.follow()
+        self.draw()
+
+
+class MotorDisplay:
+    # Отрисовка состояния оси: ротор, метки и график. Использует только
+    # методы холста и config виджетов, поэтому работает и с заглушками
+    # (замеры без дисплея). Нужны атрибуты canvas, rotor_view, angle_text,
+    # position_history, position_plot (None - график еще не построен),
+    # plot_interval, position_label, status_label, start_btn, replayer.
+
+    def update_motor_visualization(self, snapshot=None):
+        if snapshot is None:
+            snapshot = self.engine.snapshot
+        current_position = snapshot.position
+
+        # Обновление угла поворота ротора
+        angle_deg = current_position % 360
+        
+        # Поворот линий ротора (координаты берутся из таблицы)
+        self.rotor_view.update(angle_deg)
+        
+        # Обновление текста угла
+        self.canvas.itemconfig(self.angle_text, text=f"Угол: {angle_deg:.1f}°")
+        
+        # Обновление позиции на графике
+        self.position_history.append(time.perf_counter(), current_position)
+        
+        # Обновление информационных меток
+        self.position_label.config(text=f"Текущая позиция: {current_position} шагов")
+        self.update_status(snapshot)
+        
+        # Перерисовка графика
+        self.draw_position_plot()
+
+    def update_status(self, snapshot):
+        # Синхронизация статуса со снимком состояния ядра двигателя
+        if self.replayer is not None:
+            status = "replay"
+        elif snapshot.moving:
+            status = "moving"
+        elif snapshot.running:
+            status = "running"
+        else:
+            status = "stopped"
+        
+        if status == self.shown_status:
+            return
+        self.shown_status = status
+        
+        if status == "replay":
+            self.status_label.config(text="Статус: Воспроизведение", fg="#c7a44e")
+        elif status == "moving":
+            self.status_label.config(text="Статус: Перемещение", fg="#4a9c82")
+            self.start_btn.config(state="normal")
+        elif status == "running":
+            self.status_label.config(text="Статус: Запущен", fg="#4a9c82")
+            self.start_btn.config(state="disabled")
+        else:
+            self.status_label.config(text="Статус: Остановлен", fg="#c74e4e")
+            self.start_btn.config(state="normal")
+
+    def draw_position_plot(self):
+        # Обновление ломаной графика (элементы холста создаются один раз)
+        if self.position_plot is None:
+            return
+        now = time.perf_counter()
+        self.position_plot.draw(now)
+        self.next_plot_time = now + self.plot_interval
+
+
+def format_span(seconds):
+    if seconds < 120:
+        return f"{seconds:.1f} с"
+    if seconds < 7200:
+        return f"{seconds / 60:.1f} мин"
+    if seconds < 172800:
+        return f"{seconds / 3600:.1f} ч"
+    return f"{seconds / 86400:.1f} сут"
@@ -0,0 +1,299 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+from instrumentation import LatencyTracker
+from motion_planner import ProfileCache
+from motor_engine import MotorCommand, StepperEngine
+
+
+class MultiAxisController:
+    # Много независимых осей в одном потоке планировщика. Ближайшие дедлайны
+    # шагов всех осей хранятся в куче; поток спит до самого раннего из них и
+    # обслуживает только те оси, чей срок наступил. Каждая ось - StepperEngine
+    # без собственного потока.
+
+    def __init__(self, axis_count=1, speed=10, direction=1, step_mode=1):
+        self.axes = []
+        self._heap = []
+        self._versions = []
+
+        # Канал команд: (номер оси, команда)
+        self._commands = deque()
+        self.command_listeners = []
+        self.command_latency = LatencyTracker()
+
+        # Всего шагов по всем осям
+        self.total_steps = 0
+
+        # Общая гистограмма опоздания шагов всех осей (None - не измеряется)
+        self.lateness = None
+
+        # Виртуальные часы пакетной симуляции; после simulate дедлайны осей
+        # отсчитываются по ним, пока не запущен поток реального времени
+        self.virtual_clock = 0.0
+        self._virtual = False
+
+        # Общий кэш профилей: одинаковые перемещения разных осей рассчитываются один раз
+        self.profile_cache = ProfileCache()
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._alive = False
+
+        for _ in range(axis_count):
+            self.add_axis(speed=speed, direction=direction, step_mode=step_mode)
+
+    def __len__(self):
+        return len(self.axes)
+
+    def add_axis(self, speed=10, direction=1, step_mode=1):
+        with self._cond:
+            axis = StepperEngine(speed=speed, direction=direction, step_mode=step_mode,
+                                 profile_cache=self.profile_cache)
+            axis.lateness = self.lateness
+            self.axes.append(axis)
+            self._versions.append(0)
+            return len(self.axes) - 1
+
+    def axis(self, index):
+        return self.axes[index]
+
+    def set_lateness_histogram(self, histogram):
+        # Все оси обслуживаются одним потоком, поэтому гистограмма общая
+        with self._cond:
+            self.lateness = histogram
+            for axis in self.axes:
+                axis.lateness = histogram
+
+    def submit(self, index, name, *args):
+        # Команда для оси index; будит поток планировщика
+        if name not in StepperEngine.COMMANDS:
+            raise ValueError(f"Неизвестная команда: {name}")
+        if not 0 <= index < len(self.axes):
+            raise IndexError(f"Нет оси с номером {index}")
+        command = MotorCommand(name, args)
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                self._commands.append((index, command))
+                self._cond.notify()
+                return command
+            self._apply_command(index, command, self._clock())
+        self._notify_command_listeners(index, command)
+        return command
+
+    def _clock(self):
+        # Часы команд, применяемых без потока планировщика
+        return self.virtual_clock if self._virtual else time.perf_counter()
+
+    def _shift(self, offset):
+        # Перенос дедлайнов всех осей на другие часы на одну и ту же величину:
+        # взаимная фаза осей (в том числе согласованных групп) сохраняется
+        for axis in self.axes:
+            axis._shift(offset)
+        self._heap = []
+        for index in range(len(self.axes)):
+            self._schedule(index)
+
+    def submit_all(self, name, *args):
+        return [self.submit(index, name, *args) for index in range(len(self.axes))]
+
+    def submit_group(self, indices, segments):
+        # Согласованные отрезки группы осей (см. coordinated_motion.AxisGroup).
+        # segments - список отрезков, каждый - список (профиль, цель) по осям
+        # indices. Команда применяется целиком за один проход планировщика:
+        # первый отрезок всех осей начинается в один момент - после окончания
+        # очереди самой занятой оси. Слушатели получают команду с осью None.
+        indices = tuple(indices)
+        if len(set(indices)) != len(indices):
+            raise ValueError("Оси группы не должны повторяться")
+        for index in indices:
+            if not 0 <= index < len(self.axes):
+                raise IndexError(f"Нет оси с номером {index}")
+        command = MotorCommand("queue_group", (indices, segments))
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                self._commands.append((None, command))
+                self._cond.notify()
+                return command
+            self._apply_command(None, command, self._clock())
+        self._notify_command_listeners(None, command)
+        return command
+
+    def _apply_group(self, command, now):
+        indices, segments = command.args
+        axes = [self.axes[index] for index in indices]
+        try:
+            for axis in axes:
+                if axis.state.running and axis._profile is None:
+                    raise ValueError("Ось вращается непрерывно: сначала остановите ее")
+            # Общий момент начала: оси, освободившиеся раньше, ждут остальных
+            start = max(axis.queue_end_time(now) for axis in axes)
+            for column, axis in enumerate(axes):
+                dwell = start - axis.queue_end_time(now)
+                for profile, target in (segment[column] for segment in segments):
+                    axis.queue_move(profile, target, dwell)
+                    dwell = 0.0
+                axis._publish()
+            command.result = start
+        except Exception as error:
+            command.error = error
+        command.applied_at = time.perf_counter()
+        command._done.set()
+        self.command_latency.record(command.latency)
+        for index, axis in zip(indices, axes):
+            self.total_steps += axis.service(now)
+            self._schedule(index)
+
+    def _apply_command(self, index, command, now):
+        if index is None:
+            self._apply_group(command, now)
+            return
+        axis = self.axes[index]
+        axis._apply_command(command)
+        self.command_latency.record(command.latency)
+        # Команда могла изменить дедлайн оси: обслуживаем и перепланируем
+        self.total_steps += axis.service(now)
+        self._schedule(index)
+
+    def _schedule(self, index):
+        # Старые записи оси в куче становятся недействительными по версии
+        version = self._versions[index] + 1
+        self._versions[index] = version
+        deadline = self.axes[index].next_deadline()
+        if deadline is not None:
+            heapq.heappush(self._heap, (deadline, version, index))
+
+    def _notify_command_listeners(self, index, command):
+        for callback in self.command_listeners:
+            callback(index, command)
+
+    def service(self, now):
+        # Обслуживание всех осей с наступившим дедлайном.
+        # Возвращает список осей, сделавших шаги. Вызывается под self._cond.
+        heap = self._heap
+        versions = self._versions
+        axes = self.axes
+        # Ось с обрезанной max_batch пачкой снова попадает в кучу с
+        # наступившим дедлайном; в списке она должна быть один раз
+        stepped = {}
+        while heap and heap[0][0] <= now:
+            deadline, version, index = heapq.heappop(heap)
+            if version != versions[index]:
+                continue
+            axis = axes[index]
+            steps = axis.service(now)
+            if steps:
+                self.total_steps += steps
+                stepped[index] = None
+            next_deadline = axis.next_deadline()
+            if next_deadline is not None:
+                heapq.heappush(heap, (next_deadline, version, index))
+        return list(stepped)
+
+    def next_deadline(self):
+        # Самый ранний действительный дедлайн среди всех осей
+        heap = self._heap
+        versions = self._versions
+        while heap and heap[0][1] != versions[heap[0][2]]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def _notify_axes(self, stepped):
+        axes = self.axes
+        for index in stepped:
+            axis = axes[index]
+            if axis.listeners:
+                axis._notify_listeners()
+
+    def run(self):
+        # Единственный поток, обслуживающий все оси
+        cond = self._cond
+        while self._alive:
+            applied = []
+            with cond:
+                now = time.perf_counter()
+                while self._commands:
+                    index, command = self._commands.popleft()
+                    self._apply_command(index, command, now)
+                    applied.append((index, command))
+                stepped = self.service(time.perf_counter())
+                if not stepped and not applied:
+                    deadline = self.next_deadline()
+                    if deadline is None:
+                        cond.wait()
+                    else:
+                        timeout = deadline - time.perf_counter()
+                        if timeout > 0:
+                            cond.wait(timeout)
+                    continue
+            for index, command in applied:
+                self._notify_command_listeners(index, command)
+            if stepped:
+                self._notify_axes(stepped)
+
+    def start_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._virtual:
+                self._shift(time.perf_counter() - self.virtual_clock)
+                self._virtual = False
+        self._alive = True
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        with self._cond:
+            self._alive = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def positions(self):
+        return [axis.snapshot.position for axis in self.axes]
+
+    def simulate(self, duration=None, max_steps=None):
+        # Пакетная симуляция всех осей в виртуальном времени (см. StepperEngine.simulate)
+        if duration is None and max_steps is None:
+            raise ValueError("Нужно задать duration или max_steps")
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("Симуляция недоступна при работающем потоке реального времени")
+
+        wall_start = time.perf_counter()
+        start_time = virtual_time = self.virtual_clock
+        end_time = None if duration is None else start_time + duration
+        start_steps = self.total_steps
+
+        with self._cond:
+            # Перепривязка всех осей к виртуальному времени
+            if not self._virtual:
+                self._shift(virtual_time - time.perf_counter())
+                self._virtual = True
+            self._heap = []
+            for index, axis in enumerate(self.axes):
+                self.total_steps += axis.service(virtual_time)
+                self._schedule(index)
+
+            steps = 0
+            while max_steps is None or steps < max_steps:
+                deadline = self.next_deadline()
+                if deadline is None:
+                    break
+                if end_time is not None and deadline > end_time:
+                    virtual_time = end_time
+                    break
+                virtual_time = float(deadline)
+                stepped = self.service(virtual_time)
+                self._notify_axes(stepped)
+                steps = self.total_steps - start_steps
+            self.virtual_clock = virtual_time
+
+        return {
+            "steps": steps,
+            "virtual_time": virtual_time - start_time,
+            "positions": self.positions(),
+            "wall_time": time.perf_counter() - wall_start,
+        }
@@ -0,0 +1,528 @@
+import argparse
+import binascii
+import os
+import select
+import struct
+import threading
+import time
+import tty
+from collections import deque
+
+
+# Кадр: синхробайт, номер оси, номер кадра, число серий, серии, CRC-16 (CCITT).
+# Серия - шаги со знаком направления и длительность в тиках по 1 мкс:
+# |steps| импульсов равномерно на интервале, последний - в его конце.
+# Серия с нулем шагов - пауза.
+SYNC = 0xA5
+FRAME_HEADER = struct.Struct("<BBBB")
+RUN = struct.Struct("<hI")
+FRAME_CRC = struct.Struct("<H")
+TICK = 1e-6
+
+MAX_RUN_STEPS = 32767
+MAX_RUN_TICKS = 0xFFFFFFFF
+MAX_RECORDS = 255
+MAX_FRAME = FRAME_HEADER.size + MAX_RECORDS * RUN.size + FRAME_CRC.size
+
+# Программное управление потоком от устройства
+XON = 0x11
+XOFF = 0x13
+
+
+def encode_frame(axis, seq, runs):
+    # runs - плоский список [steps, ticks, steps, ticks, ...]
+    count = len(runs) // 2
+    body = FRAME_HEADER.pack(SYNC, axis, seq & 0xFF, count) + struct.pack("<" + "hI" * count, *runs)
+    return body + FRAME_CRC.pack(binascii.crc_hqx(body, 0xFFFF))
+
+
+class FrameDecoder:
+    # Разбор потока байт на кадры; после ошибки CRC поиск следующего синхробайта
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.crc_errors = 0
+
+    def feed(self, data):
+        # Возвращает список кадров (ось, номер, [(steps, ticks), ...])
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        start = 0
+        size = len(buffer)
+        while True:
+            start = buffer.find(SYNC, start)
+            if start < 0 or size - start < FRAME_HEADER.size:
+                break
+            _, axis, seq, count = FRAME_HEADER.unpack_from(buffer, start)
+            end = start + FRAME_HEADER.size + count * RUN.size
+            if size < end + FRAME_CRC.size:
+                break
+            (crc,) = FRAME_CRC.unpack_from(buffer, end)
+            if binascii.crc_hqx(buffer[start:end], 0xFFFF) != crc:
+                self.crc_errors += 1
+                start += 1
+                continue
+            values = struct.unpack_from("<" + "hI" * count, buffer, start + FRAME_HEADER.size)
+            frames.append((axis, seq, list(zip(values[::2], values[1::2]))))
+            start = end + FRAME_CRC.size
+        if start < 0:
+            buffer.clear()
+        else:
+            del buffer[:start]
+        return frames
+
+
+class ByteRing:
+    # Кольцевой буфер байт фиксированной емкости. Кадр записывается целиком
+    # или не записывается вовсе.
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Емкость буфера должна быть положительной")
+        self.capacity = capacity
+        self._data = bytearray(capacity)
+        self._head = 0  # индекс первого непрочитанного байта
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def free(self):
+        return self.capacity - self._size
+
+    def write(self, data):
+        size = len(data)
+        if size > self.capacity - self._size:
+            return False
+        tail = (self._head + self._size) % self.capacity
+        first = min(size, self.capacity - tail)
+        self._data[tail:tail + first] = data[:first]
+        if first < size:
+            self._data[:size - first] = data[first:]
+        self._size += size
+        return True
+
+    def read(self, limit):
+        size = min(limit, self._size)
+        head = self._head
+        first = min(size, self.capacity - head)
+        data = bytes(self._data[head:head + first])
+        if first < size:
+            data += self._data[:size - first]
+        self._head = (head + size) % self.capacity
+        self._size -= size
+        return data
+
+
+class OutputBackend:
+    # Выход шагов на драйвер. steps вызывается в потоке двигателя под его
+    # блокировкой после каждой пачки шагов: count шагов в направлении
+    # direction, последний - в расчетный момент when (часы планировщика),
+    # с интервалом interval между шагами.
+
+    def steps(self, direction, count, when, interval):
+        raise NotImplementedError
+
+    def shift(self, offset):
+        # Часы планировщика сдвинуты на offset секунд (переход между
+        # реальным и виртуальным временем): последующие when больше на offset
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SerialBackend(OutputBackend):
+    # Выход на последовательный порт (или псевдотерминал). Шаги сжимаются в
+    # серии одинаковых интервалов, серии собираются в кадры раз в
+    # flush_interval, кадры - в кольцевой буфер. Поток записи отправляет
+    # буфер крупными блоками и останавливается по XOFF от устройства.
+    #
+    # Если буфер переполнен: при blocking=True поток двигателя ждет места
+    # (подходит для simulate), иначе кадр отбрасывается и учитывается в
+    # dropped_frames / dropped_steps.
+
+    def __init__(self, path, axis=0, flush_interval=0.005, ring_size=1 << 16,
+                 chunk_size=4096, blocking=False):
+        self.path = path
+        self.axis = axis
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self.blocking = blocking
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+        if os.isatty(self.fd):
+            tty.setraw(self.fd)
+
+        self.ring = ByteRing(ring_size)
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+
+        # Текущая серия (в тиках) и серии кадра, который еще собирается
+        self._direction = 0
+        self._interval = 0
+        self._run_steps = 0
+        self._run_start = None
+        self._last = None
+        # Поправка к часам планировщика (тиков) после их сдвига
+        self._offset = 0
+        self._runs = []
+        self._frame_steps = 0
+        self._frame_start = None
+        self._packed_at = time.perf_counter()
+        self._seq = 0
+
+        # Статистика
+        self.steps_written = 0
+        self.frames = 0
+        self.bytes_written = 0
+        self.dropped_frames = 0
+        self.dropped_steps = 0
+        self.pauses = 0
+        self.paused = False
+
+        self._closing = False
+        self._close_deadline = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def steps(self, direction, count, when, interval):
+        ticks = round(interval / TICK)
+        # Серия не длиннее MAX_RUN_STEPS шагов и MAX_RUN_TICKS тиков (с
+        # запасом в один интервал на неровность дедлайнов)
+        limit = min(MAX_RUN_STEPS, max(1, MAX_RUN_TICKS // max(ticks, 1) - 1))
+        with self._lock:
+            end = round(when / TICK) + self._offset
+            start = end - count * ticks
+            last = self._last
+            if last is not None and end < last:
+                # Часы планировщика ушли назад (перенос дедлайнов на другие
+                # часы): дальше отсчет сдвинут так, чтобы пачка шла сразу
+                # за последним шагом
+                self._offset += last - start
+                end += last - start
+                start = last
+            if self._frame_start is None:
+                self._frame_start = end
+            if last is None or start > last + ticks:
+                # Первая пачка или пауза перед ней
+                self._close_run()
+                if last is not None:
+                    self._add_run(0, start - last)
+                self._begin_run(direction, ticks, start)
+            elif direction != self._direction or ticks != self._interval:
+                self._close_run()
+                self._begin_run(direction, ticks, last)
+            self.steps_written += count
+            # Серия закрывается до превышения предела, а не после
+            while self._run_steps + count > limit:
+                part = limit - self._run_steps
+                count -= part
+                self._run_steps = limit
+                self._last = end - count * ticks
+                self._close_run()
+                self._begin_run(direction, ticks, self._last)
+            self._run_steps += count
+            self._last = end
+            if end - self._frame_start >= self.flush_interval / TICK:
+                self._pack()
+
+    def shift(self, offset):
+        # Сдвиг часов компенсируется поправкой: интервалы между шагами по
+        # обе стороны от перехода сохраняются, пауз из-за сдвига нет
+        with self._lock:
+            self._offset -= round(offset / TICK)
+
+    def _begin_run(self, direction, ticks, start):
+        self._direction = direction
+        self._interval = ticks
+        self._run_start = start
+        self._run_steps = 0
+
+    def _close_run(self):
+        # Незавершенная серия превращается в запись кадра; продолжение
+        # той же серии начнется с момента последнего шага
+        steps = self._run_steps
+        if not steps:
+            return
+        ticks = self._last - self._run_start
+        self._run_start = self._last
+        self._run_steps = 0
+        self._frame_steps += steps
+        self._add_run(self._direction * steps, ticks)
+
+    def _add_run(self, steps, ticks):
+        while ticks > MAX_RUN_TICKS:
+            self._add_run(0, MAX_RUN_TICKS)
+            ticks -= MAX_RUN_TICKS
+        self._runs += (steps, ticks)
+        if len(self._runs) >= 2 * MAX_RECORDS:
+            self._pack()
+
+    def _pack(self):
+        # Сборка кадра и запись в кольцевой буфер. Вызывается под self._lock.
+        self._close_run()
+        runs = self._runs
+        self._frame_start = self._last
+        self._packed_at = time.perf_counter()
+        if not runs:
+            return
+        frame = encode_frame(self.axis, self._seq, runs)
+        self._seq += 1
+        self._runs = []
+        steps = self._frame_steps
+        self._frame_steps = 0
+        while not self.ring.write(frame):
+            if not self.blocking or self._closing:
+                self.dropped_frames += 1
+                self.dropped_steps += steps
+                return
+            self._space.wait(0.1)
+        self.frames += 1
+
+    def flush(self):
+        with self._lock:
+            self._pack()
+
+    @property
+    def buffered(self):
+        return len(self.ring)
+
+    # Поток записи
+
+    def _run(self):
+        fd = self.fd
+        while True:
+            with self._lock:
+                if (time.perf_counter() - self._packed_at >= self.flush_interval
+                        and self.ring.free >= MAX_FRAME):
+                    # Двигатель остановился или шагает медленно: досылаем серию
+                    self._pack()
+                data = b"" if self.paused else self.ring.read(self.chunk_size)
+                if data:
+                    self._space.notify_all()
+                elif self._closing and (not len(self.ring)
+                                        or time.perf_counter() > self._close_deadline):
+                    break
+            if data and not self._write_all(data):
+                break
+            try:
+                readable, _, _ = select.select([fd], [], [], 0 if data else self.flush_interval)
+                if readable:
+                    self._on_control(os.read(fd, 256))
+            except OSError:
+                break
+
+    def _write_all(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                _, writable, _ = select.select([], [self.fd], [], 0.1)
+                if not writable:
+                    if self._closing:
+                        return False
+                    continue
+                written = os.write(self.fd, view)
+            except OSError:
+                return False
+            self.bytes_written += written
+            view = view[written:]
+        return True
+
+    def _on_control(self, data):
+        # Учитывается последний байт управления потоком в пачке
+        for byte in reversed(data):
+            if byte == XOFF or byte == XON:
+                paused = byte == XOFF
+                with self._lock:
+                    if paused and not self.paused:
+                        self.pauses += 1
+                    self.paused = paused
+                return
+
+    def close(self, timeout=5.0):
+        # Досылка накопленных кадров (не дольше timeout, устройство может
+        # держать XOFF) и закрытие порта
+        with self._lock:
+            self._closing = True
+            self._close_deadline = time.perf_counter() + timeout
+            self._pack()
+            self._space.notify_all()
+        self._thread.join(timeout + 1.0)
+        os.close(self.fd)
+
+    def stats(self):
+        return {
+            "steps": self.steps_written,
+            "frames": self.frames,
+            "bytes": self.bytes_written,
+            "buffered": self.buffered,
+            "dropped_frames": self.dropped_frames,
+            "dropped_steps": self.dropped_steps,
+            "pauses": self.pauses,
+        }
+
+
+class PtyDevice:
+    # Эмулятор драйвера на псевдотерминале для проверки без оборудования.
+    # Принимает кадры, проверяет CRC и номера, выполняет серии: в реальном
+    # времени (realtime=True) или сразу. Когда очередь движения длиннее
+    # queue_time секунд, устройство отправляет XOFF, после разгрузки
+    # наполовину - XON.
+
+    def __init__(self, queue_time=0.25, realtime=True):
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.path = os.ttyname(self._slave)
+        self.queue_time = queue_time
+        self.realtime = realtime
+
+        self.decoder = FrameDecoder()
+        self._queue = deque()
+        self._queued_ticks = 0
+        self._clock = None
+        self._seq = {}
+        self._lock = threading.Lock()
+
+        # Позиции по осям: принятые и выполненные шаги
+        self.received = {}
+        self.positions = {}
+        self.frames = 0
+        self.bytes = 0
+        self.steps = 0
+        self.lost_frames = 0
+        self.xoff_sent = 0
+        self.paused = False
+
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def crc_errors(self):
+        return self.decoder.crc_errors
+
+    @property
+    def queued_time(self):
+        return self._queued_ticks * TICK
+
+    def _run(self):
+        master = self.master
+        while self._alive:
+            try:
+                readable, _, _ = select.select([master], [], [], 0.001)
+                data = os.read(master, 1 << 16) if readable else b""
+            except OSError:
+                break
+            with self._lock:
+                now = time.perf_counter()
+                if data:
+                    self.bytes += len(data)
+                    for axis, seq, runs in self.decoder.feed(data):
+                        self._receive(axis, seq, runs, now)
+                self._execute(now)
+                self._flow_control()
+
+    def _receive(self, axis, seq, runs, now):
+        expected = self._seq.get(axis)
+        if expected is not None and seq != expected:
+            self.lost_frames += (seq - expected) & 0xFF
+        self._seq[axis] = (seq + 1) & 0xFF
+        self.frames += 1
+        if not self._queue and runs:
+            # После простоя пауза засчитывается от конца прошлого движения,
+            # но шаги не начинаются раньше приема кадра
+            steps, ticks = runs[0]
+            if self._clock is None or steps:
+                self._clock = now
+            else:
+                self._clock = max(self._clock, now - ticks * TICK)
+        for steps, ticks in runs:
+            self.received[axis] = self.received.get(axis, 0) + steps
+            self._queue.append((axis, steps, ticks))
+            self._queued_ticks += ticks
+
+    def _execute(self, now):
+        # Выполнение серий, время которых прошло
+        queue = self._queue
+        if not queue:
+            return
+        until = round((now - self._clock) / TICK) if self.realtime else None
+        elapsed = 0
+        while queue:
+            axis, steps, ticks = queue[0]
+            if until is not None and elapsed + ticks > until:
+                break
+            queue.popleft()
+            elapsed += ticks
+            self._queued_ticks -= ticks
+            self.positions[axis] = self.positions.get(axis, 0) + steps
+            self.steps += abs(steps)
+        if until is not None:
+            self._clock += elapsed * TICK
+
+    def _flow_control(self):
+        queued = self.queued_time
+        if not self.paused and queued > self.queue_time:
+            self.paused = True
+            self.xoff_sent += 1
+            os.write(self.master, bytes((XOFF,)))
+        elif self.paused and queued < self.queue_time / 2:
+            self.paused = False
+            os.write(self.master, bytes((XON,)))
+
+    def wait_idle(self, timeout=5.0):
+        # Ожидание выполнения всех принятых серий
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            with self._lock:
+                if not self._queue:
+                    return True
+            time.sleep(0.005)
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "bytes": self.bytes,
+                "steps": self.steps,
+                "positions": dict(self.positions),
+                "queued_time": self.queued_time,
+                "crc_errors": self.crc_errors,
+                "lost_frames": self.lost_frames,
+                "xoff_sent": self.xoff_sent,
+            }
+
+    def close(self):
+        self._alive = False
+        self._thread.join(1.0)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+def main(argv=None):
+    # Эмулятор драйвера: печатает путь псевдотерминала и статистику
+    parser = argparse.ArgumentParser(description="Эмулятор драйвера шагового двигателя на псевдотерминале")
+    parser.add_argument("--queue-time", type=float, default=0.25, help="емкость очереди движения, сек")
+    parser.add_argument("--instant", action="store_true", help="выполнять серии сразу, без реального времени")
+    args = parser.parse_args(argv)
+
+    device = PtyDevice(queue_time=args.queue_time, realtime=not args.instant)
+    print(f"Устройство: {device.path}")
+    try:
+        while True:
+            time.sleep(1.0)
+            print(device.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.close()
+
+
+if __name__ == "__main__":
+    main()
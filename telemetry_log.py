@@ -0,0 +1,246 @@
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: чтение через struct
+    np = None
+
+from motor_engine import MICROSTEPS, MotionSnapshot
+
+
+# Формат журнала: заголовок и записи фиксированного размера (little-endian)
+MAGIC = b"DVTL"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHQ")  # сигнатура, версия, размер записи, резерв
+# время (с), позиция (микрошаги), скорость (шаг/с), направление, микрошагов за шаг
+RECORD = struct.Struct("<dqfbB2x")
+
+if np is not None:
+    RECORD_DTYPE = np.dtype({
+        "names": ["time", "position", "speed", "direction", "pulse"],
+        "formats": ["<f8", "<i8", "<f4", "i1", "u1"],
+        "offsets": [0, 8, 16, 20, 21],
+        "itemsize": RECORD.size,
+    })
+else:
+    RECORD_DTYPE = None
+
+FIELDS = ("time", "position", "speed", "direction", "pulse")
+
+
+class StepRecorder:
+    # Запись телеметрии в журнал только на добавление. Записи упаковываются
+    # в буфер в потоке двигателя и сбрасываются на диск крупными блоками.
+
+    def __init__(self, path, chunk_records=4096):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size, 0))
+        self._chunk = bytearray(RECORD.size * chunk_records)
+        self._offset = 0
+        self._lock = threading.Lock()
+        self.engines = []
+        self.records = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def attach(self, engine, now=None):
+        # Подписка на шаги двигателя; первая запись - текущее состояние.
+        # now - момент начала записи по часам планировщика (time.perf_counter
+        # для потока реального времени, engine.virtual_clock для simulate).
+        self.engines.append(engine)
+        engine.add_listener(self.on_step)
+        snapshot = engine.snapshot
+        if now is not None:
+            snapshot = snapshot._replace(time=now)
+        self.record(snapshot)
+
+    def detach(self, engine):
+        engine.remove_listener(self.on_step)
+        if engine in self.engines:
+            self.engines.remove(engine)
+
+    def on_step(self, engine):
+        # Вызывается в потоке двигателя после каждой пачки шагов
+        self.record(engine.snapshot)
+
+    def record(self, snapshot):
+        rate = snapshot.rate
+        if rate > 0:
+            direction = 1
+        elif rate < 0:
+            direction = -1
+        else:
+            direction = snapshot.direction
+        with self._lock:
+            if self.closed:
+                return
+            RECORD.pack_into(self._chunk, self._offset, snapshot.time, snapshot.position_micro,
+                             abs(rate), direction, int(snapshot.step_mode * MICROSTEPS))
+            self._offset += RECORD.size
+            self.records += 1
+            if self._offset == len(self._chunk):
+                self._flush()
+
+    def _flush(self):
+        if self._offset:
+            self._file.write(memoryview(self._chunk)[:self._offset])
+            self._offset = 0
+
+    def flush(self):
+        with self._lock:
+            if not self.closed:
+                self._flush()
+                self._file.flush()
+
+    def close(self):
+        for engine in list(self.engines):
+            self.detach(engine)
+        with self._lock:
+            if self.closed:
+                return
+            self._flush()
+            self._file.close()
+            self.closed = True
+
+
+class _Column:
+    # Столбец журнала как последовательность (для bisect без NumPy)
+
+    def __init__(self, view, index):
+        self._view = view
+        self._index = index
+        self._count = len(view) // RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return RECORD.unpack_from(self._view, i * RECORD.size)[self._index]
+
+
+class StepLog:
+    # Чтение журнала через mmap без копирования. При наличии NumPy записи
+    # доступны как структурированный массив records.
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f"{path}: файл слишком короткий для журнала")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, version, record_size, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{path}: неподдерживаемый формат журнала")
+
+        # Недописанная последняя запись (например, после сбоя) отбрасывается
+        self.count = (size - HEADER.size) // RECORD.size
+        self._view = memoryview(self._mmap)[HEADER.size:HEADER.size + self.count * RECORD.size]
+        if np is not None:
+            self.records = np.frombuffer(self._view, dtype=RECORD_DTYPE)
+        else:
+            self.records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        # Запись как кортеж (time, position, speed, direction, pulse)
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return RECORD.unpack_from(self._view, index * RECORD.size)
+
+    def __iter__(self):
+        return RECORD.iter_unpack(self._view)
+
+    def column(self, name):
+        if self.records is not None:
+            return self.records[name]
+        return _Column(self._view, FIELDS.index(name))
+
+    def close(self):
+        # Если снаружи остались массивы, ссылающиеся на буфер, отображение
+        # освободится сборщиком мусора вместе с ними
+        self.records = None
+        view = getattr(self, "_view", None)
+        self._view = None
+        mapping = getattr(self, "_mmap", None)
+        self._mmap = None
+        try:
+            if view is not None:
+                view.release()
+            if mapping is not None:
+                mapping.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+
+class LogReplayer:
+    # Воспроизведение журнала в реальном или ускоренном времени: по моменту
+    # часов возвращает снимок состояния из ближайшей предыдущей записи
+
+    def __init__(self, log, speed=1.0):
+        if not len(log):
+            raise ValueError("Журнал пуст")
+        if speed <= 0:
+            raise ValueError("Скорость воспроизведения должна быть положительной")
+        self.log = log
+        self.speed = speed
+        self._times = log.column("time")
+        self.first_time = float(self._times[0])
+        self.duration = float(self._times[-1]) - self.first_time
+        self.start_time = None
+
+    def start(self, now):
+        self.start_time = now
+
+    def log_time(self, now):
+        return self.first_time + (now - self.start_time) * self.speed
+
+    def finished(self, now):
+        return (now - self.start_time) * self.speed >= self.duration
+
+    def index_at(self, now):
+        times = self._times
+        if np is not None and isinstance(times, np.ndarray):
+            # Поиск в массиве без перевода элементов в объекты Python
+            index = int(times.searchsorted(self.log_time(now), side="right"))
+        else:
+            index = bisect_right(times, self.log_time(now))
+        return max(0, index - 1)
+
+    def snapshot_at(self, now):
+        index = self.index_at(now)
+        log_time, position, speed, direction, pulse = self.log[index]
+        return MotionSnapshot(index, position, position, not self.finished(now), False,
+                              speed, direction, pulse / MICROSTEPS, index,
+                              speed * direction, log_time)
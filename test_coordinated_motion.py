@@ -0,0 +1,59 @@
+import pytest
+
+import coordinated_motion
+from coordinated_motion import follower_profile
+from motion_planner import plan_move
+
+MASTERS = [(1, "trapezoid"), (7, "trapezoid"), (1000, "trapezoid"), (999, "scurve")]
+
+
+def dda_times(master, count):
+    # Эталон: позиция ведомой оси после i-го шага ведущей - round(i * D / N)
+    # с округлением половины вверх; шаг ведомой - там, где позиция выросла
+    total = master.steps
+    times = []
+    position = 0
+    for index, time in enumerate(master.times, 1):
+        new = (2 * index * count + total) // (2 * total)
+        times += [time] * (new - position)
+        position = new
+    return times
+
+
+@pytest.mark.parametrize("total, kind", MASTERS)
+def test_follower_counts_and_endpoints(total, kind):
+    master = plan_move(total, 1000, 5000, kind=kind)
+    for steps in sorted({0, 1, -1, total // 3, -(total // 2), total - 1, total}):
+        follower = follower_profile(master, steps)
+        count = abs(steps)
+        assert follower.steps == count
+        assert follower.direction == (1 if steps >= 0 else -1)
+        # Отрезок ведомой оси заканчивается вместе с ведущей
+        assert follower.duration == master.duration
+        times = list(follower.times)
+        assert times == dda_times(master, count)
+        assert all(b > a for a, b in zip(times, times[1:]))
+        if count:
+            assert times[-1] <= master.times[-1]
+
+
+def test_full_count_shares_master_table():
+    master = plan_move(200, 1000, 5000)
+    assert follower_profile(master, 200) is master
+    back = follower_profile(master, -200)
+    assert back.times is master.times and back.direction == -1
+
+
+@pytest.mark.skipif(coordinated_motion.np is None, reason="нужен NumPy")
+def test_numpy_matches_pure_python(monkeypatch):
+    master = plan_move(3001, 2000, 8000, kind="scurve")
+    vector = [list(follower_profile(master, steps).times) for steps in (1, 17, -1500, 3000)]
+    monkeypatch.setattr(coordinated_motion, "np", None)
+    scalar = [list(follower_profile(master, steps).times) for steps in (1, 17, -1500, 3000)]
+    assert vector == scalar
+
+
+def test_follower_cannot_outrun_master():
+    master = plan_move(10, 100, 100)
+    with pytest.raises(ValueError):
+        follower_profile(master, -11)
@@ -0,0 +1,67 @@
+import pytest
+
+from job_runner import JobStep, parse_gcode, parse_jsonl, read_job
+
+
+def numbered(text):
+    # Строки в формате iter_lines: (номер, смещение конца строки, текст)
+    offset = 0
+    for number, line in enumerate(text.splitlines(True), 1):
+        offset += len(line.encode("utf-8"))
+        yield number, offset, line
+
+
+def test_gcode_moves_feed_and_modes():
+    text = ("G90\n"
+            "G0 X10 ; ускоренное\n"
+            "G1 X20 F600 (подача 10 шаг/с)\n"
+            "G91\n"
+            "G1 X-5\n"
+            "M3\n"
+            "\n")
+    steps = list(parse_gcode(numbered(text)))
+    assert [(step.value, step.relative, step.speed) for step in steps] == [
+        (10.0, False, None),
+        (20.0, False, 10.0),
+        (-5.0, True, 10.0),
+    ]
+    assert [step.line for step in steps] == [2, 3, 5]
+    assert steps[-1].offset == len(text[:text.index("M3")].encode("utf-8"))
+
+
+def test_gcode_dwell_units():
+    steps = list(parse_gcode(numbered("G4 P250\nG4 S2\n")))
+    assert steps == [JobStep(1, 8, None, False, None, 0.25),
+                     JobStep(2, 14, None, False, None, 2.0)]
+
+
+@pytest.mark.parametrize("text", ["G2 X10\n", "G1 Xabc\n", "G1 X\n"])
+def test_gcode_errors_name_the_line(text):
+    with pytest.raises(ValueError, match="Строка 2"):
+        list(parse_gcode(numbered("G90\n" + text)))
+
+
+def test_jsonl_records():
+    text = ('{"x": 100, "speed": 500}\n'
+            '\n'
+            '{"dx": -20}\n'
+            '{"dwell": 0.5}\n'
+            '{"x": 0, "speed": 50}\n')
+    steps = list(parse_jsonl(numbered(text)))
+    assert [(step.value, step.relative, step.speed, step.dwell) for step in steps] == [
+        (100, False, 500, 0.0),
+        (-20, True, 500, 0.0),
+        (None, False, 500, 0.5),
+        (0, False, 50, 0.0),
+    ]
+    with pytest.raises(ValueError, match="Строка 1"):
+        list(parse_jsonl(numbered("{x: 1}\n")))
+
+
+def test_read_job_picks_format(tmp_path):
+    gcode = tmp_path / "part.gcode"
+    gcode.write_text("G1 X5\n", encoding="utf-8")
+    jsonl = tmp_path / "part.jsonl"
+    jsonl.write_text('{"x": 5}\n', encoding="utf-8")
+    assert [step.value for step in read_job(str(gcode))] == [5.0]
+    assert [step.value for step in read_job(str(jsonl))] == [5]
@@ -0,0 +1,102 @@
+import pytest
+
+import motion_planner
+from motion_planner import ProfileCache, plan_move
+
+CASES = [
+    # шагов, скорость, ускорение, тип
+    (1, 100, 1000, "trapezoid"),
+    (37, 500, 2000, "trapezoid"),
+    (2000, 1000, 5000, "trapezoid"),
+    (2000, 1000, 5000, "scurve"),
+    (30, 1000, 500, "scurve"),
+    (50000, 3000, 800, "scurve"),
+]
+
+
+def check_table(profile, steps, max_speed):
+    times = list(profile.times)
+    intervals = list(profile.intervals)
+    assert profile.steps == len(times) == steps
+    assert times[0] > 0
+    assert all(b > a for a, b in zip(times, times[1:]))
+    assert profile.duration == times[-1]
+    # Интервал не короче 1 / max_speed (с допуском на округление)
+    assert min(intervals) >= (1 - 1e-9) / max_speed
+    assert profile.peak_speed <= max_speed * (1 + 1e-9)
+
+
+@pytest.mark.parametrize("steps, max_speed, acceleration, kind", CASES)
+def test_tables_monotonic_without_overspeed(steps, max_speed, acceleration, kind):
+    check_table(plan_move(steps, max_speed, acceleration, kind=kind), steps, max_speed)
+    reverse = plan_move(-steps, max_speed, acceleration, kind=kind)
+    assert reverse.direction == -1
+    check_table(reverse, steps, max_speed)
+
+
+def test_trapezoid_boundary_speeds():
+    profile = plan_move(500, 1000, 4000, start_speed=300, end_speed=200)
+    check_table(profile, 500, 1000)
+    assert profile.start_speed == 300 and profile.end_speed == 200
+    # Недостижимая на короткой дистанции скорость выхода ограничивается
+    short = plan_move(3, 1000, 100, end_speed=900)
+    assert short.end_speed < 900
+
+
+@pytest.mark.skipif(motion_planner.np is None, reason="нужен NumPy")
+@pytest.mark.parametrize("steps, max_speed, acceleration, kind", CASES)
+def test_numpy_matches_pure_python(monkeypatch, steps, max_speed, acceleration, kind):
+    vector = plan_move(steps, max_speed, acceleration, kind=kind)
+    monkeypatch.setattr(motion_planner, "np", None)
+    scalar = plan_move(steps, max_speed, acceleration, kind=kind)
+    assert vector.peak_speed == pytest.approx(scalar.peak_speed)
+    assert list(vector.times) == pytest.approx(list(scalar.times), abs=1e-12)
+    assert list(vector.intervals) == pytest.approx(list(scalar.intervals), abs=1e-12)
+
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        plan_move(10, 100, 100, kind="cubic")
+    with pytest.raises(ValueError):
+        plan_move(10, 0, 100)
+    assert plan_move(0, 100, 100).steps == 0
+
+
+def test_cache_hit_and_miss():
+    cache = ProfileCache()
+    first = cache.plan(100, 500, 2000)
+    assert (cache.hits, cache.misses) == (0, 1)
+    # Обратное направление - та же таблица
+    back = cache.plan(-100, 500, 2000)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert back.times is first.times and back.direction == -1
+    # Другие параметры - новый расчет
+    cache.plan(100, 500, 2000, kind="scurve")
+    cache.plan(100, 500, 2000, end_speed=100)
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert len(cache) == 3
+
+
+def test_cache_lru_eviction():
+    cache = ProfileCache(max_entries=2)
+    cache.plan(10, 100, 100)
+    cache.plan(20, 100, 100)
+    cache.plan(10, 100, 100)  # 10 становится самым свежим
+    cache.plan(30, 100, 100)  # вытесняется 20
+    assert cache.evictions == 1 and len(cache) == 2
+    hits = cache.hits
+    cache.plan(10, 100, 100)
+    assert cache.hits == hits + 1
+    cache.plan(20, 100, 100)
+    assert cache.hits == hits + 1 and cache.evictions == 2
+
+
+def test_cache_byte_limit():
+    single = plan_move(1000, 100, 100).nbytes
+    cache = ProfileCache(max_bytes=single * 2)
+    for distance in (1000, 1001, 1002):
+        cache.plan(distance, 100, 100)
+    assert cache.bytes <= cache.max_bytes and len(cache) == 1 and cache.evictions == 2
+    # Профиль больше всего кэша не сохраняется
+    cache.plan(5000, 100, 100)
+    assert cache.bytes <= cache.max_bytes
@@ -0,0 +1,67 @@
+import math
+
+import pytest
+
+from motor_history import PositionHistory
+
+
+def reference(samples, start, end, width):
+    # Прямой расчет min/max по столбцам из всех отсчетов. Отсчет перед start
+    # (корзина, начавшаяся до интервала) попадает в первый столбец.
+    scale = width / (end - start)
+    before = [time for time, _ in samples if time < start]
+    result = {}
+    for time, value in samples:
+        if (time >= start or before and time == before[-1]) and time < end:
+            x = max(0, min(width - 1, int((time - start) * scale)))
+            low, high = result.get(x, (value, value))
+            result[x] = (min(low, value), max(high, value))
+    return [(x, low, high) for x, (low, high) in sorted(result.items())]
+
+
+def test_columns_exact_on_samples():
+    history = PositionHistory(fanout=4, levels=3)
+    samples = [(index * 0.01, math.sin(index * 0.3) * 100) for index in range(200)]
+    for time, value in samples:
+        history.append(time, value)
+    # На 200 отсчетов и 100 столбцов хватает уровня отсчетов - ответ точный
+    assert history.columns(0.0, 2.0, 100) == reference(samples, 0.0, 2.0, 100)
+    assert history.columns(0.505, 1.0, 40) == reference(samples, 0.505, 1.0, 40)
+    assert history.columns(1.0, 1.0, 10) == []
+
+
+def test_columns_min_max_on_coarse_levels():
+    history = PositionHistory(fanout=4, levels=5)
+    samples = [(index * 0.001, (index * 37) % 1000 - 500) for index in range(50000)]
+    for time, value in samples:
+        history.append(time, value)
+    columns = history.columns(0.0, 50.0, 64)
+    # Обрабатываются корзины крупного уровня, но общий размах не теряется
+    assert len(columns) <= 64
+    assert [x for x, _, _ in columns] == sorted({x for x, _, _ in columns})
+    assert all(0 <= x < 64 and low <= high for x, low, high in columns)
+    assert min(low for _, low, _ in columns) == -500
+    assert max(high for _, _, high in columns) == 499
+
+
+def test_max_age_expiry():
+    history = PositionHistory(capacity=100000, fanout=4, levels=4, max_age=5.0)
+    for index in range(20000):
+        history.append(index * 0.01, index)
+    last = history.last_time
+    assert history.first_time() == pytest.approx(last - 5.0)
+    # Удаление раз в 64 отсчета: отсчетов старше срока не больше одной пачки
+    samples = history.levels[0]
+    assert samples.times[0] >= last - 5.0 - 64 * 0.01
+    assert len(samples.times) <= 5.0 / 0.01 + 64
+    columns = history.columns(0.0, last, 100)
+    assert min(low for _, low, _ in columns) >= (last - 5.0 - 64 * 0.01) / 0.01 - 4 ** 3
+
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        PositionHistory(max_age=0)
+    with pytest.raises(ValueError):
+        PositionHistory(fanout=1)
+    with pytest.raises(IndexError):
+        PositionHistory().last()
@@ -0,0 +1,71 @@
+from job_runner import JobRunner, parse_gcode
+from motor_engine import StepperEngine
+
+
+def run_chunks(engine, total, chunk):
+    # Симуляция до момента total частями по chunk виртуальных секунд
+    steps = 0
+    while engine.virtual_clock < total:
+        steps += engine.simulate(duration=min(chunk, total - engine.virtual_clock))["steps"]
+    return steps
+
+
+def test_move_chunked_matches_single_call():
+    results = []
+    for chunk in (100, 0.1, 0.013):
+        engine = StepperEngine(speed=100)
+        engine.submit("set_acceleration", 1e9)
+        engine.submit("move_to", 1000)
+        steps = 0
+        while engine.motor_running:
+            steps += engine.simulate(duration=chunk)["steps"]
+        end = engine.snapshot.time
+        results.append((steps, end, engine.current_position))
+    for steps, end, position in results:
+        assert steps == results[0][0] == 1000
+        assert abs(end - results[0][1]) < 1e-9
+        assert position == 1000
+
+
+def test_continuous_chunked_matches_single_call():
+    counts = []
+    for chunk in (100, 0.1, 0.013):
+        engine = StepperEngine(speed=100)
+        engine.submit("start")
+        counts.append(run_chunks(engine, 10.005, chunk))
+    assert counts == [1000, 1000, 1000]
+
+
+def test_dwell_survives_chunks():
+    # Пауза перед отрезком отсчитывается по тем же часам, что и шаги
+    engine = StepperEngine(speed=100)
+    engine.submit("set_acceleration", 1e9)
+    profile = engine.profile_cache.plan(10, 100, 1e9)
+    engine.submit("queue_move", profile, 10, 5.0)
+    while engine.motor_running:
+        engine.simulate(duration=0.013)
+    assert abs(engine.snapshot.time - (5.0 + profile.duration)) < 1e-9
+
+
+def test_job_duration_matches_plan():
+    # Длительность задания в виртуальном времени - сумма длительностей
+    # переданных ядру профилей и пауз, в том числе пауз без перемещения
+    text = "G4 S5\nG1 X100\nG4 S1\nG1 X100\nG1 X0 F3000\nG4 P500\n"
+    lines = []
+    offset = 0
+    for number, line in enumerate(text.splitlines(True), 1):
+        offset += len(line)
+        lines.append((number, offset, line))
+
+    engine = StepperEngine(speed=100)
+    planned = []
+
+    def submit(name, *args):
+        if name == "queue_move":
+            planned.append(args[0].duration + args[2])
+        return engine.submit(name, *args)
+
+    progress = JobRunner(engine, parse_gcode(iter(lines)), submit=submit).simulate()
+    assert progress["done"] and progress["error"] is None
+    assert engine.current_position == 0
+    assert abs(engine.snapshot.time - sum(planned)) < 1e-9
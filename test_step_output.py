@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+import tty
+
+from step_output import (MAX_RECORDS, MAX_RUN_STEPS, ByteRing, FrameDecoder, PtyDevice,
+                         SerialBackend, encode_frame)
+
+
+def test_frame_round_trip_in_pieces():
+    frames = [encode_frame(1, 7, [5, 1000, -3, 600]),
+              encode_frame(1, 8, [0, 250000]),
+              encode_frame(2, 255, [MAX_RUN_STEPS, 0xFFFFFFFF])]
+    data = b"".join(frames)
+    decoder = FrameDecoder()
+    decoded = []
+    # Поток приходит кусками произвольной длины
+    for start in range(0, len(data), 5):
+        decoded += decoder.feed(data[start:start + 5])
+    assert decoded == [(1, 7, [(5, 1000), (-3, 600)]),
+                       (1, 8, [(0, 250000)]),
+                       (2, 255, [(MAX_RUN_STEPS, 0xFFFFFFFF)])]
+    assert decoder.crc_errors == 0
+
+
+def test_crc_error_skips_to_next_frame():
+    bad = bytearray(encode_frame(0, 1, [10, 100]))
+    bad[-3] ^= 0x40
+    good = encode_frame(0, 2, [20, 200])
+    decoder = FrameDecoder()
+    assert decoder.feed(b"\x00\x01" + bytes(bad) + good) == [(0, 2, [(20, 200)])]
+    assert decoder.crc_errors >= 1
+
+
+def test_byte_ring_whole_frames():
+    ring = ByteRing(10)
+    assert ring.write(b"abcdef")
+    assert not ring.write(b"ghijk")  # не помещается целиком
+    assert ring.read(4) == b"abcd"
+    assert ring.write(b"ghijkl")  # запись через границу кольца
+    assert ring.read(100) == b"efghijkl"
+    assert len(ring) == 0
+
+
+def open_link():
+    # Псевдотерминал: backend пишет в подчиненную сторону, тест читает кадры
+    master, slave = os.openpty()
+    tty.setraw(master)
+    frames = []
+    decoder = FrameDecoder()
+
+    def read():
+        while True:
+            try:
+                data = os.read(master, 1 << 16)
+            except OSError:
+                return
+            if not data:
+                return
+            frames.extend(decoder.feed(data))
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    return master, os.ttyname(slave), slave, frames, decoder
+
+
+def received(frames):
+    return sum(abs(steps) for _, _, runs in frames for steps, _ in runs)
+
+
+def test_runs_split_at_frame_limits():
+    master, path, slave, frames, decoder = open_link()
+    backend = SerialBackend(path, blocking=True)
+    when = 1000.0
+    written = 0
+    # Одна большая пачка, затем много пачек со сменой направления:
+    # серии делятся до MAX_RUN_STEPS, кадры - до MAX_RECORDS записей
+    backend.steps(1, 3 * MAX_RUN_STEPS + 5, when, 0.0001)
+    written += 3 * MAX_RUN_STEPS + 5
+    for index in range(2 * MAX_RECORDS):
+        when += 0.002
+        backend.steps(1 if index % 2 else -1, 2, when, 0.001)
+        written += 2
+    # Шаги со сдвигом часов назад (переход на другие часы)
+    backend.steps(1, 10, 5.0, 0.001)
+    written += 10
+    backend.close()
+    deadline = time.perf_counter() + 2
+    while time.perf_counter() < deadline and received(frames) < written:
+        time.sleep(0.01)
+    os.close(master)
+    os.close(slave)
+
+    runs = [run for _, _, frame_runs in frames for run in frame_runs]
+    assert decoder.crc_errors == 0
+    assert backend.steps_written == written
+    assert sum(abs(steps) for steps, _ in runs) == written
+    assert all(abs(steps) <= MAX_RUN_STEPS and ticks >= 0 for steps, ticks in runs)
+    assert all(len(frame_runs) <= MAX_RECORDS for _, _, frame_runs in frames)
+    assert [seq for _, seq, _ in frames] == list(range(len(frames)))
+
+
+def test_device_receives_all_steps():
+    device = PtyDevice(realtime=False)
+    backend = SerialBackend(device.path, axis=3, blocking=True)
+    when = 10.0
+    for _ in range(100):
+        when += 0.01
+        backend.steps(1, 10, when, 0.001)
+    backend.steps(-1, 40, when + 0.05, 0.001)
+    backend.close()
+    assert device.wait_idle()
+    deadline = time.perf_counter() + 2
+    while device.stats()["positions"].get(3) != 960 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    stats = device.stats()
+    device.close()
+    assert stats["positions"] == {3: 960}
+    assert stats["crc_errors"] == 0 and stats["lost_frames"] == 0